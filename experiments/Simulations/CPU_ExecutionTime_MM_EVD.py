@@ -1,11 +1,13 @@
 import numpy as np
-import time
 import matplotlib.pyplot as plt
 import pandas as pd
 from scipy.optimize import curve_fit
 from sympy import symbols, lambdify
 from sklearn.metrics import mean_squared_error
 
+import benchmark_harness
+import jacobi_engines
+
 def linear_function(x, a, b):
     """
     Calculate the value of a linear function.
@@ -169,55 +171,37 @@ def matrix_multiplication(A, B):
     """
     return np.dot(A, B)
 
-def classical_jacobian(A, tol=1e-6, max_iter=100):
+def classical_jacobian(A, tol=1e-12, max_iter=None, cache=None):
     """
     Performs the Classical Jacobi method for eigenvalue decomposition.
 
     This function iteratively applies the Jacobi rotation to a symmetric matrix
     to find its eigenvalues and eigenvectors. The process continues until the 
-    off-diagonal elements are below a specified tolerance or a maximum number 
-    of iterations is reached.
+    off-diagonal Frobenius norm relative to the norm of A is below a specified
+    tolerance, or a maximum number of rotations is reached when one is given.
+    The pivot search and the rotations are delegated to
+    jacobi_engines.classical_jacobi, which caches the largest off-diagonal element
+    of every row and rotates two rows and columns in place instead of forming J.
 
     Parameters:
         A (np.ndarray): A symmetric matrix for which eigenvalues and eigenvectors 
                         are to be computed.
-        tol (float, optional): The tolerance level for convergence. Defaults to 1e-6.
-        max_iter (int, optional): The maximum number of iterations allowed. Defaults to 100.
+        tol (float, optional): The relative off-diagonal norm for convergence. Defaults to 1e-12.
+        max_iter (int, optional): The maximum number of rotations allowed. Defaults to no limit.
+        cache (eigen_cache.EigenCache, optional): Results are looked up by the content of A and
+                                                  stored there; a hit returns read-only arrays.
 
     Returns:
         np.ndarray: A 1D array containing the eigenvalues of the matrix.
         np.ndarray: A matrix whose columns are the normalized eigenvectors 
                     corresponding to the eigenvalues.
     """
-    n = A.shape[0]
-    V = np.eye(n)
-    for _ in range(max_iter):
-        max_val = 0
-        p, q = 0, 1
-        for i in range(n):
-            for j in range(i + 1, n):
-                if abs(A[i, j]) > max_val:
-                    max_val = abs(A[i, j])
-                    p, q = i, j
-        
-        if max_val < tol:
-            break
-        
-        phi = 0.5 * np.arctan2(2 * A[p, q], A[q, q] - A[p, p])
-        c, s = np.cos(phi), np.sin(phi)
-        
-        J = np.eye(n)
-        J[p, p] = c
-        J[q, q] = c
-        J[p, q] = s
-        J[q, p] = -s
-        
-        A = J.T @ A @ J
-        V = V @ J
-    
-    return np.diag(A), V
+    if cache is not None:
+        key = cache.key(A, 'classical_jacobi', tol, max_iter)
+        return cache.get_or_compute(key, lambda: jacobi_engines.classical_jacobi(A, tol=tol, max_iter=max_iter))
+    return jacobi_engines.classical_jacobi(A, tol=tol, max_iter=max_iter)
 
-def benchmark(matrix_sizes):
+def benchmark(matrix_sizes, data=None):
     """
     Benchmarks the execution time of matrix operations for varying matrix sizes.
 
@@ -229,34 +213,24 @@ def benchmark(matrix_sizes):
     Parameters:
         matrix_sizes (list of int): A list of integers representing the sizes of 
                                     the matrices to be tested.
+        data (str, optional): Feature file (.npy, Arrow, Parquet) the operands are taken from,
+                              see benchmark_harness.make_operands. Defaults to random matrices.
 
     Returns:
         pd.DataFrame: A DataFrame containing the matrix size, time taken for matrix 
                     multiplication, time taken for the Jacobi method, and the 
                     total execution time for each matrix size.
+
+    The timings are medians over repeated runs after a warm-up, measured by benchmark_harness,
+    and the CSV file holds the harness records.
     """
-    results = []
-    
-    for size in matrix_sizes:
-        A = np.random.rand(size, size)
-        B = np.random.rand(size, size)
-        
-        start = time.time()
-        _ = matrix_multiplication(A, B)
-        end = time.time()
-        time_mm = end - start
-        
-        #A_symm = 0.5 * (A + A.T)  # Make A symmetric for Jacobi
-        start = time.time()
-        __ = classical_jacobian(_)
-        end = time.time()
-        time_jacobi = end - start
-        
-        total_time = time_mm + time_jacobi
-        results.append([size, time_mm, time_jacobi, total_time])
+    records = benchmark_harness.run(['numpy'], ['matmul', 'jacobi'], matrix_sizes, dtype='float64', data=data)
+    benchmark_harness.write_records(records, 'AMD_SimResults.csv')
+    medians = {(record['op'], record['size']): record['median_s'] for record in records}
+    results = [[size, medians['matmul', size], medians['jacobi', size], medians['matmul', size] + medians['jacobi', size]]
+               for size in matrix_sizes]
     
     df = pd.DataFrame(results, columns=['Matrix Size', 'Matrix Multiplication Time', 'Jacobian Time', 'Total Execution Time'])
-    df.to_csv("AMD_SimResults.csv", header=True, index=True)
     return df
 
 def plot_results(df):
@@ -1,9 +1,10 @@
 import cupy as cp
-import time
 import pandas as pd
 import scipy.optimize as opt
 import matplotlib.pyplot as plt
 
+import benchmark_harness
+
 def matrix_multiplication(A, B):
     """
     Perform matrix multiplication using CuPy.
@@ -17,15 +18,17 @@ def matrix_multiplication(A, B):
     """
     return cp.dot(A, B)
 
-def classical_jacobi(A, max_iterations=100, tol=1e-10):
+def classical_jacobi(A, max_iterations=None, tol=1e-10):
     """
     Performs the Classical Jacobi algorithm to compute the eigenvalues and eigenvectors
     of a symmetric matrix.
 
     Parameters:
         A (cp.ndarray): A symmetric matrix for which to compute eigenvalues and eigenvectors.
-        max_iterations (int, optional): The maximum number of iterations to perform. Default is 100.
-        tol (float, optional): The tolerance level for convergence. Default is 1e-10.
+        max_iterations (int, optional): The maximum number of rotations. Default is 50 n^2, a safety
+                                        cap well above the few n^2 rotations convergence takes.
+        tol (float, optional): The off-diagonal Frobenius norm relative to the norm of A at
+                               which the iteration stops. Default is 1e-10.
 
     Returns:
         tuple: A tuple containing:
@@ -33,34 +36,43 @@ def classical_jacobi(A, max_iterations=100, tol=1e-10):
             - cp.ndarray: A matrix whose columns are the corresponding eigenvectors.
     """
     n = A.shape[0]
+    if max_iterations is None:
+        max_iterations = 50 * n * n
+    # the rotations update A in place
+    A = A.copy()
     V = cp.eye(n, dtype=A.dtype)
-    for _ in range(max_iterations):
-        max_val = 0.0
-        p, q = -1, -1
-        for i in range(n):
-            for j in range(i + 1, n):
-                if cp.abs(A[i, j]) > max_val:
-                    max_val = cp.abs(A[i, j])
-                    p, q = i, j
-        if max_val < tol:
+    rows, cols = cp.triu_indices(n, k=1)
+    scale = cp.linalg.norm(A)
+    # below n * eps the rounding error of the rotations stalls the off-diagonal norm
+    tol = max(tol, n * cp.finfo(A.dtype).eps)
+    iteration = 0
+    while iteration < max_iterations:
+        upper = A[rows, cols]
+        # the off-diagonal norm counts both triangles
+        if cp.sqrt(2 * cp.sum(upper * upper)) <= tol * scale:
             break
+        index = int(cp.argmax(cp.abs(upper)))
+        p, q = int(rows[index]), int(cols[index])
+        iteration += 1
         
         theta = 0.5 * cp.arctan2(2 * A[p, q], A[q, q] - A[p, p])
-        cos_t = cp.cos(theta)
-        sin_t = cp.sin(theta)
-        
-        J = cp.eye(n, dtype=A.dtype)
-        J[p, p] = cos_t
-        J[q, q] = cos_t
-        J[p, q] = -sin_t
-        J[q, p] = sin_t
-        
-        A = J.T @ A @ J
-        V = V @ J
+        c, s = cp.cos(theta), cp.sin(theta)
+
+        # J.T @ A @ J and V @ J for J[p, p] = J[q, q] = c, J[p, q] = s, J[q, p] = -s,
+        # applied to the two rows and columns the rotation changes
+        row_p = A[p, :].copy()
+        A[p, :] = c * row_p - s * A[q, :]
+        A[q, :] = s * row_p + c * A[q, :]
+        col_p = A[:, p].copy()
+        A[:, p] = c * col_p - s * A[:, q]
+        A[:, q] = s * col_p + c * A[:, q]
+        col_p = V[:, p].copy()
+        V[:, p] = c * col_p - s * V[:, q]
+        V[:, q] = s * col_p + c * V[:, q]
     
     return cp.diag(A), V
 
-def benchmark(matrix_sizes):
+def benchmark(matrix_sizes, data=None):
     """
     Benchmark the execution time of matrix multiplication and the Classical Jacobi algorithm
     for different matrix sizes using CuPy.
@@ -68,29 +80,23 @@ def benchmark(matrix_sizes):
     Parameters:
         matrix_sizes (list of int): A list of integers representing the sizes of the matrices
         to be tested.
+        data (str, optional): Feature file (.npy, Arrow, Parquet) the operands are taken from,
+                              see benchmark_harness.make_operands. Defaults to random matrices.
 
     Returns:
         pd.DataFrame: A DataFrame containing the matrix size, multiplication time, and Jacobi
         time for each tested size. The results are also saved to a CSV file named
         'GPU_SimResults.csv'.
+
+    The timings are medians over repeated runs after a warm-up, measured by benchmark_harness,
+    and the CSV file holds the harness records.
     """
-    results = []
-    for size in matrix_sizes:
-        A = cp.random.rand(size, size, dtype=cp.float32)
-        B = cp.random.rand(size, size, dtype=cp.float32)
-        
-        start = time.time()
-        C = matrix_multiplication(A, B)
-        multiplication_time = time.time() - start
-        
-        start = time.time()
-        eigenvalues, eigenvectors = classical_jacobi(C)
-        jacobi_time = time.time() - start
-        
-        results.append([size, multiplication_time, jacobi_time])
+    records = benchmark_harness.run(['cupy'], ['matmul', 'jacobi'], matrix_sizes, data=data)
+    benchmark_harness.write_records(records, 'GPU_SimResults.csv')
+    medians = {(record['op'], record['size']): record['median_s'] for record in records}
+    results = [[size, medians['matmul', size], medians['jacobi', size]] for size in matrix_sizes]
     
     df = pd.DataFrame(results, columns=["Matrix Size", "Multiplication Time (s)", "Jacobi Time (s)"])
-    df.to_csv("GPU_SimResults.csv", index=False)
     return df
 
 def fit_curve(x, y):
@@ -1,9 +1,10 @@
 import torch
-import time
 import pandas as pd
 import scipy.optimize as opt
 import matplotlib.pyplot as plt
 
+import benchmark_harness
+
 # Ensure CUDA is available
 assert torch.cuda.is_available(), "No CUDA device found! Ensure you're running on a machine with an NVIDIA GPU."
 device = torch.device("cuda")
@@ -40,15 +41,17 @@ def matrix_multiplication(A, B):
     ensure_on_gpu(B, "Matrix B")
     return torch.matmul(A, B)
 
-def classical_jacobi(A, max_iterations=100, tol=1e-10):
+def classical_jacobi(A, max_iterations=None, tol=1e-10):
     """
     Performs the Classical Jacobi method to compute the eigenvalues and eigenvectors
     of a symmetric matrix A using iterative rotations.
 
     Parameters:
         A (torch.Tensor): A symmetric matrix to decompose, expected to be on a CUDA device.
-        max_iterations (int, optional): The maximum number of iterations to perform. Default is 100.
-        tol (float, optional): The tolerance for convergence. Default is 1e-10.
+        max_iterations (int, optional): The maximum number of rotations. Default is 50 n^2, a safety
+                                        cap well above the few n^2 rotations convergence takes.
+        tol (float, optional): The off-diagonal Frobenius norm relative to the norm of A at
+                               which the iteration stops. Default is 1e-10.
 
     Returns:
         torch.Tensor: A diagonal matrix containing the eigenvalues of A.
@@ -59,34 +62,43 @@ def classical_jacobi(A, max_iterations=100, tol=1e-10):
     """
     ensure_on_gpu(A, "Matrix A")
     n = A.shape[0]
+    if max_iterations is None:
+        max_iterations = 50 * n * n
+    # the rotations update A in place
+    A = A.clone()
     V = torch.eye(n, device=device, dtype=A.dtype)
-    for _ in range(max_iterations):
-        max_val = 0.0
-        p, q = -1, -1
-        for i in range(n):
-            for j in range(i + 1, n):
-                if torch.abs(A[i, j]) > max_val:
-                    max_val = torch.abs(A[i, j])
-                    p, q = i, j
-        if max_val < tol:
+    rows, cols = torch.triu_indices(n, n, offset=1, device=device)
+    scale = torch.linalg.norm(A)
+    # below n * eps the rounding error of the rotations stalls the off-diagonal norm
+    tol = max(tol, n * torch.finfo(A.dtype).eps)
+    iteration = 0
+    while iteration < max_iterations:
+        upper = A[rows, cols]
+        # the off-diagonal norm counts both triangles
+        if torch.sqrt(2 * torch.sum(upper * upper)) <= tol * scale:
             break
+        index = int(torch.argmax(torch.abs(upper)))
+        p, q = int(rows[index]), int(cols[index])
+        iteration += 1
         
         theta = 0.5 * torch.atan2(2 * A[p, q], A[q, q] - A[p, p])
-        cos_t = torch.cos(theta)
-        sin_t = torch.sin(theta)
-        
-        J = torch.eye(n, device=device, dtype=A.dtype)
-        J[p, p] = cos_t
-        J[q, q] = cos_t
-        J[p, q] = -sin_t
-        J[q, p] = sin_t
-        
-        A = J.T @ A @ J
-        V = V @ J
+        c, s = torch.cos(theta), torch.sin(theta)
+
+        # J.T @ A @ J and V @ J for J[p, p] = J[q, q] = c, J[p, q] = s, J[q, p] = -s,
+        # applied to the two rows and columns the rotation changes
+        row_p = A[p, :].clone()
+        A[p, :] = c * row_p - s * A[q, :]
+        A[q, :] = s * row_p + c * A[q, :]
+        col_p = A[:, p].clone()
+        A[:, p] = c * col_p - s * A[:, q]
+        A[:, q] = s * col_p + c * A[:, q]
+        col_p = V[:, p].clone()
+        V[:, p] = c * col_p - s * V[:, q]
+        V[:, q] = s * col_p + c * V[:, q]
     
     return torch.diag(A), V
 
-def benchmark(matrix_sizes):
+def benchmark(matrix_sizes, data=None):
     """
     Benchmark the execution time of matrix multiplication and eigenvalue decomposition
     using the Classical Jacobi method on a CUDA device for various matrix sizes.
@@ -94,36 +106,23 @@ def benchmark(matrix_sizes):
     Parameters:
         matrix_sizes (list of int): A list of integers representing the sizes of the
         square matrices to be tested.
+        data (str, optional): Feature file (.npy, Arrow, Parquet) the operands are taken from,
+                              see benchmark_harness.make_operands. Defaults to random matrices.
 
     Returns:
         pd.DataFrame: A DataFrame containing the matrix size, time taken for matrix
         multiplication, and time taken for the Classical Jacobi method for each size.
         The results are also saved to a CSV file named 'GPU_SimResults.csv'.
+
+    The timings are medians over repeated runs after a warm-up, measured by benchmark_harness,
+    and the CSV file holds the harness records.
     """
-    results = []
-    for size in matrix_sizes:
-        A = torch.rand((size, size), device=device, dtype=torch.float32)
-        B = torch.rand((size, size), device=device, dtype=torch.float32)
-        
-        torch.cuda.synchronize()
-        start = time.time()
-        C = matrix_multiplication(A, B)
-        torch.cuda.synchronize()
-        multiplication_time = time.time() - start
-        
-        torch.cuda.synchronize()
-        start = time.time()
-        eigenvalues, eigenvectors = classical_jacobi(C)
-        torch.cuda.synchronize()
-        jacobi_time = time.time() - start
-
-        print("Matrix Multiplication Time = ", multiplication_time)
-        print("Jacobian Time = ", jacobi_time)
-        
-        results.append([size, multiplication_time, jacobi_time])
+    records = benchmark_harness.run(['torch-cuda'], ['matmul', 'jacobi'], matrix_sizes, data=data)
+    benchmark_harness.write_records(records, 'GPU_SimResults.csv')
+    medians = {(record['op'], record['size']): record['median_s'] for record in records}
+    results = [[size, medians['matmul', size], medians['jacobi', size]] for size in matrix_sizes]
     
     df = pd.DataFrame(results, columns=["Matrix Size", "Multiplication Time (s)", "Jacobi Time (s)"])
-    df.to_csv("GPU_SimResults.csv", index=False)
     return df
 
 def fit_curve(x, y):
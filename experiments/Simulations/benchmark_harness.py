@@ -0,0 +1,390 @@
+# The below code implements the benchmark harness shared by the ExecutionTime scripts
+# Backends are registered by name; every run does warm-up and repeats and writes one schema, so runs can be diffed
+
+import argparse
+import csv
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+import dataset_reader
+import fixed_point_model
+import jacobi_engines
+from streaming_covariance import StreamingCovariance
+from thread_limits import pin_threads
+
+SCHEMA_VERSION = 3
+FIELDS = ['schema_version', 'run_id', 'host', 'backend', 'backend_version', 'op', 'size', 'dtype', 'data', 'threads',
+          'max_rotations', 'warmup', 'repeats', 'median_s', 'q1_s', 'q3_s', 'iqr_s', 'min_s', 'max_s', 'mean_s']
+
+# the Jacobi ops run until the off-diagonal norm is this small relative to the matrix; a rotation
+# cap is only applied when asked for, and it is part of every record and of the comparison key
+JACOBI_TOL = 1e-10
+# the fixed-point model has no convergence test, it runs as many sweeps as fixed_point_eigh
+FIXED_POINT_SWEEPS = 4
+
+BACKENDS = {}
+
+def register_backend(cls):
+    """
+    Class decorator adding a backend to the registry under its name.
+    """
+    BACKENDS[cls.name] = cls
+    return cls
+
+class Backend:
+    """
+    Base class of the benchmark backends.
+
+    A backend converts NumPy operands to its own arrays and implements a subset of the ops:
+    'matmul' (A @ B), 'jacobi' (Classical Jacobi to JACOBI_TOL, at most max_rotations
+    rotations when set) and 'eigh' (library eigensolver).
+
+    Methods:
+        available(): Whether the backend can run on this machine.
+        version(): Version string of the library behind the backend.
+        to_device(array): Converts a NumPy array to a backend array.
+        synchronize(): Waits for queued device work to finish.
+        set_threads(n): Pins the backend to n threads.
+        ops(): Returns the supported ops as a dict of name to callable.
+    """
+    name = None
+    max_rotations = None
+
+    def available(self):
+        return True
+
+    def version(self):
+        return np.__version__
+
+    def to_device(self, array):
+        return array
+
+    def synchronize(self):
+        pass
+
+    def set_threads(self, n):
+        pass
+
+    def ops(self):
+        return {}
+
+@register_backend
+class NumpyBackend(Backend):
+    name = 'numpy'
+
+    def ops(self):
+        return {
+            'matmul': np.matmul,
+            'jacobi': lambda C: jacobi_engines.classical_jacobi(C, tol=JACOBI_TOL, max_iter=self.max_rotations),
+            'parallel_jacobi': lambda C: jacobi_engines.parallel_jacobi(C, tol=JACOBI_TOL),
+            'eigh': np.linalg.eigh,
+        }
+
+@register_backend
+class FixedPointBackend(Backend):
+    name = 'fixed-point'
+
+    def to_device(self, array):
+        fmt = fixed_point_model.Q3_5
+        return fixed_point_model.to_bits(fixed_point_model.to_fixed(array, fmt), fmt)
+
+    def ops(self):
+        def jacobi(C):
+            fmt = fixed_point_model.Q3_5
+            n = C.shape[0]
+            V = fixed_point_model.to_bits(np.eye(n, dtype=np.int64) << fmt.frac_bits, fmt)
+            for _ in range(self.max_rotations or FIXED_POINT_SWEEPS * n * (n - 1) // 2):
+                C, V = fixed_point_model.jacobi_step(C, V)
+            return C, V
+        return {'matmul': fixed_point_model.fixed_matmul, 'jacobi': jacobi}
+
+class _TorchBackend(Backend):
+    device = None
+
+    def _torch(self):
+        import torch
+        return torch
+
+    def available(self):
+        try:
+            self._torch()
+        except ImportError:
+            return False
+        return True
+
+    def version(self):
+        return self._torch().__version__
+
+    def to_device(self, array):
+        return self._torch().from_numpy(np.ascontiguousarray(array)).to(self.device)
+
+    def set_threads(self, n):
+        self._torch().set_num_threads(n)
+
+@register_backend
+class TorchCPUBackend(_TorchBackend):
+    name = 'torch-cpu'
+    device = 'cpu'
+
+    def ops(self):
+        torch = self._torch()
+        import CPU_ExecutionTime_MM_EVD_torch as script
+        return {'matmul': torch.matmul,
+                'jacobi': lambda C: script.classical_jacobi(C, max_iterations=self.max_rotations, tol=JACOBI_TOL),
+                'eigh': torch.linalg.eigh}
+
+@register_backend
+class TorchCUDABackend(_TorchBackend):
+    name = 'torch-cuda'
+    device = 'cuda'
+
+    def available(self):
+        return super().available() and self._torch().cuda.is_available()
+
+    def synchronize(self):
+        self._torch().cuda.synchronize()
+
+    def ops(self):
+        torch = self._torch()
+        import GPU_ExecutionTime_MM_EVD_torch as script
+        return {'matmul': torch.matmul,
+                'jacobi': lambda C: script.classical_jacobi(C, max_iterations=self.max_rotations, tol=JACOBI_TOL),
+                'eigh': torch.linalg.eigh}
+
+@register_backend
+class CupyBackend(Backend):
+    name = 'cupy'
+
+    def available(self):
+        try:
+            import cupy
+            return cupy.cuda.runtime.getDeviceCount() > 0
+        except Exception:
+            return False
+
+    def version(self):
+        import cupy
+        return cupy.__version__
+
+    def to_device(self, array):
+        import cupy
+        return cupy.asarray(array)
+
+    def synchronize(self):
+        import cupy
+        cupy.cuda.Device().synchronize()
+
+    def ops(self):
+        import cupy
+        import GPU_ExecutionTime_MM_EVD as script
+        return {'matmul': cupy.matmul,
+                'jacobi': lambda C: script.classical_jacobi(C, max_iterations=self.max_rotations, tol=JACOBI_TOL),
+                'eigh': cupy.linalg.eigh}
+
+def make_operands(size, dtype, seed=0, data=None):
+    """
+    Generates the operands of a benchmark: A and B for 'matmul' and a symmetric C for the eigensolvers.
+
+    With data (an array or np.memmap of samples x features, or a dataset_reader.DatasetReader), A is
+    the first size x size block of the data, B its transpose and C the covariance of its first size
+    features over all samples, streamed from the file block by block.
+    """
+    if data is None:
+        rng = np.random.default_rng(seed)
+        A = rng.random((size, size)).astype(dtype)
+        B = rng.random((size, size)).astype(dtype)
+        C = (A @ A.T / size).astype(dtype)
+        return {'matmul': (A, B), 'eigh': (C,), 'jacobi': (C,), 'parallel_jacobi': (C,)}
+    n, d = data.shape
+    if size > min(n, d):
+        raise ValueError(f"Size {size} exceeds the {n}x{d} data matrix")
+    blocks = dataset_reader.DatasetReader(data) if isinstance(data, np.ndarray) else data
+    covariance = StreamingCovariance(size)
+    rows = []
+    for block in blocks:
+        covariance.update(block[:, :size])
+        if sum(len(r) for r in rows) < size:
+            rows.append(block[:size, :size])
+    A = np.concatenate(rows)[:size].astype(dtype)
+    B = np.ascontiguousarray(A.T)
+    C = covariance.covariance().astype(dtype)
+    return {'matmul': (A, B), 'eigh': (C,), 'jacobi': (C,), 'parallel_jacobi': (C,)}
+
+def time_op(backend, function, operands, warmup, repeats):
+    """
+    Times one op: warm-up runs are discarded, then every repeat is timed with perf_counter_ns.
+
+    Returns:
+        np.ndarray: The times of the repeats, in seconds.
+    """
+    for _ in range(warmup):
+        function(*operands)
+        backend.synchronize()
+    times = np.empty(repeats)
+    for r in range(repeats):
+        start = time.perf_counter_ns()
+        function(*operands)
+        backend.synchronize()
+        times[r] = (time.perf_counter_ns() - start) * 1e-9
+    return times
+
+def summarize(times):
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    return {'median_s': median, 'q1_s': q1, 'q3_s': q3, 'iqr_s': q3 - q1,
+            'min_s': times.min(), 'max_s': times.max(), 'mean_s': times.mean()}
+
+def run(backends, ops, sizes, dtype='float32', warmup=1, repeats=5, threads=None, seed=0, verbose=True,
+        max_rotations=None, data=None):
+    """
+    Runs every (backend, op, size) combination and returns one record per combination.
+
+    Unavailable backends and ops a backend does not implement are skipped with a message.
+
+    Parameters:
+        backends (list of str): Registered backend names.
+        ops (list of str): Op names, see Backend.
+        sizes (list of int): Matrix dimensions.
+        dtype (str, optional): Element type of the operands. Defaults to 'float32'.
+        warmup (int, optional): Untimed runs before the repeats. Defaults to 1.
+        repeats (int, optional): Timed runs. Defaults to 5.
+        threads (int, optional): Thread count to pin. Defaults to leaving the libraries alone.
+        seed (int, optional): Seed of the operands. Defaults to 0.
+        verbose (bool, optional): Print every record. Defaults to True.
+        max_rotations (int, optional): Rotation cap of the 'jacobi' op. Defaults to running to JACOBI_TOL.
+        data (str, optional): Feature file the operands are taken from, see dataset_reader.open_dataset
+                              and make_operands. Defaults to random operands.
+
+    Returns:
+        list of dict: Records with the fields of FIELDS.
+    """
+    limiter = pin_threads(threads) if threads else None
+    # the pin only lasts for this run, later code gets the thread counts it had before
+    try:
+        dataset = dataset_reader.open_dataset(data) if data else None
+        # operands from a file take a pass over it, so they are made once per size
+        operands_by_size = {}
+        run_id = time.strftime('%Y%m%dT%H%M%S')
+        records = []
+        for name in backends:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown backend {name}, registered: {sorted(BACKENDS)}")
+            backend = BACKENDS[name]()
+            backend.max_rotations = max_rotations
+            if not backend.available():
+                print(f"Skipping {name}: not available on this machine")
+                continue
+            if threads:
+                backend.set_threads(threads)
+            supported = backend.ops()
+            for op in ops:
+                if op not in supported:
+                    print(f"Skipping {name}/{op}: not implemented by the backend")
+                    continue
+                for size in sizes:
+                    if size not in operands_by_size:
+                        operands_by_size[size] = make_operands(size, dtype, seed, dataset)
+                    operands = [backend.to_device(x) for x in operands_by_size[size][op]]
+                    times = time_op(backend, supported[op], operands, warmup, repeats)
+                    record = {'schema_version': SCHEMA_VERSION, 'run_id': run_id, 'host': platform.node(),
+                              'backend': name, 'backend_version': backend.version(), 'op': op, 'size': size,
+                              'dtype': dtype, 'data': os.path.basename(data) if data else '', 'threads': threads or 0, 'max_rotations': max_rotations if op == 'jacobi' else None,
+                              'warmup': warmup, 'repeats': repeats}
+                    record.update(summarize(times))
+                    records.append(record)
+                    if verbose:
+                        print(f"{name:>12} {op:>16} {size:>6}: median {record['median_s']:.6f} s, IQR {record['iqr_s']:.6f} s")
+    finally:
+        if limiter is not None:
+            limiter.restore_original_limits()
+    return records
+
+def write_records(records, path):
+    """
+    Writes records as JSON or CSV, chosen by the file extension.
+    """
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump({'schema_version': SCHEMA_VERSION, 'records': records}, f, indent=1)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
+def read_records(path):
+    """
+    Reads records written by write_records.
+    """
+    if path.endswith('.json'):
+        with open(path) as f:
+            return json.load(f)['records']
+    with open(path, newline='') as f:
+        records = list(csv.DictReader(f))
+    for record in records:
+        for field in FIELDS:
+            if field.endswith('_s'):
+                record[field] = float(record[field])
+            elif field in ('schema_version', 'size', 'threads', 'warmup', 'repeats'):
+                record[field] = int(record[field])
+            elif field == 'max_rotations':
+                record[field] = int(record[field]) if record[field] else None
+    return records
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compares two runs record by record, keyed on (backend, op, size, dtype, data, threads, max_rotations).
+
+    A record is flagged as a regression when its median is more than threshold slower than
+    the baseline median and the interquartile ranges of both runs do not overlap.
+
+    Returns:
+        list of dict: One entry per shared key with both medians, their ratio and the flag.
+    """
+    def key(record):
+        # records before schema 3 have no data field, they were all on random operands
+        return (record['backend'], record['op'], record['size'], record['dtype'], record.get('data') or '',
+                record['threads'], record.get('max_rotations'))
+    base = {key(record): record for record in baseline}
+    rows = []
+    for record in current:
+        old = base.get(key(record))
+        if old is None:
+            continue
+        ratio = record['median_s'] / old['median_s']
+        rows.append({'key': key(record), 'baseline_s': old['median_s'], 'current_s': record['median_s'], 'ratio': ratio,
+                     'regression': ratio > 1 + threshold and record['q1_s'] > old['q3_s']})
+    return rows
+
+#__main__#
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Matrix multiplication and EVD latency benchmark")
+    parser.add_argument('--backends', nargs='+', default=['numpy', 'torch-cpu', 'fixed-point', 'torch-cuda', 'cupy'])
+    parser.add_argument('--ops', nargs='+', default=['matmul', 'jacobi', 'eigh'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4, 8, 16, 32, 64, 128, 256, 512])
+    parser.add_argument('--dtype', default='float32')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--jacobi-max-rotations', type=int, default=None,
+                        help="Cap the Classical Jacobi rotations instead of running to convergence")
+    parser.add_argument('--data', default=None,
+                        help="Feature file (.npy, Arrow, Parquet) to take the operands from instead of random ones")
+    parser.add_argument('--out', default='benchmark_results.json', help=".json or .csv")
+    parser.add_argument('--baseline', default=None, help="Earlier results to compare against")
+    args = parser.parse_args()
+
+    records = run(args.backends, args.ops, args.sizes, args.dtype, args.warmup, args.repeats, args.threads,
+                  max_rotations=args.jacobi_max_rotations, data=args.data)
+    write_records(records, args.out)
+    print(f"Wrote {len(records)} records to {args.out}")
+
+    if args.baseline:
+        for row in compare(read_records(args.baseline), records):
+            flag = "REGRESSION" if row['regression'] else ""
+            print(f"{'/'.join(map(str, row['key'])):>40}: {row['baseline_s']:.6f} s -> {row['current_s']:.6f} s "
+                  f"({row['ratio']:.2f}x) {flag}")
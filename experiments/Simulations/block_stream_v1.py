@@ -3,6 +3,8 @@
 
 import numpy as np
 
+from blocked_gemm import BlockedGEMM
+
 class BlockStream:
     """
     A class to perform block-wise matrix multiplication and verify the result.
@@ -19,42 +21,30 @@ class BlockStream:
         verify_direct_multiplication(): Verifies the block-wise multiplication result against direct multiplication.
         test(): Executes block-wise multiplication and verification.
     """
-    def __init__(self, A, B):
+    def __init__(self, A, B, BLOCK_SIZE=3, verbose=True):
         self.A = A
         self.B = B
-        self.C = np.zeros((MATRIX_SIZE, MATRIX_SIZE), dtype=int)
-        self.BLOCK_SIZE = 3
-        self.MATRIX_SIZE = 9
+        self.BLOCK_SIZE = BLOCK_SIZE
+        self.MATRIX_SIZE = A.shape[0]
+        self.C = np.zeros((self.MATRIX_SIZE, self.MATRIX_SIZE), dtype=np.result_type(A, B))
+        self.verbose = verbose
     
     def block_multiply(self):
         """
         Performs block-wise multiplication of matrices A and B, storing the result in matrix C.
 
-        Iterates over the matrices in blocks of size BLOCK_SIZE, multiplying corresponding blocks
-        from matrices A and B, and accumulating the results into the corresponding block of matrix C.
-        Prints intermediate and final results for each block during the computation.
+        The blocks are multiplied by BlockedGEMM, which iterates over output blocks of size
+        BLOCK_SIZE and accumulates the products of the corresponding blocks of A and B.
+        When verbose, prints the block trace and the final result.
         """
-        for i in range(0, MATRIX_SIZE, BLOCK_SIZE):  # Rows - blocks
-            for j in range(0, MATRIX_SIZE, BLOCK_SIZE):  # Columns - blocks
-                print(f"\nComputing block C[{i}:{i+BLOCK_SIZE}, {j}:{j+BLOCK_SIZE}]")
-                for k in range(0, MATRIX_SIZE, BLOCK_SIZE):  # Intermediate sum for accumulation
-                    # code to extract the 3x3 blocks for matrix multiplication
-                    A_block = self.A[i:i+BLOCK_SIZE, k:k+BLOCK_SIZE]
-                    B_block = self.B[k:k+BLOCK_SIZE, j:j+BLOCK_SIZE]
-
-                    # Multiplying the blocks
-                    product_block = np.dot(A_block, B_block)
-                    print(f"\nA Block ({i}:{i+BLOCK_SIZE}, {k}:{k+BLOCK_SIZE}):\n", A_block)
-                    print(f"\nB Block ({k}:{k+BLOCK_SIZE}, {j}:{j+BLOCK_SIZE}):\n", B_block)
-                    print(f"\nIntermediate Product Block:\n", product_block)
-
-                    # Accumulation of results into the final blocks
-                    self.C[i:i+BLOCK_SIZE, j:j+BLOCK_SIZE] += product_block
+        engine = BlockedGEMM(array_size=self.BLOCK_SIZE, trace=self.verbose)
+        engine.multiply(self.A, self.B, out=self.C)
 
-                print(f"\nUpdated C Block [{i}:{i+BLOCK_SIZE}, {j}:{j+BLOCK_SIZE}]:\n", 
-                    self.C[i:i+BLOCK_SIZE, j:j+BLOCK_SIZE])
-        
-        print("\nFinal Product Matrix C (Block-wise Computed):\n", self.C)
+        if self.verbose:
+            for _, i, j, k, _ in engine.trace:
+                print(f"C[{i}:{i+self.BLOCK_SIZE}, {j}:{j+self.BLOCK_SIZE}] += "
+                      f"A[{i}:{i+self.BLOCK_SIZE}, {k}:{k+self.BLOCK_SIZE}] @ B[{k}:{k+self.BLOCK_SIZE}, {j}:{j+self.BLOCK_SIZE}]")
+            print("\nFinal Product Matrix C (Block-wise Computed):\n", self.C)
     
     def verify_direct_multiplication(self):
         """
@@ -66,7 +56,7 @@ class BlockStream:
         direct multiplication result and asserts the equality of both results,
         raising an error if they do not match.
         """
-        self.C_direct = np.dot(A, B)
+        self.C_direct = np.dot(self.A, self.B)
         print("\nProduct Matrix C (Direct Multiplication):\n", self.C_direct)
         assert np.array_equal(self.C, self.C_direct), "Block-wise computation is incorrect!"
         print("\nBlock-wise multiplication is correct!")
@@ -96,5 +86,5 @@ if __name__ == "__main__":
     print("Matrix A:\n", A)
     print("\nMatrix B:\n", B)
 
-    obj = BlockStream(A, B)
+    obj = BlockStream(A, B, BLOCK_SIZE)
     obj.test()
\ No newline at end of file
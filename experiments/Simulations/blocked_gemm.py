@@ -0,0 +1,140 @@
+# The below code implements a blocked (tiled) matrix multiplication engine
+# The tiles stream in the same order as the systolic array walks its output blocks, so the loop nest maps onto the RTL
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+class BlockedGEMM:
+    """
+    A tiled matrix multiplication engine computing C = A @ B.
+
+    Output tiles are visited row by row and every tile accumulates its k-panels in order,
+    like the systolic array accumulating partial sums in its MAC units. Matrices whose sizes
+    are not multiples of the tile sizes get smaller edge tiles. Products are written into a
+    preallocated output through per-thread scratch tiles, so no temporaries are created per block.
+
+    Attributes:
+        array_size (int): The dimension of the systolic array the tiling mirrors.
+        tile_m (int): Rows of an output tile.
+        tile_n (int): Columns of an output tile.
+        tile_k (int): Depth of the k-panels accumulated into an output tile.
+        n_threads (int): Number of worker threads the output tiles are spread across.
+        trace (list or None): (tile index, i, j, k, thread name) of every tile product, when tracing is enabled.
+
+    Methods:
+        tiles(M, N): Returns the output tiles in hardware order.
+        multiply(A, B, out=None): Computes A @ B into out.
+    """
+    def __init__(self, array_size=4, tile_m=None, tile_n=None, tile_k=None, n_threads=1, trace=False):
+        self.array_size = array_size
+        self.tile_m = tile_m or array_size
+        self.tile_n = tile_n or array_size
+        self.tile_k = tile_k or array_size
+        for name in ('tile_m', 'tile_n', 'tile_k'):
+            # larger tiles are whole groups of array tiles, so the streaming order is unchanged
+            if getattr(self, name) % array_size:
+                raise ValueError(f"{name}={getattr(self, name)} is not a multiple of the array size {array_size}")
+        self.n_threads = n_threads
+        self.trace = [] if trace else None
+        self._scratch = threading.local()
+
+    def tiles(self, M, N):
+        """
+        Lists the output tiles in the order the hardware produces them.
+
+        Parameters:
+            M (int): Rows of the output.
+            N (int): Columns of the output.
+
+        Returns:
+            list: (i0, i1, j0, j1) bounds of every output tile, row-major over tiles.
+        """
+        return [(i, min(i + self.tile_m, M), j, min(j + self.tile_n, N))
+                for i in range(0, M, self.tile_m) for j in range(0, N, self.tile_n)]
+
+    def _scratch_tile(self, dtype):
+        scratch = getattr(self._scratch, 'tile', None)
+        if scratch is None or scratch.dtype != dtype:
+            scratch = np.empty((self.tile_m, self.tile_n), dtype=dtype)
+            self._scratch.tile = scratch
+        return scratch
+
+    def _compute_tile(self, A, B, out, index, tile):
+        i0, i1, j0, j1 = tile
+        out_tile = out[i0:i1, j0:j1]
+        scratch = self._scratch_tile(out.dtype)[:i1 - i0, :j1 - j0]
+        out_tile[...] = 0
+        for k in range(0, A.shape[1], self.tile_k):
+            k1 = min(k + self.tile_k, A.shape[1])
+            np.matmul(A[i0:i1, k:k1], B[k:k1, j0:j1], out=scratch)
+            np.add(out_tile, scratch, out=out_tile)
+            if self.trace is not None:
+                self.trace.append((index, i0, j0, k, threading.current_thread().name))
+
+    def multiply(self, A, B, out=None):
+        """
+        Computes A @ B tile by tile.
+
+        Parameters:
+            A (np.ndarray): Left operand, shape (M, K).
+            B (np.ndarray): Right operand, shape (K, N).
+            out (np.ndarray, optional): Preallocated (M, N) output. Allocated when omitted.
+
+        Returns:
+            np.ndarray: The product, written into out.
+        """
+        A = np.asarray(A)
+        B = np.asarray(B)
+        if A.ndim != 2 or B.ndim != 2 or A.shape[1] != B.shape[0]:
+            raise ValueError(f"Cannot multiply shapes {A.shape} and {B.shape}")
+        M, N = A.shape[0], B.shape[1]
+        if out is None:
+            out = np.empty((M, N), dtype=np.result_type(A, B))
+        elif out.shape != (M, N):
+            raise ValueError(f"Output shape {out.shape} does not match ({M}, {N})")
+        if self.trace is not None:
+            self.trace.clear()
+
+        tiles = self.tiles(M, N)
+        if self.n_threads > 1:
+            # NumPy releases the GIL inside matmul, so output tiles run concurrently
+            with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+                for future in [pool.submit(self._compute_tile, A, B, out, index, tile) for index, tile in enumerate(tiles)]:
+                    future.result()
+            if self.trace is not None:
+                self.trace.sort()
+        else:
+            for index, tile in enumerate(tiles):
+                self._compute_tile(A, B, out, index, tile)
+        return out
+
+#__main__#
+
+if __name__ == "__main__":
+    # Covariance-sized product X^T X, timed against a direct np.dot
+    size = 2048
+    np.random.seed(0)
+    X = np.random.rand(size, size).astype(np.float32)
+    out = np.empty((size, size), dtype=np.float32)
+
+    start = time.perf_counter()
+    C_direct = np.dot(X.T, X)
+    print(f"np.dot: {time.perf_counter() - start:.3f} s")
+
+    for n_threads in sorted({1, os.cpu_count() or 1}):
+        engine = BlockedGEMM(array_size=4, tile_m=512, tile_n=512, tile_k=512, n_threads=n_threads)
+        start = time.perf_counter()
+        engine.multiply(X.T, X, out=out)
+        print(f"BlockedGEMM 512x512 tiles, {n_threads} thread(s): {time.perf_counter() - start:.3f} s")
+        assert np.allclose(out, C_direct, rtol=1e-4, atol=1e-2), "Blocked multiplication is incorrect!"
+
+    # Hardware tiling on a small non-divisible case, with the tile trace
+    engine = BlockedGEMM(array_size=4, trace=True)
+    A = np.random.randint(1, 10, (9, 9))
+    B = np.random.randint(1, 10, (9, 9))
+    assert np.array_equal(engine.multiply(A, B), A @ B), "Blocked multiplication is incorrect!"
+    print(f"9x9 on a 4x4 array: {len(engine.tiles(9, 9))} output tiles, {len(engine.trace)} tile products")
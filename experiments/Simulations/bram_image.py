@@ -0,0 +1,223 @@
+# The below code implements the host-side pipeline from float matrices to BRAM initialization images
+# Matrices are quantized to the fixed-point format of the datapath, packed S elements to a word in the row and bank
+# order of the block RAMs in src/, and written as Vivado .coe files or raw binary, whole batches at a time
+
+import os
+import time
+
+import numpy as np
+
+import tracing
+from fixed_point_model import QFormat, Q3_5, to_bits, from_bits
+
+@tracing.traced('bram.quantize')
+def quantize(matrices, fmt=Q3_5, rounding='truncate'):
+    """
+    Quantizes a batch of float matrices to saturated codes of a fixed-point format, with overflow statistics.
+
+    Parameters:
+        matrices (array-like): Real values, shape (..., rows, cols).
+        fmt (QFormat, optional): The target format. Defaults to Q3_5, the operands of FP_Mul.sv.
+        rounding (str, optional): 'truncate' (floor, as the RTL does) or 'nearest'. Defaults to 'truncate'.
+
+    Returns:
+        np.ndarray: int64 codes, same shape as matrices.
+        dict: Per-matrix arrays of shape (...): 'overflow' and 'underflow' (elements clamped to the
+              largest and smallest code), 'max_error' (largest |x - quantized x|, clamping included)
+              and 'peak' (largest |x|, to pick a format that fits).
+    """
+    x = np.asarray(matrices, dtype=np.float64)
+    scale = float(1 << fmt.frac_bits)
+    scaled = np.multiply(x, scale)
+    if rounding == 'nearest':
+        scaled += 0.5
+    elif rounding != 'truncate':
+        raise ValueError(f"Unknown rounding mode: {rounding}")
+    np.floor(scaled, out=scaled)
+    # reductions run along one flattened axis per matrix, much faster than over two short ones
+    flat_x, flat = x.reshape(*x.shape[:-2], -1), scaled.reshape(*x.shape[:-2], -1)
+    stats = {
+        'overflow': (flat > fmt.max_code).sum(axis=-1),
+        'underflow': (flat < fmt.min_code).sum(axis=-1),
+        'peak': np.maximum(flat_x.max(axis=-1), -flat_x.min(axis=-1)),
+    }
+    np.clip(scaled, fmt.min_code, fmt.max_code, out=scaled)
+    codes = scaled.astype(np.int64)
+    # the error of the clamped values is formed in the scaled buffer, which is no longer needed
+    scaled /= -scale
+    scaled += x
+    stats['max_error'] = np.abs(flat, out=flat).max(axis=-1)
+    if tracing.enabled():
+        tracing.count('bram.elements', codes.size)
+        tracing.count('bram.clamped', int(stats['overflow'].sum() + stats['underflow'].sum()))
+    return codes, stats
+
+def _word_dtype(fmt, array_size):
+    word_bits = fmt.width * array_size
+    if word_bits not in (8, 16, 32, 64) or fmt.width % 8:
+        raise ValueError(f"{array_size} elements of {fmt.width} bits do not make a byte-aligned 8/16/32/64-bit word")
+    return np.dtype(f'<u{word_bits // 8}'), np.dtype(f'<u{fmt.width // 8}')
+
+@tracing.traced('bram.pack')
+def pack_words(codes, fmt=Q3_5, array_size=4, msb_first=True, banks=1):
+    """
+    Packs a batch of code matrices into BRAM words, in address order.
+
+    The matrix is cut into array_size x array_size tiles, taken row-major; every tile row is one
+    word, so a tile fills array_size consecutive addresses, as controller_TPUtoCovBRAM writes it.
+    With several banks the tiles are dealt round-robin, tile t at address (t // banks) * S + row
+    of bank t % banks. A ragged edge is zero-padded.
+
+    Parameters:
+        codes (np.ndarray): int codes of fmt, shape (..., rows, cols).
+        fmt (QFormat, optional): Format of the codes. Defaults to Q3_5.
+        array_size (int, optional): S, elements per word and rows per tile. Defaults to 4.
+        msb_first (bool, optional): Column 0 in the most significant byte, as in src/ip.coe for
+                                    BRAM_IdentityMatrix; False puts it in the least significant
+                                    byte, as controller_TPUtoCovBRAM does for BRAM_CovarianceMatrix.
+                                    Defaults to True.
+        banks (int, optional): Number of BRAMs the tiles are spread over. Defaults to 1.
+
+    Returns:
+        np.ndarray: Little-endian unsigned words, shape (..., banks, depth).
+    """
+    word_dtype, element_dtype = _word_dtype(fmt, array_size)
+    codes = np.asarray(codes)
+    *batch, rows, cols = codes.shape
+    S = array_size
+    T_rows, T_cols = -(-rows // S), -(-cols // S)
+    padded = np.zeros((*batch, T_rows * S, T_cols * S), dtype=element_dtype)
+    padded[..., :rows, :cols] = to_bits(codes, fmt)
+    # (..., T, S, T, S) -> (..., T, T, S, S): tiles row-major, each tile row-major
+    tiles = padded.reshape(*batch, T_rows, S, T_cols, S).swapaxes(-3, -2).reshape(*batch, T_rows * T_cols, S, S)
+    if msb_first:
+        # a little-endian word holds its highest address in the most significant byte
+        tiles = tiles[..., ::-1]
+    n_tiles = T_rows * T_cols
+    per_bank = -(-n_tiles // banks)
+    dealt = np.zeros((*batch, per_bank * banks, S, S), dtype=element_dtype)
+    dealt[..., :n_tiles, :, :] = tiles
+    dealt = dealt.reshape(*batch, per_bank, banks, S, S).swapaxes(-4, -3)
+    return np.ascontiguousarray(dealt).view(word_dtype).reshape(*batch, banks, per_bank * S)
+
+def unpack_words(words, rows, cols, fmt=Q3_5, array_size=4, msb_first=True):
+    """
+    Inverts pack_words: recovers the code matrices from BRAM words of shape (..., banks, depth).
+
+    Returns:
+        np.ndarray: int64 codes, shape (..., rows, cols).
+    """
+    word_dtype, element_dtype = _word_dtype(fmt, array_size)
+    words = np.ascontiguousarray(words, dtype=word_dtype)
+    *batch, banks, depth = words.shape
+    S = array_size
+    T_rows, T_cols = -(-rows // S), -(-cols // S)
+    tiles = words.view(element_dtype).reshape(*batch, banks, depth // S, S, S).swapaxes(-4, -3)
+    tiles = tiles.reshape(*batch, -1, S, S)[..., :T_rows * T_cols, :, :]
+    if msb_first:
+        tiles = tiles[..., ::-1]
+    matrix = tiles.reshape(*batch, T_rows, T_cols, S, S).swapaxes(-3, -2).reshape(*batch, T_rows * S, T_cols * S)
+    return from_bits(matrix[..., :rows, :cols], fmt)
+
+def bram_images(matrices, fmt=Q3_5, array_size=4, msb_first=True, banks=1, rounding='truncate'):
+    """
+    Quantizes and packs a batch of float matrices in one pass.
+
+    Returns:
+        np.ndarray: Words, shape (..., banks, depth); see pack_words.
+        dict: Overflow statistics per matrix; see quantize.
+    """
+    codes, stats = quantize(matrices, fmt, rounding)
+    return pack_words(codes, fmt, array_size, msb_first, banks), stats
+
+def coe_text(words):
+    """
+    Formats the words of one BRAM as a Vivado memory initialization file, radix 16, like src/ip.coe.
+    """
+    words = np.asarray(words)
+    digits = 2 * words.dtype.itemsize
+    # one big-endian byte string, hex-encoded in a single call, is cut into fixed-width entries
+    hex_digits = words.astype(words.dtype.newbyteorder('>')).tobytes().hex()
+    entries = [hex_digits[i:i + digits] for i in range(0, len(hex_digits), digits)]
+    return "memory_initialization_radix=16;\nmemory_initialization_vector=\n" + ",\n".join(entries) + ";"
+
+def write_coe(path, words):
+    """
+    Writes the words of one BRAM, shape (depth,), to a .coe file.
+    """
+    with open(path, 'w', newline='\n') as f:
+        f.write(coe_text(words))
+
+def write_raw(path, words, byteorder='<'):
+    """
+    Writes any batch of words to a raw binary image, in C order, with the given byte order ('<' or '>').
+    """
+    words = np.asarray(words)
+    words.astype(words.dtype.newbyteorder(byteorder), copy=False).tofile(path)
+
+#__main__#
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'serial'))
+    import FramedProtocol
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir)
+
+    # The identity image of BRAM_IdentityMatrix, byte for byte
+    words, stats = bram_images(np.eye(4))
+    with open(os.path.join(root, 'src', 'ip.coe')) as f:
+        assert coe_text(words[0]) == f.read()
+    print(f"np.eye(4) reproduces src/ip.coe: {' '.join(f'{w:08x}' for w in words[0])}")
+
+    # The covariance layout matches controller_TPUtoCovBRAM, dina = {d[3], d[2], d[1], d[0]}
+    codes = np.arange(16).reshape(4, 4)
+    words = pack_words(codes, msb_first=False)
+    assert words[0, 0] == (3 << 24) | (2 << 16) | (1 << 8) | 0
+    print(f"Covariance layout, row 0 of [[0, 1, 2, 3], ...]: {words[0, 0]:08x}")
+
+    # A batch of covariance matrices: the unsigned Q(3,5) operands clamp every negative covariance,
+    # the statistics show it and a signed format with one integer bit less fits
+    rng = np.random.default_rng(0)
+    n_matrices, n = 20000, 16
+    X = rng.standard_normal((n_matrices, 64, n)) * rng.uniform(0.2, 2.0, (n_matrices, 1, 1))
+    C = np.einsum('bki,bkj->bij', X, X) / 64
+
+    print(f"\n{'format':>40} {'clamped high':>13} {'clamped low':>12} {'matrices hit':>13} {'max error':>10}")
+    # the error column is the median over the matrices of each matrix's largest error
+    for fmt in (Q3_5, QFormat(2, 5, signed=True)):
+        _, stats = quantize(C, fmt)
+        clamped = stats['overflow'] + stats['underflow']
+        print(f"{repr(fmt):>40} {stats['overflow'].sum():>13} {stats['underflow'].sum():>12} "
+              f"{np.count_nonzero(clamped):>13} {np.median(stats['max_error']):>10.4f}")
+
+    start = time.perf_counter()
+    words, stats = bram_images(C, banks=2)
+    t_pack = time.perf_counter() - start
+    print(f"\n{n_matrices} matrices of {n}x{n} -> words {words.shape} in {t_pack * 1e3:.1f} ms "
+          f"({n_matrices / t_pack / 1e3:.0f}k matrices/s)")
+
+    codes, _ = quantize(C)
+    assert np.array_equal(unpack_words(words, n, n), codes)
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        write_raw(os.path.join(directory, 'batch.bin'), words)
+        t_raw = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(100):
+            for bank in range(words.shape[1]):
+                write_coe(os.path.join(directory, f'cov_{i}_{bank}.coe'), words[i, bank])
+        t_coe = time.perf_counter() - start
+        size = os.path.getsize(os.path.join(directory, 'batch.bin'))
+    print(f"Raw image of the whole batch: {size / 2**20:.1f} MiB in {t_raw * 1e3:.1f} ms; "
+          f".coe files: {t_coe / 200 * 1e6:.0f} us per BRAM")
+
+    # The packed words are the serial payload as they are, no text and no copy
+    header, data = FramedProtocol.pack_matrix(words[0])
+    assert np.shares_memory(data, words)
+    text = ",".join(str(v) for v in codes[0].ravel())
+    print(f"\nPayload of one matrix: {len(header) + data.nbytes} bytes, shares memory with the image; "
+          f"as a text string it was {len(text)} bytes")
@@ -0,0 +1,387 @@
+# The below code implements the ingestion path from feature files on disk to the PCA pipeline
+# .npy, raw binary and Arrow files are memory-mapped and read as page-aligned row blocks that are views on the file;
+# Parquet is decoded one block at a time, and a background thread can prefetch the next block while one is reduced
+
+import math
+import mmap
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+NPY_SUFFIXES = ('.npy',)
+ARROW_SUFFIXES = ('.arrow', '.feather', '.ipc')
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+
+# the default block: 8 MiB of rows, rounded so that every block starts on a page
+BLOCK_BYTES = 8 * 2**20
+
+def _pyarrow():
+    # pyarrow is only needed for Arrow and Parquet files
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Reading Arrow or Parquet files needs pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+def _suffix(path):
+    return os.path.splitext(os.fspath(path))[1].lower()
+
+def _arrow_table(path):
+    pa = _pyarrow()
+    # a memory-mapped IPC file is read without copying its buffers
+    return pa.ipc.open_file(pa.memory_map(os.fspath(path), 'r')).read_all()
+
+def _fixed_size_list_view(table):
+    # one FixedSizeList<float> column in one chunk is a flat buffer of n * d values, a matrix as it is
+    pa = _pyarrow()
+    if table.num_columns != 1 or not pa.types.is_fixed_size_list(table.schema.types[0]):
+        return None
+    column = table.column(0)
+    if column.num_chunks != 1 or column.null_count:
+        return None
+    chunk = column.chunk(0)
+    values = chunk.values.slice(chunk.offset * chunk.type.list_size, len(chunk) * chunk.type.list_size)
+    return values.to_numpy(zero_copy_only=True).reshape(len(chunk), chunk.type.list_size)
+
+def open_dataset(path, dtype=None, n_features=None, offset=0):
+    """
+    Opens a feature file as a read-only memory-mapped matrix, one sample per row.
+
+    Parameters:
+        path (str): A .npy file, an Arrow IPC / Feather v2 file holding one FixedSizeList column
+                    in one record batch, or a raw binary file of C-ordered rows (any other suffix).
+        dtype (str or np.dtype, optional): Element type of a raw file. Required for raw files.
+        n_features (int, optional): Row length of a raw file. Required for raw files.
+        offset (int, optional): Bytes to skip at the start of a raw file. Defaults to 0.
+
+    Returns:
+        np.ndarray: An np.memmap for .npy and raw files, a view on the mapped Arrow buffer for
+                    Arrow files; or a DatasetReader when the file has to be decoded (Parquet,
+                    Arrow files with one column per feature), which yields the row blocks.
+    """
+    suffix = _suffix(path)
+    if suffix in NPY_SUFFIXES:
+        X = np.load(path, mmap_mode='r')
+    elif suffix in PARQUET_SUFFIXES:
+        return DatasetReader(path)
+    elif suffix in ARROW_SUFFIXES:
+        X = _fixed_size_list_view(_arrow_table(path))
+        if X is None:
+            return DatasetReader(path)
+    else:
+        if dtype is None or n_features is None:
+            raise ValueError(f"A raw binary file needs dtype and n_features: {path}")
+        dtype = np.dtype(dtype)
+        row_bytes = dtype.itemsize * n_features
+        n = (os.path.getsize(path) - offset) // row_bytes
+        X = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n, n_features))
+    if X.ndim != 2:
+        raise ValueError(f"Expected a 2D data matrix in {path}, got shape {X.shape}")
+    return X
+
+def aligned_block_rows(row_bytes, block_bytes=BLOCK_BYTES, alignment=mmap.PAGESIZE):
+    """
+    Returns the rows per block closest to block_bytes that keeps consecutive blocks on alignment boundaries.
+
+    Parameters:
+        row_bytes (int): Bytes per row.
+        block_bytes (int, optional): Target size of a block. Defaults to BLOCK_BYTES.
+        alignment (int, optional): Boundary in bytes, the page size by default.
+
+    Returns:
+        int: A multiple of alignment / gcd(alignment, row_bytes), at least one such step.
+    """
+    step = alignment // math.gcd(alignment, row_bytes)
+    return max(round(block_bytes / row_bytes / step), 1) * step
+
+def _first_aligned_row(data_offset, row_bytes, alignment):
+    # the first row boundary at a file offset that is a multiple of alignment, or 0 when the
+    # header leaves none (then the blocks are aligned relative to the start of the data)
+    step = alignment // math.gcd(alignment, row_bytes)
+    for row in range(step):
+        if (data_offset + row * row_bytes) % alignment == 0:
+            return row
+    return 0
+
+def _file_offset(X):
+    # where X starts in its file; a slice of an np.memmap keeps the offset attribute of the whole
+    # mapping, so the position is taken from the data pointer within the mmap (np.memmap._mmap)
+    mapping = getattr(X, '_mmap', None)
+    if not isinstance(X, np.memmap) or mapping is None:
+        return None
+    base = np.frombuffer(mapping, dtype=np.uint8).ctypes.data
+    return X.offset - X.offset % mmap.ALLOCATIONGRANULARITY + X.ctypes.data - base
+
+# MADV_POPULATE_READ (Linux 5.14) faults pages in and maps them without a copy; the mmap module
+# does not export it before Python 3.13
+MADV_POPULATE_READ = getattr(mmap, 'MADV_POPULATE_READ', 22)
+
+def _populate(mapping, start, length):
+    # maps the pages of a block ahead of the consumer; older kernels get the asynchronous readahead hint
+    try:
+        mapping.madvise(MADV_POPULATE_READ, start, length)
+    except OSError:
+        mapping.madvise(mmap.MADV_WILLNEED, start, length)
+
+def _prefetched(blocks, depth):
+    """
+    Runs a block generator on a background thread, depth blocks ahead of the consumer.
+    Exceptions are raised in the consumer; leaving the loop early stops the thread.
+    """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for block in blocks:
+                if not put((block, None)):
+                    return
+        except BaseException as e:
+            put((done, e))
+            return
+        put((done, None))
+
+    thread = threading.Thread(target=produce, name='dataset-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            block, error = ready.get()
+            if block is done:
+                if error is not None:
+                    raise error
+                return
+            yield block
+    finally:
+        stop.set()
+        thread.join()
+        blocks.close()
+
+class DatasetReader:
+    """
+    Iterates over a feature matrix in row blocks, without copying where the file allows it.
+
+    Memory-mapped sources (.npy, raw binary, a FixedSizeList Arrow column, or any array passed in)
+    yield views on the mapping. Block boundaries fall on page boundaries of the file: the first
+    block runs up to the first page-aligned row and every later block is a whole number of pages,
+    so no page is faulted in by two blocks and the kernel readahead sees one sequential stream.
+    A C-ordered source gives C-contiguous blocks. Parquet files and Arrow files with one column
+    per feature are decoded block by block into a fresh (block_rows, d) array, the one copy the
+    row-major layout needs.
+
+    With prefetch, a background thread runs `prefetch` blocks ahead of the consumer. For a mapped
+    file it populates the pages of the block (madvise MADV_POPULATE_READ, or MADV_WILLNEED on older
+    kernels), so the consumer finds them read and mapped instead of taking a page fault per page;
+    the madvise call releases the GIL and overlaps with the reduction of the current block (a GEMM,
+    which releases it too). For a decoded file the thread decodes the next block.
+
+    Attributes:
+        shape (tuple): (n, d) of the whole matrix.
+        dtype (np.dtype): Element type of the blocks.
+        block_rows (int): Rows per block (the first block of a mapped file may be shorter).
+        zero_copy (bool): True when the blocks are views on the mapped file.
+        array (np.ndarray or None): The mapped matrix, None for decoded files.
+
+    Methods:
+        bounds(): The (start, stop) rows of every block.
+        __iter__(): Yields the blocks.
+    """
+    def __init__(self, source, block_rows=None, block_bytes=BLOCK_BYTES, alignment=mmap.PAGESIZE, prefetch=0,
+                 dtype=None, n_features=None, offset=0, columns=None):
+        """
+        Parameters:
+            source: A path (see open_dataset) or a 2D array / np.memmap.
+            block_rows (int, optional): Rows per block; for a mapped file rounded up to keep the alignment.
+                                        Defaults to the aligned row count closest to block_bytes.
+            block_bytes (int, optional): Target block size when block_rows is not given.
+            alignment (int, optional): Boundary of the blocks in the file, the page size by default.
+            prefetch (int, optional): Blocks to prepare ahead on a background thread; 0 turns it off.
+            dtype, n_features, offset: Layout of a raw binary file, see open_dataset.
+            columns (list of str, optional): Columns of a Parquet or Arrow file, in order. Defaults to all.
+        """
+        self.path = None
+        self.table = None
+        self.parquet = None
+        self.columns = columns
+        self.alignment = alignment
+        self.prefetch = prefetch
+        if isinstance(source, (str, os.PathLike)):
+            self.path = os.fspath(source)
+            suffix = _suffix(source)
+            if suffix in PARQUET_SUFFIXES:
+                self.parquet = _pyarrow().parquet.ParquetFile(self.path, memory_map=True)
+                source = None
+            elif suffix in ARROW_SUFFIXES:
+                self.table = _arrow_table(self.path)
+                source = _fixed_size_list_view(self.table) if columns is None else None
+            else:
+                source = open_dataset(source, dtype, n_features, offset)
+        self.array = source
+        if source is not None:
+            if source.ndim != 2:
+                raise ValueError(f"Expected a 2D data matrix, got shape {source.shape}")
+            self.table = None
+            self.shape = source.shape
+            self.dtype = source.dtype
+            self.zero_copy = True
+        else:
+            schema = self.parquet.schema_arrow if self.parquet is not None else self.table.schema
+            names = columns or schema.names
+            n = self.parquet.metadata.num_rows if self.parquet is not None else self.table.num_rows
+            self.shape = (n, len(names))
+            self.dtype = np.result_type(*(schema.field(name).type.to_pandas_dtype() for name in names))
+            self.zero_copy = False
+        # the file offset of row 0 decides where the aligned boundaries are; None when the matrix
+        # is not an np.memmap, and then nothing is read ahead
+        self.data_offset = _file_offset(self.array)
+        if self.data_offset is not None:
+            self.path = self.array.filename
+        row_bytes = self.dtype.itemsize * self.shape[1]
+        if block_rows is None:
+            self.block_rows = aligned_block_rows(row_bytes, block_bytes, alignment)
+        elif self.data_offset is None:
+            self.block_rows = block_rows
+        else:
+            step = alignment // math.gcd(alignment, row_bytes)
+            self.block_rows = -(-block_rows // step) * step
+
+    def __len__(self):
+        return len(self.bounds())
+
+    def bounds(self):
+        """
+        Returns the (start, stop) rows of every block.
+        """
+        n = self.shape[0]
+        row_bytes = self.dtype.itemsize * self.shape[1]
+        first = 0 if self.data_offset is None else _first_aligned_row(self.data_offset, row_bytes, self.alignment)
+        edges = ([0] if first else []) + list(range(first, n, self.block_rows)) + [n]
+        return [(start, stop) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+    def _mapped_blocks(self, warm):
+        X = self.array
+        # np.memmap keeps its mmap object in _mmap; the advice goes to the pages of each block
+        mapping = X._mmap if warm and self.data_offset is not None and X.flags.c_contiguous else None
+        if mapping is not None:
+            mapping_start = X.offset - X.offset % mmap.ALLOCATIONGRANULARITY
+            mapping.madvise(mmap.MADV_SEQUENTIAL)
+        row_bytes = X.dtype.itemsize * X.shape[1]
+        for start, stop in self.bounds():
+            if mapping is not None:
+                position = self.data_offset + start * row_bytes - mapping_start
+                page = position - position % mmap.PAGESIZE
+                _populate(mapping, page, position + (stop - start) * row_bytes - page)
+            yield X[start:stop]
+
+    def _decoded_blocks(self):
+        if self.parquet is not None:
+            batches = self.parquet.iter_batches(batch_size=self.block_rows, columns=self.columns)
+        else:
+            table = self.table.select(self.columns) if self.columns else self.table
+            batches = table.to_batches(max_chunksize=self.block_rows)
+        for batch in batches:
+            block = np.empty((batch.num_rows, batch.num_columns), dtype=self.dtype)
+            for j, column in enumerate(batch.columns):
+                block[:, j] = column.to_numpy(zero_copy_only=False)
+            yield block
+
+    def _blocks(self, warm=False):
+        if self.array is not None:
+            return self._mapped_blocks(warm)
+        return self._decoded_blocks()
+
+    def __iter__(self):
+        if not self.prefetch:
+            return self._blocks()
+        return _prefetched(self._blocks(warm=True), self.prefetch)
+
+#__main__#
+
+if __name__ == "__main__":
+    import tempfile
+
+    from streaming_covariance import StreamingCovariance
+
+    def evict(path):
+        # drops the file from the page cache, so every run starts cold
+        fd = os.open(path, os.O_RDONLY)
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+
+    # A 1M x 96 float32 feature matrix, as .npy and as raw binary, on disk
+    rng = np.random.default_rng(0)
+    n, d = 1_000_000, 96
+    directory = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(__file__)))
+    npy_path, raw_path = os.path.join(directory, 'features.npy'), os.path.join(directory, 'features.bin')
+    X = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.float32, shape=(n, d))
+    for start in range(0, n, 100_000):
+        X[start:start + 100_000] = rng.standard_normal((100_000, d), dtype=np.float32) + 5.0
+    X.flush()
+    X.tofile(raw_path)
+    del X
+    size = n * d * 4 / 2**20
+
+    reader = DatasetReader(npy_path)
+    blocks = list(reader)
+    assert all(np.shares_memory(block, reader.array) and block.flags.c_contiguous for block in blocks)
+    offsets = [reader.data_offset + start * d * 4 for start, _ in reader.bounds()]
+    print(f"{npy_path.rsplit(os.sep, 1)[1]}: {n}x{d} float32 ({size:.0f} MiB), {len(blocks)} blocks of "
+          f"{reader.block_rows} rows, all views; page-aligned file offsets after the first: "
+          f"{all(o % mmap.PAGESIZE == 0 for o in offsets[1:])}")
+    raw = open_dataset(raw_path, dtype=np.float32, n_features=d)
+    assert np.array_equal(raw[-3:], reader.array[-3:])
+
+    def timed(path, consume):
+        evict(path)
+        start = time.perf_counter()
+        covariance = consume()
+        return time.perf_counter() - start, covariance
+
+    runs = (
+        ('np.load, whole file', lambda: np.cov(np.load(npy_path), rowvar=False)),
+        ('DatasetReader', lambda: StreamingCovariance().consume(DatasetReader(npy_path)).covariance()),
+        ('DatasetReader, prefetch', lambda: StreamingCovariance().consume(DatasetReader(npy_path, prefetch=1)).covariance()),
+        ('raw binary, prefetch', lambda: StreamingCovariance().consume(
+            DatasetReader(raw_path, dtype=np.float32, n_features=d, prefetch=1)).covariance()),
+    )
+    def read_only():
+        with open(npy_path, 'rb', buffering=0) as f:
+            buffer = bytearray(BLOCK_BYTES)
+            while f.readinto(buffer):
+                pass
+
+    # prefetch only pays when there is a core to overlap on and the storage is slower than the reduction
+    elapsed, _ = timed(npy_path, read_only)
+    print(f"\nReading the file alone, cold: {elapsed:.2f} s ({size / elapsed:.0f} MiB/s); {os.cpu_count()} CPU(s)")
+    print("Covariance of the file, page cache dropped before every run:")
+    reference = None
+    for name, consume in runs:
+        elapsed, covariance = timed(raw_path if 'raw' in name else npy_path, consume)
+        if reference is None:
+            reference = covariance
+        error = np.abs(covariance - reference).max()
+        print(f"{name:>28}: {elapsed:6.2f} s, {size / elapsed:7.0f} MiB/s, max abs difference {error:.1e}")
+
+    try:
+        _pyarrow()
+    except ImportError as e:
+        print(f"\nArrow and Parquet skipped: {e}")
+
+    os.remove(npy_path)
+    os.remove(raw_path)
+    os.rmdir(directory)
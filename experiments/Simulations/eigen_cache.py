@@ -0,0 +1,274 @@
+# The below code implements a content-addressed cache for eigendecomposition results
+# Matrices are keyed by a hash of their dtype, shape and bytes; results live in an LRU with a byte budget and
+# optionally in a directory of .npy files that are memory-mapped back on a hit
+
+import collections
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+def content_key(array, *params):
+    """
+    Hashes a matrix, together with the solver parameters its result depends on.
+
+    The key covers dtype (with byte order), shape and the raw bytes in C order, so bit-identical
+    matrices share a key and any change to a single bit, the type or the layout gives a new one.
+
+    Parameters:
+        array (np.ndarray): The matrix; a contiguous one is hashed without a copy.
+        *params: Anything else that changes the result (tolerances, backend names, ...), hashed by repr.
+
+    Returns:
+        str: 32 hex digits of a 128-bit BLAKE2b digest.
+    """
+    array = np.ascontiguousarray(array)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(array.dtype.str.encode())
+    h.update(repr(array.shape).encode())
+    h.update(repr(params).encode())
+    h.update(memoryview(array).cast('B'))
+    return h.hexdigest()
+
+class EigenCache:
+    """
+    Two-tier cache of results that are tuples of arrays, such as (eigenvalues, eigenvectors).
+
+    The memory tier is an LRU bounded by max_bytes of array data; entries are stored as read-only
+    copies, so neither the caller nor later hits can change them. With a directory, every result
+    is also written there as one .npy file per array plus one holding their count, all named after
+    the key so a lookup opens them directly (write-through, atomic renames), bounded by
+    disk_bytes with the least recently used files evicted first; a miss in memory that hits on
+    disk returns read-only np.memmap views and moves the entry back into memory. The disk tier
+    outlives the process, so a replayed pipeline starts warm.
+
+    Attributes:
+        max_bytes (int): Budget of the memory tier.
+        directory (str or None): Directory of the disk tier.
+        disk_bytes (int or None): Budget of the disk tier; unbounded when None.
+        hits (int): Lookups answered from memory.
+        disk_hits (int): Lookups answered from disk.
+        misses (int): Lookups answered by neither.
+        evictions (int): Entries dropped from memory to stay within max_bytes.
+
+    Methods:
+        key(array, *params): The content key of a matrix, see content_key.
+        get(key): Returns the cached tuple of arrays, or None.
+        put(key, result): Stores a tuple of arrays.
+        get_or_compute(key, compute): get, falling back to compute() and put.
+        stats(): Hit and miss counts, hit rate and the sizes of both tiers.
+    """
+    key = staticmethod(content_key)
+
+    def __init__(self, max_bytes=64 * 2**20, directory=None, disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _remember(self, key, result):
+        nbytes = sum(array.nbytes for array in result)
+        if nbytes > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= sum(array.nbytes for array in self.entries.pop(key))
+        self.entries[key] = result
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= sum(array.nbytes for array in evicted)
+            self.evictions += 1
+
+    def _paths(self, key, count):
+        # the count file comes first, the arrays follow
+        return [os.path.join(self.directory, f"{key}_count.npy")] + \
+               [os.path.join(self.directory, f"{key}_{i}.npy") for i in range(count)]
+
+    def _load(self, key):
+        # the count is written after the arrays, an entry counts only once it exists
+        try:
+            paths = self._paths(key, int(np.load(self._paths(key, 0)[0])))
+            result = tuple(np.load(path, mmap_mode='r') for path in paths[1:])
+        except (FileNotFoundError, ValueError):
+            return None
+        now = time.time()
+        for path in paths:
+            os.utime(path, (now, now))
+        return result
+
+    def _save(self, path, array):
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            np.save(f, array)
+        os.replace(temporary, path)
+
+    def _store(self, key, result):
+        paths = self._paths(key, len(result))
+        for path, array in zip(paths[1:], result):
+            self._save(path, array)
+        self._save(paths[0], np.array(len(result)))
+        if self.disk_bytes is not None:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            # all files of the entry go together, a partial entry would never be found again
+            key = name.split('_', 1)[0]
+            for other in [f for f in files if f[2].startswith(key + '_')]:
+                try:
+                    os.remove(os.path.join(self.directory, other[2]))
+                    total -= other[1]
+                except FileNotFoundError:
+                    pass
+            files = [f for f in files if not f[2].startswith(key + '_')]
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result
+            if self.directory is not None:
+                result = self._load(key)
+                if result is not None:
+                    self.disk_hits += 1
+                    self._remember(key, result)
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        """
+        Stores a tuple of arrays under key and returns the stored, read-only copies.
+        """
+        stored = []
+        for array in result:
+            array = np.array(array, copy=True)
+            array.setflags(write=False)
+            stored.append(array)
+        stored = tuple(stored)
+        with self.lock:
+            self._remember(key, stored)
+            if self.directory is not None:
+                self._store(key, stored)
+        return stored
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached result for key, or computes, stores and returns it.
+
+        Parameters:
+            key (str): A content key.
+            compute (callable): Returns the result as a tuple of arrays; only called on a miss.
+
+        Returns:
+            tuple of np.ndarray: The result, read-only.
+        """
+        result = self.get(key)
+        if result is None:
+            result = self.put(key, compute())
+        return result
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'miss_rate': self.misses / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+        }
+
+#__main__#
+
+if __name__ == "__main__":
+    import tempfile
+
+    import jacobi_engines
+    from pca_engine import PCA
+
+    def classical_jacobi(A, cache=None):
+        # what CPU_ExecutionTime_MM_EVD.classical_jacobian(A, cache=cache) does
+        if cache is None:
+            return jacobi_engines.classical_jacobi(A)
+        return cache.get_or_compute(cache.key(A, 'classical_jacobi', 1e-12, None),
+                                    lambda: jacobi_engines.classical_jacobi(A))
+
+    # Replayed windows: 200 requests over 20 distinct covariance matrices, as several consumers
+    # asking for the same feature sets would produce
+    rng = np.random.default_rng(0)
+    d, distinct, requests = 24, 20, 200
+    windows = [np.cov(rng.standard_normal((4 * d, d)), rowvar=False) for _ in range(distinct)]
+    order = rng.integers(0, distinct, requests)
+
+    start = time.perf_counter()
+    for i in order:
+        classical_jacobi(windows[i])
+    t_plain = time.perf_counter() - start
+
+    cache = EigenCache()
+    start = time.perf_counter()
+    for i in order:
+        classical_jacobi(windows[i], cache=cache)
+    t_cached = time.perf_counter() - start
+    stats = cache.stats()
+    print(f"Classical Jacobi on {requests} requests over {distinct} matrices of {d}x{d}: "
+          f"{t_plain:.2f} s uncached, {t_cached:.2f} s cached ({t_plain / t_cached:.1f}x), "
+          f"hit rate {stats['hit_rate']:.0%}")
+
+    # A budget of a third of the entries keeps the most recent ones
+    entry = d * 8 + d * d * 8
+    small = EigenCache(max_bytes=distinct // 3 * entry)
+    for i in order:
+        classical_jacobi(windows[i], cache=small)
+    stats = small.stats()
+    print(f"Budget of {distinct // 3} entries: hit rate {stats['hit_rate']:.0%}, {stats['evictions']} evictions, "
+          f"{stats['bytes'] / 2**10:.0f} KiB held")
+
+    # The disk tier survives the process: a new cache on the same directory starts warm
+    with tempfile.TemporaryDirectory() as directory:
+        warm = EigenCache(directory=directory)
+        for window in windows:
+            classical_jacobi(window, cache=warm)
+        replay = EigenCache(directory=directory)
+        start = time.perf_counter()
+        for i in order:
+            eigenvalues, V = classical_jacobi(windows[i], cache=replay)
+        t_replay = time.perf_counter() - start
+        stats = replay.stats()
+        print(f"New process on the same directory: {t_replay * 1e3:.1f} ms, {stats['disk_hits']} disk hits "
+              f"(returned as {type(V).__name__}), {stats['hits']} memory hits, {stats['misses']} misses")
+
+    # PCA refits on the same data skip the eigensolver
+    X = rng.standard_normal((2000, 48))
+    pca = PCA(backend='jacobi', cache=EigenCache())
+    for _ in range(3):
+        pca.fit(X)
+        print(f"PCA fit, jacobi backend: eigensolver {pca.timings_['eigensolver'] * 1e3:7.2f} ms")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        content_key(windows[0], 'classical_jacobi', 1e-12)
+    print(f"Key of a {d}x{d} float64 matrix: {(time.perf_counter() - start) * 1e3:.1f} us")
@@ -0,0 +1,476 @@
+# The below code implements a bit-accurate golden model of the fixed-point datapath in src/
+# Every function works on whole arrays of raw bit patterns, so randomized vectors can be checked against the RTL in bulk
+
+import functools
+import time
+
+import numpy as np
+
+class QFormat:
+    """
+    A binary fixed-point format.
+
+    Attributes:
+        int_bits (int): Number of integer bits, excluding the sign bit.
+        frac_bits (int): Number of fractional bits.
+        signed (bool): True for two's complement, False for unsigned.
+        width (int): Total word width in bits.
+    """
+    def __init__(self, int_bits, frac_bits, signed=False):
+        self.int_bits = int_bits
+        self.frac_bits = frac_bits
+        self.signed = signed
+        self.width = int(signed) + int_bits + frac_bits
+
+    @property
+    def min_code(self):
+        return -(1 << (self.width - 1)) if self.signed else 0
+
+    @property
+    def max_code(self):
+        return (1 << (self.width - 1)) - 1 if self.signed else (1 << self.width) - 1
+
+    def __repr__(self):
+        return f"QFormat(int_bits={self.int_bits}, frac_bits={self.frac_bits}, signed={self.signed})"
+
+# Q(3, 5) operands of FP_Mul.sv and the systolic arrays, 0x20 is 1.0
+Q3_5 = QFormat(3, 5, signed=False)
+# Xilinx CORDIC 8-bit signed fraction (1QN) used for the arctan inputs and the sin/cos outputs, 0x40 is 1.0
+Q1_6 = QFormat(1, 6, signed=True)
+# Xilinx CORDIC 8-bit phase in radians (2QN)
+PHASE_Q2_5 = QFormat(2, 5, signed=True)
+
+def apply_overflow(codes, fmt, overflow='wrap'):
+    """
+    Brings integer codes back into the range of a format.
+
+    Parameters:
+        codes (np.ndarray): Integer codes, possibly out of range.
+        fmt (QFormat): The target format.
+        overflow (str, optional): 'wrap' drops the upper bits like a fixed-width register,
+                                  'saturate' clamps to the representable range. Defaults to 'wrap'.
+
+    Returns:
+        np.ndarray: int64 codes within [fmt.min_code, fmt.max_code].
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    if overflow == 'saturate':
+        return np.clip(codes, fmt.min_code, fmt.max_code)
+    if overflow != 'wrap':
+        raise ValueError(f"Unknown overflow mode: {overflow}")
+    return from_bits(codes, fmt)
+
+def from_bits(bits, fmt):
+    """
+    Interprets raw bit patterns as codes of a format.
+
+    Parameters:
+        bits (np.ndarray): Raw register contents, only the lower fmt.width bits are used.
+        fmt (QFormat): The format of the register.
+
+    Returns:
+        np.ndarray: int64 codes, negative for signed formats with the sign bit set.
+    """
+    bits = np.asarray(bits, dtype=np.int64) & ((1 << fmt.width) - 1)
+    if fmt.signed:
+        bits = np.where(bits >= (1 << (fmt.width - 1)), bits - (1 << fmt.width), bits)
+    return bits
+
+def to_bits(codes, fmt):
+    """
+    Converts codes of a format to the raw bit patterns stored in a register.
+
+    Parameters:
+        codes (np.ndarray): int codes of the format.
+        fmt (QFormat): The format of the register.
+
+    Returns:
+        np.ndarray: uint8/uint16/uint32/uint64 raw bit patterns, depending on the width.
+    """
+    dtype = np.min_scalar_type((1 << fmt.width) - 1)
+    return (np.asarray(codes, dtype=np.int64) & ((1 << fmt.width) - 1)).astype(dtype)
+
+def to_fixed(x, fmt, rounding='truncate', overflow='saturate'):
+    """
+    Quantizes real values to codes of a fixed-point format.
+
+    Parameters:
+        x (array-like): Real values.
+        fmt (QFormat): The target format.
+        rounding (str, optional): 'truncate' (floor, as the RTL does) or 'nearest'. Defaults to 'truncate'.
+        overflow (str, optional): 'saturate' or 'wrap'. Defaults to 'saturate'.
+
+    Returns:
+        np.ndarray: int64 codes.
+    """
+    scaled = np.asarray(x, dtype=np.float64) * (1 << fmt.frac_bits)
+    if rounding == 'truncate':
+        scaled = np.floor(scaled)
+    elif rounding == 'nearest':
+        scaled = np.floor(scaled + 0.5)
+    else:
+        raise ValueError(f"Unknown rounding mode: {rounding}")
+    limit = float(1 << 62)
+    return apply_overflow(np.clip(scaled, -limit, limit).astype(np.int64), fmt, overflow)
+
+def to_float(codes, fmt):
+    """
+    Converts codes of a fixed-point format to real values.
+
+    Parameters:
+        codes (np.ndarray): int codes of the format.
+        fmt (QFormat): The format of the codes.
+
+    Returns:
+        np.ndarray: float64 values.
+    """
+    return np.asarray(codes, dtype=np.float64) / (1 << fmt.frac_bits)
+
+def fp_mul(a, b, fmt=Q3_5, overflow='wrap'):
+    """
+    Models fixed_point_multiplier (FP_Mul.sv).
+
+    The full double-width product is formed and bits [2F+I : F] are kept, i.e. the product
+    is truncated by F fractional bits and the upper bits are dropped (or clamped).
+
+    Parameters:
+        a (np.ndarray): Raw bit patterns of the multiplicand.
+        b (np.ndarray): Raw bit patterns of the multiplier.
+        fmt (QFormat, optional): Format of both operands and of the product. Defaults to Q3_5.
+        overflow (str, optional): 'wrap' as in the RTL, or 'saturate'. Defaults to 'wrap'.
+
+    Returns:
+        np.ndarray: Raw bit patterns of the product.
+    """
+    product = from_bits(a, fmt) * from_bits(b, fmt)
+    return to_bits(apply_overflow(product >> fmt.frac_bits, fmt, overflow), fmt)
+
+def mac_unit(acc, a, b, fmt=Q3_5, overflow='wrap'):
+    """
+    Models one negedge update of mac_unit.sv: out_sum <= fp_prod + out_sum.
+
+    Parameters:
+        acc (np.ndarray): Raw bit patterns of the accumulator.
+        a (np.ndarray): Raw bit patterns of in_a.
+        b (np.ndarray): Raw bit patterns of in_b.
+        fmt (QFormat, optional): Format of the operands and accumulator. Defaults to Q3_5.
+        overflow (str, optional): 'wrap' as in the RTL, or 'saturate'. Defaults to 'wrap'.
+
+    Returns:
+        np.ndarray: Raw bit patterns of the updated accumulator.
+    """
+    total = from_bits(acc, fmt) + from_bits(fp_mul(a, b, fmt, overflow), fmt)
+    return to_bits(apply_overflow(total, fmt, overflow), fmt)
+
+def fixed_matmul(A, B, fmt=Q3_5, overflow='wrap'):
+    """
+    Models matrix_multiply.sv: every output cell is a MAC accumulating truncated products.
+
+    Leading dimensions are broadcast, so a whole batch of matrices goes through at once.
+    The accumulation runs over k in the order the operands stream through the array.
+
+    Parameters:
+        A (np.ndarray): Raw bit patterns, shape (..., n, k).
+        B (np.ndarray): Raw bit patterns, shape (..., k, m).
+        fmt (QFormat, optional): Format of the operands and results. Defaults to Q3_5.
+        overflow (str, optional): 'wrap' as in the RTL, or 'saturate'. Defaults to 'wrap'.
+
+    Returns:
+        np.ndarray: Raw bit patterns of the product, shape (..., n, m).
+    """
+    A = from_bits(A, fmt)
+    B = from_bits(B, fmt)
+    shape = np.broadcast_shapes(A.shape[:-2], B.shape[:-2]) + (A.shape[-2], B.shape[-1])
+    acc = np.zeros(shape, dtype=np.int64)
+    for k in range(A.shape[-1]):
+        product = apply_overflow((A[..., :, k, None] * B[..., None, k, :]) >> fmt.frac_bits, fmt, overflow)
+        acc = acc + product
+        if overflow == 'saturate':
+            acc = apply_overflow(acc, fmt, overflow)
+    return to_bits(apply_overflow(acc, fmt, overflow), fmt)
+
+@functools.lru_cache(maxsize=None)
+def _angle_table(iterations, frac_bits):
+    # arctan(2^-i) for every micro-rotation, the constants stored next to the CORDIC; shared, so read-only
+    table = np.round(np.arctan(2.0 ** -np.arange(iterations)) * (1 << frac_bits)).astype(np.int64)
+    table.setflags(write=False)
+    return table
+
+@functools.lru_cache(maxsize=None)
+def _cordic_gain(iterations):
+    return float(np.prod(1.0 / np.sqrt(1.0 + 2.0 ** (-2.0 * np.arange(iterations)))))
+
+def cordic_arctan(y, x, in_fmt=Q1_6, out_fmt=PHASE_Q2_5, iterations=None, guard_bits=6):
+    """
+    Computes atan2(y, x) with a shift-add CORDIC in vectoring mode.
+
+    The inputs are moved to the right half plane by a rotation of pi, then driven onto
+    the x axis with one micro-rotation per iteration; all arithmetic is integer with
+    arithmetic right shifts and a rounded arctangent table, and the accumulated
+    phase is truncated to the output format. atan2(0, 0) returns 0.
+
+    Parameters:
+        y (np.ndarray): Raw bit patterns of the Y (imaginary) input.
+        x (np.ndarray): Raw bit patterns of the X (real) input.
+        in_fmt (QFormat, optional): Format of x and y. Defaults to Q1_6.
+        out_fmt (QFormat, optional): Format of the phase. Defaults to PHASE_Q2_5.
+        iterations (int, optional): Micro-rotations, defaults to the output width.
+        guard_bits (int, optional): Extra fractional bits carried internally. Defaults to 6.
+
+    Returns:
+        np.ndarray: Raw bit patterns of the phase in radians.
+    """
+    iterations = out_fmt.width if iterations is None else iterations
+    zf = out_fmt.frac_bits + guard_bits
+    angles = _angle_table(iterations, zf)
+    pi = int(np.floor(np.pi * (1 << zf)))
+
+    xi = from_bits(x, in_fmt) << guard_bits
+    yi = from_bits(y, in_fmt) << guard_bits
+    left = xi < 0
+    origin = (xi == 0) & (yi == 0)
+    z = np.where(left, np.where(yi >= 0, pi, -pi), 0).astype(np.int64)
+    xi = np.where(left, -xi, xi)
+    yi = np.where(left, -yi, yi)
+
+    for i in range(iterations):
+        up = yi >= 0
+        xs, ys = xi >> i, yi >> i
+        xi, yi = np.where(up, xi + ys, xi - ys), np.where(up, yi - xs, yi + xs)
+        z = np.where(up, z + angles[i], z - angles[i])
+
+    z = np.where(origin, 0, z)
+    return to_bits(apply_overflow(z >> guard_bits, out_fmt, 'saturate'), out_fmt)
+
+def cordic_sincos(phase, in_fmt=PHASE_Q2_5, out_fmt=Q1_6, iterations=None, guard_bits=6):
+    """
+    Computes cos and sin of a phase with a shift-add CORDIC in rotation mode.
+
+    Phases outside [-pi/2, pi/2] are folded by pi and the results negated; the vector
+    starts at (1/K, 0) so the CORDIC gain is pre-compensated, and the outputs are
+    truncated to the output format.
+
+    Parameters:
+        phase (np.ndarray): Raw bit patterns of the phase in radians.
+        in_fmt (QFormat, optional): Format of the phase. Defaults to PHASE_Q2_5.
+        out_fmt (QFormat, optional): Format of cos and sin. Defaults to Q1_6.
+        iterations (int, optional): Micro-rotations, defaults to the output width.
+        guard_bits (int, optional): Extra fractional bits carried internally. Defaults to 6.
+
+    Returns:
+        np.ndarray: Raw bit patterns of the cosine.
+        np.ndarray: Raw bit patterns of the sine.
+    """
+    iterations = out_fmt.width if iterations is None else iterations
+    zf = in_fmt.frac_bits + guard_bits
+    xf = out_fmt.frac_bits + guard_bits
+    angles = _angle_table(iterations, zf)
+    pi = int(np.floor(np.pi * (1 << zf)))
+    half_pi = pi >> 1
+
+    z = from_bits(phase, in_fmt) << guard_bits
+    fold = np.abs(z) > half_pi
+    z = np.where(z > half_pi, z - pi, np.where(z < -half_pi, z + pi, z))
+    xi = np.full(z.shape, int(np.floor(_cordic_gain(iterations) * (1 << xf))), dtype=np.int64)
+    yi = np.zeros(z.shape, dtype=np.int64)
+
+    for i in range(iterations):
+        ccw = z >= 0
+        xs, ys = xi >> i, yi >> i
+        xi, yi = np.where(ccw, xi - ys, xi + ys), np.where(ccw, yi + xs, yi - xs)
+        z = np.where(ccw, z - angles[i], z + angles[i])
+
+    xi = np.where(fold, -xi, xi) >> guard_bits
+    yi = np.where(fold, -yi, yi) >> guard_bits
+    return (to_bits(apply_overflow(xi, out_fmt, 'saturate'), out_fmt),
+            to_bits(apply_overflow(yi, out_fmt, 'saturate'), out_fmt))
+
+def inv_tan(c_pq, c_pp, c_qq, iterations=None, guard_bits=6):
+    """
+    Models inv_tan.sv, stage 1 of the CORDIC engine.
+
+    numerator = 2 * c_pq and denominator = c_pp - c_qq are 8-bit wrapping registers and are
+    packed as {denominator, numerator}. The arctan IP takes X from the low byte and Y from the
+    high byte of s_axis_cartesian_tdata, so as wired it computes atan2(denominator, numerator).
+
+    Parameters:
+        c_pq (np.ndarray): Raw bytes of the pivot element.
+        c_pp (np.ndarray): Raw bytes of the diagonal element at p.
+        c_qq (np.ndarray): Raw bytes of the diagonal element at q.
+        iterations (int, optional): CORDIC micro-rotations. Defaults to the output width.
+        guard_bits (int, optional): Extra internal fractional bits. Defaults to 6.
+
+    Returns:
+        np.ndarray: Raw bytes of output_arctan_data.
+    """
+    c_pq, c_pp, c_qq = (np.asarray(v, dtype=np.int64) for v in (c_pq, c_pp, c_qq))
+    numerator = (2 * c_pq) & 0xFF
+    denominator = (c_pp - c_qq) & 0xFF
+    return cordic_arctan(denominator, numerator, iterations=iterations, guard_bits=guard_bits)
+
+def divider_shifter(phase):
+    """
+    Models divider_shifter.sv: an unsigned (logical) right shift of the 8-bit phase.
+
+    Parameters:
+        phase (np.ndarray): Raw bytes of the arctan output.
+
+    Returns:
+        np.ndarray: Raw bytes of the halved phase.
+    """
+    return (np.asarray(phase).astype(np.uint8) >> 1).astype(np.uint8)
+
+def sin_cos(phase, iterations=None, guard_bits=6):
+    """
+    Models sin_cos.sv around the Xilinx sine/cosine IP.
+
+    The IP places the cosine in the low byte and the sine in the high byte of m_axis_dout_tdata;
+    the RTL assigns [15:8] to output_cosine_data and [7:0] to output_sine_data, and this model
+    returns the ports as wired.
+
+    Parameters:
+        phase (np.ndarray): Raw bytes of input_phase_data.
+        iterations (int, optional): CORDIC micro-rotations. Defaults to the output width.
+        guard_bits (int, optional): Extra internal fractional bits. Defaults to 6.
+
+    Returns:
+        np.ndarray: Raw bytes of output_cosine_data.
+        np.ndarray: Raw bytes of output_sine_data.
+    """
+    cos, sin = cordic_sincos(phase, iterations=iterations, guard_bits=guard_bits)
+    return sin, cos
+
+def cordic_engine(c_pq, c_pp, c_qq, iterations=None, guard_bits=6):
+    """
+    Models top_CORDIC (cordic_engine.sv): inv_tan -> divider_shifter -> sin_cos.
+
+    Parameters:
+        c_pq (np.ndarray): Raw bytes of the pivot element.
+        c_pp (np.ndarray): Raw bytes of the diagonal element at p.
+        c_qq (np.ndarray): Raw bytes of the diagonal element at q.
+        iterations (int, optional): CORDIC micro-rotations. Defaults to the output width.
+        guard_bits (int, optional): Extra internal fractional bits. Defaults to 6.
+
+    Returns:
+        np.ndarray: Raw bytes of output_cosine_data.
+        np.ndarray: Raw bytes of output_sine_data.
+    """
+    phase = divider_shifter(inv_tan(c_pq, c_pp, c_qq, iterations, guard_bits))
+    return sin_cos(phase, iterations, guard_bits)
+
+def data_query_engine(C):
+    """
+    Models the pivot search of data_query_engine.sv on a batch of matrices.
+
+    Elements are compared as unsigned bytes over all off-diagonal positions in row-major
+    order and the first maximum wins.
+
+    Parameters:
+        C (np.ndarray): Raw bytes, shape (..., n, n).
+
+    Returns:
+        np.ndarray: p indices.
+        np.ndarray: q indices.
+        np.ndarray: Raw bytes of c_pq.
+        np.ndarray: Raw bytes of c_pp.
+        np.ndarray: Raw bytes of c_qq.
+    """
+    C = np.asarray(C, dtype=np.int64)
+    n = C.shape[-1]
+    flat = np.where(np.eye(n, dtype=bool), -1, C).reshape(C.shape[:-2] + (n * n,))
+    index = np.argmax(flat, axis=-1)
+    p, q = index // n, index % n
+    take = lambda i, j: np.take_along_axis(C.reshape(flat.shape), (i * n + j)[..., None], axis=-1)[..., 0]
+    return p, q, take(p, q), take(p, p), take(q, q)
+
+def givens_matrix(p, q, cos_data, sin_data, n=4, fmt=Q3_5):
+    """
+    Builds the Givens matrix the way controller_givensmatrix.sv writes it over the identity BRAM.
+
+    Row p holds cos at column p and sin at column q, row q holds -sin at column p and cos
+    at column q; every other entry is the identity loaded from ip.coe.
+
+    Parameters:
+        p (np.ndarray): Row indices, shape (...).
+        q (np.ndarray): Column indices, shape (...).
+        cos_data (np.ndarray): Raw bytes of the cosine, shape (...).
+        sin_data (np.ndarray): Raw bytes of the sine, shape (...).
+        n (int, optional): Matrix dimension. Defaults to 4.
+        fmt (QFormat, optional): Format of the identity entries. Defaults to Q3_5.
+
+    Returns:
+        np.ndarray: Raw bytes, shape (..., n, n).
+    """
+    p, q, cos_data, sin_data = np.broadcast_arrays(*(np.asarray(v, dtype=np.int64) for v in (p, q, cos_data, sin_data)))
+    G = np.broadcast_to(np.eye(n, dtype=np.int64) << fmt.frac_bits, p.shape + (n, n)).copy()
+    batch = np.indices(p.shape)
+    G[(*batch, p, p)] = cos_data
+    G[(*batch, p, q)] = sin_data
+    G[(*batch, q, p)] = -sin_data
+    G[(*batch, q, q)] = cos_data
+    return to_bits(G, fmt)
+
+def givens_update(C, V, cos_data, sin_data, p, q, fmt=Q3_5, overflow='wrap'):
+    """
+    Models the rotation unit of top.sv: TPU-1 computes R^T C, TPU-2 (R^T C) R and TPU-3 V R.
+
+    Parameters:
+        C (np.ndarray): Raw bytes of the covariance matrices, shape (..., n, n).
+        V (np.ndarray): Raw bytes of the eigenvector matrices, shape (..., n, n).
+        cos_data (np.ndarray): Raw bytes of the cosine, shape (...).
+        sin_data (np.ndarray): Raw bytes of the sine, shape (...).
+        p (np.ndarray): Pivot rows, shape (...).
+        q (np.ndarray): Pivot columns, shape (...).
+        fmt (QFormat, optional): Format of the matrices. Defaults to Q3_5.
+        overflow (str, optional): 'wrap' as in the RTL, or 'saturate'. Defaults to 'wrap'.
+
+    Returns:
+        np.ndarray: Raw bytes of the rotated covariance matrices.
+        np.ndarray: Raw bytes of the updated eigenvector matrices.
+    """
+    R = givens_matrix(p, q, cos_data, sin_data, n=np.shape(C)[-1], fmt=fmt)
+    RT = np.swapaxes(R, -1, -2)
+    C_next = fixed_matmul(fixed_matmul(RT, C, fmt, overflow), R, fmt, overflow)
+    V_next = fixed_matmul(V, R, fmt, overflow)
+    return C_next, V_next
+
+def jacobi_step(C, V, iterations=None, guard_bits=6, overflow='wrap'):
+    """
+    Runs one Jacobian-unit iteration (pivot search, CORDIC, Givens rotation) on a batch of matrices.
+
+    Parameters:
+        C (np.ndarray): Raw bytes of the covariance matrices, shape (..., n, n).
+        V (np.ndarray): Raw bytes of the eigenvector matrices, shape (..., n, n).
+        iterations (int, optional): CORDIC micro-rotations. Defaults to the output width.
+        guard_bits (int, optional): Extra internal CORDIC fractional bits. Defaults to 6.
+        overflow (str, optional): 'wrap' as in the RTL, or 'saturate'. Defaults to 'wrap'.
+
+    Returns:
+        np.ndarray: Raw bytes of the rotated covariance matrices.
+        np.ndarray: Raw bytes of the updated eigenvector matrices.
+    """
+    p, q, c_pq, c_pp, c_qq = data_query_engine(C)
+    cos_data, sin_data = cordic_engine(c_pq, c_pp, c_qq, iterations, guard_bits)
+    return givens_update(C, V, cos_data, sin_data, p, q, overflow=overflow)
+
+#__main__#
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+
+    # Randomized throughput of the CORDIC engine
+    vectors = 1_000_000
+    c_pq, c_pp, c_qq = rng.integers(0, 256, (3, vectors))
+    start = time.perf_counter()
+    cordic_engine(c_pq, c_pp, c_qq)
+    elapsed = time.perf_counter() - start
+    print(f"CORDIC engine: {vectors} vectors in {elapsed:.3f} s ({vectors / elapsed / 1e6:.2f} M vectors/s)")
+
+    # Randomized throughput of a full Jacobian-unit iteration on 4x4 matrices
+    batch = 100_000
+    C = rng.integers(0, 256, (batch, 4, 4)).astype(np.uint8)
+    V = np.broadcast_to(np.eye(4, dtype=np.uint8) << 5, C.shape)
+    start = time.perf_counter()
+    jacobi_step(C, V)
+    elapsed = time.perf_counter() - start
+    print(f"Jacobi step: {batch} matrices in {elapsed:.3f} s ({batch / elapsed / 1e6:.2f} M matrices/s)")
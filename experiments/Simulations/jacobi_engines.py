@@ -0,0 +1,376 @@
+# The below code implements the eigenvalue decomposition engines used by the benchmarking scripts
+# The engines apply Givens rotations in place, mirroring the rotation unit of the RTL
+
+import time
+
+import numpy as np
+
+import tracing
+
+def _row_max_off_diagonal(A, rows):
+    """
+    Computes the largest strictly-upper-triangular element of the given rows.
+
+    Parameters:
+        A (np.ndarray): The square matrix being diagonalised.
+        rows (np.ndarray): Indices of the rows to be scanned.
+
+    Returns:
+        np.ndarray: The largest absolute value to the right of the diagonal for each row.
+        np.ndarray: The column index of that value (first occurrence on ties).
+    """
+    n = A.shape[0]
+    rows = np.asarray(rows)
+    mask = np.arange(n)[None, :] > rows[:, None]
+    values = np.where(mask, np.abs(A[rows, :]), -1.0)
+    cols = np.argmax(values, axis=1)
+    return values[np.arange(len(rows)), cols], cols
+
+# one row per iteration: rotations (classical_jacobi) or sweeps (parallel_jacobi)
+TRACE_DTYPE = np.dtype([('iteration', np.int64), ('off_norm', np.float64), ('pivot', np.float64),
+                        ('rotations', np.int64), ('time', np.float64)])
+
+class JacobiTrace:
+    """
+    Instrumentation hook recording the progress of a Jacobi solver into a compact array.
+
+    Pass an instance as trace= to classical_jacobi or parallel_jacobi; the solver calls it once
+    per iteration with the relative off-diagonal norm, the pivot magnitude, the rotations done
+    so far and the seconds since the solver started. Rows are stored in a preallocated
+    structured array of TRACE_DTYPE that doubles when full.
+
+    Attributes:
+        every (int): Record only every this many iterations (the final one is always recorded).
+        records (np.ndarray): The recorded rows, TRACE_DTYPE.
+
+    Methods:
+        __call__(iteration, off_norm, pivot, rotations, seconds, final=False): Records one iteration.
+    """
+    def __init__(self, every=1, capacity=1024):
+        self.every = every
+        self._rows = np.empty(capacity, dtype=TRACE_DTYPE)
+        self._size = 0
+
+    def __call__(self, iteration, off_norm, pivot, rotations, seconds, final=False):
+        if iteration % self.every and not final:
+            return
+        if final and self._size and self._rows[self._size - 1]['iteration'] == iteration:
+            # the last iteration was recorded already, the final call refreshes it
+            self._size -= 1
+        if self._size == len(self._rows):
+            self._rows = np.concatenate([self._rows, np.empty_like(self._rows)])
+        self._rows[self._size] = (iteration, off_norm, pivot, rotations, seconds)
+        self._size += 1
+
+    @property
+    def records(self):
+        return self._rows[:self._size]
+
+    def __len__(self):
+        return self._size
+
+@tracing.traced('jacobi.classical')
+def classical_jacobi(A, tol=1e-12, max_iter=None, V0=None, pivot_tol=0.0, trace=None):
+    """
+    Performs the Classical Jacobi method with cached pivot search and in-place rotations.
+
+    Every row keeps the magnitude and column of its largest element right of the
+    diagonal, so the pivot is found with an O(n) scan of the cache. A rotation only
+    touches rows and columns p and q, hence only those two rows are rescanned, plus
+    any row whose cached maximum sat in column p or q and has shrunk. The rotation
+    itself updates two rows and two columns of A and two columns of V, in the same
+    order as J.T @ A @ J and V @ J, so the result matches the dense formulation.
+
+    The iteration stops when the off-diagonal Frobenius norm drops to tol times the
+    Frobenius norm of A. A rotation annihilating a_pq lowers the squared off-norm by
+    exactly 2 a_pq^2, so the norm is tracked in O(1) per rotation and recomputed once
+    every n(n-1)/2 rotations, whenever it has fallen a millionfold since the last recomputation
+    (below that the subtraction cancels), and before stopping.
+
+    Parameters:
+        A (np.ndarray): A symmetric matrix for which eigenvalues and eigenvectors are to be computed.
+        tol (float, optional): Relative off-diagonal norm at which the iteration stops, raised to the
+                               rounding floor n * eps if smaller. Defaults to 1e-12.
+        max_iter (int, optional): The maximum number of rotations. Defaults to no limit.
+        V0 (np.ndarray, optional): Orthogonal starting basis, e.g. the eigenvectors of a previous,
+                                   similar matrix. The rotations then run on V0.T @ A @ V0, which
+                                   is already nearly diagonal. Defaults to the identity.
+        pivot_tol (float, optional): Also stop once the largest off-diagonal magnitude is below
+                                     this absolute value. Defaults to 0.0.
+        trace (callable, optional): Called after every rotation as
+                                    trace(iteration, off_norm, pivot, rotations, seconds, final),
+                                    with off_norm relative to the norm of A; see JacobiTrace.
+
+    Returns:
+        np.ndarray: A 1D array containing the eigenvalues of the matrix.
+        np.ndarray: A matrix whose columns are the eigenvectors corresponding to the eigenvalues.
+    """
+    start = time.perf_counter()
+    A = np.array(A, dtype=np.float64)
+    if not np.all(np.isfinite(A)):
+        raise ValueError("The matrix contains NaN or infinite values")
+    # the rotations only annihilate symmetric pairs, on any other matrix the pivot never vanishes;
+    # the check is relative to the largest entry, so it holds at any scale, and loose enough for
+    # float32 products such as X.T @ X
+    if A.ndim != 2 or A.shape[0] != A.shape[1]:
+        raise ValueError("The matrix must be square and symmetric")
+    if A.size and np.abs(A - A.T).max() > 1e-5 * np.abs(A).max():
+        raise ValueError("The matrix must be square and symmetric")
+    n = A.shape[0]
+    if V0 is None:
+        V = np.eye(n)
+    else:
+        V = np.array(V0, dtype=np.float64)
+        A = V.T @ A @ V
+    if n < 2:
+        return np.diag(A).copy(), V
+
+    scale = max(np.linalg.norm(A), np.finfo(np.float64).tiny)
+    tol = max(tol, n * np.finfo(np.float64).eps)
+    off_sq = synced = off_norm(A) ** 2
+    resync = n * (n - 1) // 2
+    rotations = 0
+
+    # the last row has nothing right of the diagonal, it never wins the pivot search
+    row_max = np.full(n, -1.0)
+    row_arg = np.zeros(n, dtype=np.intp)
+    row_max[:-1], row_arg[:-1] = _row_max_off_diagonal(A, np.arange(n - 1))
+
+    while max_iter is None or rotations < max_iter:
+        p = int(np.argmax(row_max))
+        q = int(row_arg[p])
+        max_val = row_max[p]
+
+        if off_sq <= (tol * scale) ** 2 or off_sq < 1e-6 * synced or rotations % resync == 0:
+            off_sq = synced = off_norm(A) ** 2
+        if off_sq <= (tol * scale) ** 2 or max_val <= pivot_tol:
+            break
+
+        phi = 0.5 * np.arctan2(2 * A[p, q], A[q, q] - A[p, p])
+        c, s = np.cos(phi), np.sin(phi)
+
+        # rows first (J.T @ A), then columns ((J.T @ A) @ J)
+        row_p = A[p, :].copy()
+        A[p, :] = c * row_p - s * A[q, :]
+        A[q, :] = s * row_p + c * A[q, :]
+        col_p = A[:, p].copy()
+        A[:, p] = c * col_p - s * A[:, q]
+        A[:, q] = s * col_p + c * A[:, q]
+
+        col_p = V[:, p].copy()
+        V[:, p] = c * col_p - s * V[:, q]
+        V[:, q] = s * col_p + c * V[:, q]
+
+        rotations += 1
+        off_sq = max(off_sq - 2.0 * max_val * max_val, 0.0)
+        if trace is not None:
+            trace(rotations, np.sqrt(off_sq) / scale, max_val, rotations, time.perf_counter() - start)
+
+        # rows whose cached maximum lived in column p or q may have lost it
+        stale = (row_arg == p) | (row_arg == q)
+        stale[[p, q]] = True
+        stale[n - 1] = False
+
+        # every other row only needs its two changed entries compared against the cache
+        for col in (p, q):
+            upper = np.arange(col)
+            upper = upper[~stale[upper]]
+            new_vals = np.abs(A[upper, col])
+            better = (new_vals > row_max[upper]) | ((new_vals == row_max[upper]) & (col < row_arg[upper]))
+            row_max[upper[better]] = new_vals[better]
+            row_arg[upper[better]] = col
+
+        rescan = np.flatnonzero(stale)
+        if rescan.size:
+            row_max[rescan], row_arg[rescan] = _row_max_off_diagonal(A, rescan)
+
+    if trace is not None:
+        trace(rotations, off_norm(A) / scale, max(row_max.max(), 0.0), rotations, time.perf_counter() - start, final=True)
+    tracing.count('jacobi.rotations', rotations)
+    return np.diag(A).copy(), V
+
+def off_norm(A):
+    """
+    Computes the Frobenius norm of the off-diagonal part of a square matrix.
+
+    Parameters:
+        A (np.ndarray): The square matrix.
+
+    Returns:
+        float: sqrt(sum of squares of all elements not on the diagonal).
+    """
+    off = A.copy()
+    np.fill_diagonal(off, 0.0)
+    return float(np.linalg.norm(off))
+
+def _rotation_params(a_pp, a_qq, a_pq):
+    """
+    Computes the cosine and sine of the Jacobi rotations for a batch of pivots.
+
+    The angle follows the convention of classical_jacobi, tan(2 phi) = 2 a_pq / (a_qq - a_pp),
+    evaluated through the numerically stable tangent of the smaller root.
+
+    Parameters:
+        a_pp (np.ndarray): Diagonal elements at (p, p).
+        a_qq (np.ndarray): Diagonal elements at (q, q).
+        a_pq (np.ndarray): Off-diagonal elements at (p, q).
+
+    Returns:
+        np.ndarray: Cosines of the rotation angles.
+        np.ndarray: Sines of the rotation angles.
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        tau = (a_qq - a_pp) / (2.0 * a_pq)
+        t = np.where(tau >= 0, 1.0, -1.0) / (np.abs(tau) + np.sqrt(1.0 + tau * tau))
+    t = np.where((a_pq == 0) | ~np.isfinite(t), 0.0, t)
+    c = 1.0 / np.sqrt(1.0 + t * t)
+    return c, t * c
+
+def _rotate_pairs(first, second, c, s, buf, tmp=None):
+    """
+    Applies a batch of plane rotations in place to paired slices of an array.
+
+    Parameters:
+        first (np.ndarray): View holding the p elements of every pair (rows or columns).
+        second (np.ndarray): View holding the matching q elements.
+        c (np.ndarray): Cosines, broadcastable against the views.
+        s (np.ndarray): Sines, broadcastable against the views.
+        buf (np.ndarray): Scratch array with the shape of the views.
+        tmp (np.ndarray, optional): Second scratch array of that shape; when given, the
+                                    rotation allocates no temporaries.
+    """
+    np.multiply(first, c, out=buf)
+    if tmp is None:
+        buf -= s * second
+        second *= c
+        second += s * first
+    else:
+        buf -= np.multiply(s, second, out=tmp)
+        second *= c
+        second += np.multiply(s, first, out=tmp)
+    first[...] = buf
+
+def _advance_ring(M, axis):
+    """
+    Moves the round-robin table by one seat: ring order [0, 1, ..., m-1] becomes [0, m-1, 1, ..., m-2].
+
+    Parameters:
+        M (np.ndarray): Array stored in ring order along the given axis, modified in place.
+        axis (int): The axis in ring order, e.g. 0 to move rows and 1 to move columns.
+    """
+    M = np.moveaxis(M, axis, 0)
+    last = M[-1].copy()
+    M[2:] = M[1:-1]
+    M[1] = last
+
+@tracing.traced('jacobi.parallel')
+def parallel_jacobi(A, tol=1e-12, max_sweeps=None, V0=None, trace=None, angle_kernel=None):
+    """
+    Performs the cyclic Jacobi method with Brent-Luk parallel ordering.
+
+    The indices sit on a round-robin table stored as the row/column order of A, so in
+    every step index i is paired with index m-1-i (m is n padded to even with a zero
+    row and column). Each step therefore rotates n / 2 disjoint (p, q) pairs at once,
+    the way the rotation unit would drive several Givens matrices in parallel: the
+    angles are computed as one batch and applied to the mirrored halves of A and V as
+    whole-array operations, after which the table moves by one seat. Every pair meets
+    once in the m - 1 steps of a sweep and the only Python loop runs over those steps.
+
+    Parameters:
+        A (np.ndarray): A symmetric matrix for which eigenvalues and eigenvectors are to be computed.
+        tol (float, optional): Convergence threshold on the off-diagonal norm relative to
+                               the Frobenius norm of A. Defaults to 1e-12.
+        max_sweeps (int, optional): The maximum number of sweeps. Defaults to no limit; the
+                                    iteration also stops when a sweep no longer lowers the
+                                    off-diagonal norm, i.e. tol is below the rounding floor.
+        V0 (np.ndarray, optional): Orthogonal starting basis, e.g. the eigenvectors of a previous,
+                                   similar matrix. The sweeps then run on V0.T @ A @ V0, which
+                                   is already nearly diagonal. Defaults to the identity.
+        trace (callable, optional): Called after every sweep as
+                                    trace(sweep, off_norm, pivot, rotations, seconds, final),
+                                    with off_norm relative to the norm of A and pivot the largest
+                                    |a_pq| rotated in the sweep; see JacobiTrace.
+        angle_kernel (callable, optional): Computes (c, s) from (a_pp, a_qq, a_pq) for all pairs of
+                                           a step, e.g. a cordic_kernel.CordicKernel for the rounding
+                                           of the hardware. Defaults to the exact tangent formula.
+
+    Returns:
+        np.ndarray: A 1D array containing the eigenvalues of the matrix.
+        np.ndarray: A matrix whose columns are the eigenvectors corresponding to the eigenvalues.
+        dict: 'sweeps', the number of sweeps performed, and 'off_norms', the off-diagonal
+              norm before the first sweep and after every sweep.
+    """
+    start = time.perf_counter()
+    A = np.array(A, dtype=np.float64)
+    if not np.all(np.isfinite(A)):
+        raise ValueError("The matrix contains NaN or infinite values")
+    n = A.shape[0]
+    m = n + (n % 2)
+    Vt = np.eye(m)
+    if V0 is not None:
+        V0 = np.asarray(V0, dtype=np.float64)
+        A = V0.T @ A @ V0
+        Vt[:n, :n] = V0.T
+    if m != n:
+        A = np.pad(A, ((0, 1), (0, 1)))
+    h = m // 2
+    order = np.arange(m)
+    row_buf, col_buf = np.empty((h, m)), np.empty((m, h))
+    rotation_params = _rotation_params if angle_kernel is None else angle_kernel
+
+    scale = max(np.linalg.norm(A), np.finfo(np.float64).tiny)
+    off_norms = [off_norm(A)]
+    sweeps = 0
+
+    while (max_sweeps is None or sweeps < max_sweeps) and off_norms[-1] > tol * scale:
+        if sweeps and off_norms[-1] >= off_norms[-2]:
+            break
+        pivot = 0.0
+        with tracing.span('jacobi.sweep', n=n, sweep=sweeps + 1):
+            for _ in range(m - 1):
+                diag = np.diagonal(A)
+                pivots = np.diagonal(A[:h, h:][:, ::-1])
+                pivot = max(pivot, np.abs(pivots).max())
+                c, s = rotation_params(diag[:h], diag[h:][::-1], pivots)
+                cc, ss = c[:, None], s[:, None]
+
+                _rotate_pairs(A[:h], A[h:][::-1], cc, ss, row_buf)
+                _rotate_pairs(A[:, :h], A[:, h:][:, ::-1], c, s, col_buf)
+                _rotate_pairs(Vt[:h], Vt[h:][::-1], cc, ss, row_buf)
+
+                _advance_ring(A, 0)
+                _advance_ring(A, 1)
+                _advance_ring(Vt, 0)
+                order[1:] = np.roll(order[1:], 1)
+
+        sweeps += 1
+        off_norms.append(off_norm(A))
+        tracing.count('jacobi.rotations', h * (m - 1))
+        if trace is not None:
+            trace(sweeps, off_norms[-1] / scale, pivot, sweeps * h * (m - 1), time.perf_counter() - start)
+
+    if trace is not None:
+        trace(sweeps, off_norms[-1] / scale, 0.0 if sweeps == 0 else pivot, sweeps * h * (m - 1),
+              time.perf_counter() - start, final=True)
+    # undo the ring order and drop the padding
+    position = np.empty(m, dtype=np.intp)
+    position[order] = np.arange(m)
+    eigenvalues = np.diagonal(A)[position][:n].copy()
+    V = Vt[position].T[:n, :n].copy()
+    return eigenvalues, V, {'sweeps': sweeps, 'off_norms': np.array(off_norms)}
+
+#__main__#
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+
+    # What a rotation cap hides: 100 rotations against running to the relative tolerance
+    print(f"{'n':>5} {'rotations':>10} {'rel. off-norm':>14} {'time':>10}")
+    for n in (32, 64, 128):
+        X = rng.standard_normal((n, n))
+        C = X @ X.T / n
+        for max_iter in (100, None):
+            trace = JacobiTrace(every=max(n * n // 4, 1))
+            classical_jacobi(C, max_iter=max_iter, trace=trace)
+            final = trace.records[-1]
+            print(f"{n:>5} {final['rotations']:>10} {final['off_norm']:>14.1e} {final['time'] * 1e3:>7.1f} ms")
@@ -0,0 +1,252 @@
+# The below code implements the PCA pipeline of PCA_Profiling.ipynb as an importable engine
+# Mean, covariance, eigensolver, sort and projection run on the CPU with a choice of eigensolver backends
+
+import os
+import time
+
+import numpy as np
+
+import dataset_reader
+import fixed_point_model
+import jacobi_engines
+import one_sided_jacobi
+import tracing
+import truncated_pca
+from streaming_covariance import StreamingCovariance
+
+BACKENDS = ('eigh', 'jacobi', 'parallel_jacobi', 'fixed_point', 'randomized', 'subspace', 'one_sided_jacobi')
+# these backends work on the data matrix and never form the covariance
+DATA_BACKENDS = ('randomized', 'subspace', 'one_sided_jacobi')
+
+def top_k_subspace(C, k, oversample=20, tol=1e-10, max_iter=200, seed=0):
+    """
+    Computes the k largest eigenpairs of a symmetric matrix by subspace iteration.
+
+    A block of k + oversample vectors is multiplied by C and re-orthonormalised until the
+    Ritz values of the leading k vectors stop changing; a Rayleigh-Ritz step on the block
+    then gives the eigenpairs. Costs O(d^2 k) per iteration instead of the O(d^3) of a
+    full decomposition.
+
+    Parameters:
+        C (np.ndarray): A symmetric positive semi-definite matrix, shape (d, d).
+        k (int): Number of eigenpairs.
+        oversample (int, optional): Extra vectors in the block, speeding up convergence. Defaults to 20.
+        tol (float, optional): Relative change of the Ritz values at which to stop. Defaults to 1e-10.
+        max_iter (int, optional): The maximum number of iterations. Defaults to 200.
+        seed (int, optional): Seed of the starting block. Defaults to 0.
+
+    Returns:
+        np.ndarray: The k largest eigenvalues, in descending order.
+        np.ndarray: The corresponding eigenvectors as columns, shape (d, k).
+    """
+    d = C.shape[0]
+    block = min(d, k + oversample)
+    Q, _ = np.linalg.qr(np.random.default_rng(seed).standard_normal((d, block)))
+    previous = None
+    for _ in range(max_iter):
+        Q, _ = np.linalg.qr(C @ Q)
+        ritz = np.linalg.eigvalsh(Q.T @ C @ Q)[::-1][:k]
+        if previous is not None and np.all(np.abs(ritz - previous) <= tol * np.abs(ritz[0])):
+            break
+        previous = ritz
+    eigenvalues, W = np.linalg.eigh(Q.T @ C @ Q)
+    order = np.argsort(eigenvalues)[::-1][:k]
+    return eigenvalues[order], Q @ W[:, order]
+
+def fixed_point_eigh(C, sweeps=4, headroom=4.0):
+    """
+    Runs the eigendecomposition on the bit-accurate model of the FPGA Jacobian unit.
+
+    C is scaled so its largest magnitude equals headroom, quantised to Q(3,5) and rotated
+    sweeps * d(d-1)/2 times by fixed_point_model.jacobi_step; the eigenvector bytes are read
+    back as signed Q(2,5). The datapath is modelled as wired (unsigned products and pivot
+    search), so this backend serves error studies on small non-negative matrices.
+
+    Parameters:
+        C (np.ndarray): A symmetric matrix, shape (d, d).
+        sweeps (int, optional): Rotations per off-diagonal pair. Defaults to 4.
+        headroom (float, optional): Largest magnitude after scaling. Defaults to 4.0.
+
+    Returns:
+        np.ndarray: The eigenvalues (diagonal after rotation), unscaled.
+        np.ndarray: The eigenvectors as columns.
+    """
+    fmt = fixed_point_model.Q3_5
+    d = C.shape[0]
+    scale = headroom / max(np.abs(C).max(), np.finfo(np.float64).tiny)
+    C_bits = fixed_point_model.to_bits(fixed_point_model.to_fixed(C * scale, fmt, overflow='wrap'), fmt)
+    V_bits = fixed_point_model.to_bits(np.eye(d, dtype=np.int64) << fmt.frac_bits, fmt)
+    for _ in range(sweeps * d * (d - 1) // 2):
+        C_bits, V_bits = fixed_point_model.jacobi_step(C_bits, V_bits)
+    eigenvalues = fixed_point_model.to_float(np.diagonal(C_bits), fmt) / scale
+    signed = fixed_point_model.QFormat(2, 5, signed=True)
+    V = fixed_point_model.to_float(fixed_point_model.from_bits(V_bits, signed), signed)
+    return eigenvalues, V
+
+class PCA:
+    """
+    Principal component analysis with selectable eigensolver backends.
+
+    The data are never centred as a whole: mean and covariance are accumulated in one pass
+    over row chunks by StreamingCovariance, and transform computes X @ W - mean @ W.
+    When only a few components are requested from the 'eigh' backend, they are found by
+    subspace iteration instead of a full decomposition. The 'randomized' and 'subspace'
+    backends skip the covariance altogether and find the top components from the data
+    matrix, see truncated_pca; 'one_sided_jacobi' computes the SVD of the centred data,
+    see one_sided_jacobi. solver_options are passed on to their solvers. With a cache
+    (eigen_cache.EigenCache), eigendecompositions of a covariance seen before are reused.
+
+    Attributes:
+        n_components (int or None): Number of components kept; all of them when None.
+        backend (str): One of BACKENDS.
+        chunk_size (int): Rows per chunk while accumulating the covariance.
+        mean_ (np.ndarray): Per-feature mean, shape (d,).
+        components_ (np.ndarray): Principal axes as rows, shape (k, d).
+        explained_variance_ (np.ndarray): Eigenvalues of the kept components, descending.
+        cache (EigenCache or None): Cache of covariance eigendecompositions.
+        timings_ (dict): Seconds spent in every stage of the last fit and transform.
+
+    Methods:
+        fit(X): Computes the mean and the principal components of X.
+        transform(X): Projects X onto the principal components.
+        fit_transform(X): fit followed by transform.
+    """
+    def __init__(self, n_components=None, backend='eigh', chunk_size=65536, subspace_fraction=0.1, cache=None,
+                 **solver_options):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+        self.n_components = n_components
+        self.backend = backend
+        self.chunk_size = chunk_size
+        # subspace iteration pays off while k is a small fraction of the feature count
+        self.subspace_fraction = subspace_fraction
+        self.solver_options = solver_options
+        self.cache = cache
+        self.timings_ = {}
+
+    def _solve(self, covariance, k):
+        d = covariance.shape[0]
+        if self.backend == 'eigh':
+            if k < d and k <= self.subspace_fraction * d:
+                return top_k_subspace(covariance, k, **self.solver_options)
+            return np.linalg.eigh(covariance)
+        if self.backend == 'jacobi':
+            return jacobi_engines.classical_jacobi(covariance, **self.solver_options)
+        if self.backend == 'parallel_jacobi':
+            eigenvalues, V, _ = jacobi_engines.parallel_jacobi(covariance, **self.solver_options)
+            return eigenvalues, V
+        return fixed_point_eigh(covariance, **self.solver_options)
+
+    def _fit_data(self, X):
+        # the truncated solvers need random access to the rows: an array, np.memmap or the path of a mappable file
+        if isinstance(X, (str, os.PathLike)):
+            X = dataset_reader.open_dataset(X)
+        if not isinstance(X, np.ndarray) or X.ndim != 2:
+            raise ValueError(f"The {self.backend} backend needs a 2D array or the path of a .npy file "
+                             f"or a FixedSizeList Arrow file")
+        n, d = X.shape
+        k = d if self.n_components is None else min(self.n_components, d)
+
+        start = time.perf_counter()
+        with tracing.span('pca.mean', rows=n):
+            self.mean_ = X.mean(axis=0, dtype=np.float64)
+        self.timings_['mean'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with tracing.span('pca.eigensolver', backend=self.backend, k=k):
+            if self.backend == 'one_sided_jacobi':
+                _, singular_values, components, _ = one_sided_jacobi.hestenes_svd(X, mean=self.mean_, **self.solver_options)
+                singular_values, components = singular_values[:k], components[:k]
+            else:
+                solver = truncated_pca.randomized_svd if self.backend == 'randomized' else truncated_pca.subspace_svd
+                singular_values, components = solver(X, k, mean=self.mean_, **self.solver_options)[:2]
+        self.timings_['eigensolver'] = time.perf_counter() - start
+        return singular_values ** 2 / max(n - 1, 1), components.T, k
+
+    @tracing.traced('pca.fit')
+    def fit(self, X):
+        """
+        Computes the mean and the principal components of X.
+
+        Parameters:
+            X: Data, one sample per row, shape (n, d): an array or np.memmap, the path of a
+               .npy, Arrow or Parquet file or an iterable of row chunks, see streaming_covariance.iter_row_chunks.
+
+        Returns:
+            PCA: self.
+        """
+        self.timings_ = timings = {}
+        if self.backend in DATA_BACKENDS:
+            eigenvalues, V, k = self._fit_data(X)
+        else:
+            start = time.perf_counter()
+            with tracing.span('pca.covariance'):
+                accumulator = StreamingCovariance().consume(X, self.chunk_size)
+                self.mean_ = accumulator.mean
+                covariance = accumulator.covariance()
+            timings['covariance'] = time.perf_counter() - start
+
+            d = covariance.shape[0]
+            k = d if self.n_components is None else min(self.n_components, d)
+
+            start = time.perf_counter()
+            with tracing.span('pca.eigensolver', backend=self.backend, k=k):
+                if self.cache is not None:
+                    # the result depends on the backend, k (subspace iteration) and the solver options
+                    key = self.cache.key(covariance, self.backend, k, self.subspace_fraction, sorted(self.solver_options.items()))
+                    eigenvalues, V = self.cache.get_or_compute(key, lambda: self._solve(covariance, k))
+                else:
+                    eigenvalues, V = self._solve(covariance, k)
+            timings['eigensolver'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        order = np.argsort(eigenvalues)[::-1][:k]
+        components = V[:, order].T
+        # fix the sign so the largest loading of every component is positive
+        signs = np.sign(components[np.arange(k), np.argmax(np.abs(components), axis=1)])
+        signs[signs == 0] = 1
+        self.components_ = components * signs[:, None]
+        self.explained_variance_ = eigenvalues[order]
+        timings['sort'] = time.perf_counter() - start
+        return self
+
+    @tracing.traced('pca.transform')
+    def transform(self, X):
+        """
+        Projects X onto the principal components as X @ W - mean @ W, without centring X.
+
+        Parameters:
+            X (np.ndarray): Data, shape (n, d).
+
+        Returns:
+            np.ndarray: The projected data, shape (n, k).
+        """
+        start = time.perf_counter()
+        W = self.components_.T
+        projected = X @ W
+        projected -= self.mean_ @ W
+        self.timings_['transform'] = time.perf_counter() - start
+        return projected
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+#__main__#
+
+if __name__ == "__main__":
+    # Same shape as the profiling notebook, plus a wider case where top-k pays off
+    # The data have 30 strong directions plus noise, as feature tables usually do
+    rng = np.random.default_rng(0)
+    for n, d, k, backends in ((1000, 500, 10, ('eigh', 'randomized')), (20000, 2000, 10, ('eigh', 'randomized')),
+                              (1000, 64, 10, ('eigh', 'jacobi', 'parallel_jacobi', 'one_sided_jacobi')), (1000, 4, 2, ('eigh', 'fixed_point'))):
+        X = rng.standard_normal((n, 30)) @ rng.standard_normal((30, d)) + 0.3 * rng.standard_normal((n, d)) + 1.0
+        reference = None
+        for backend in backends:
+            for n_components in (k, None) if backend == 'eigh' else (k,):
+                pca = PCA(n_components=n_components, backend=backend)
+                Y = pca.fit_transform(X)
+                if reference is None:
+                    reference = pca.explained_variance_[:k]
+                error = np.max(np.abs(pca.explained_variance_[:k] - reference) / reference)
+                stages = ", ".join(f"{stage} {seconds * 1e3:.1f} ms" for stage, seconds in pca.timings_.items())
+                print(f"{n}x{d} {backend:>15} k={str(n_components):>4}: {stages} | rel. eigenvalue error {error:.1e}")
@@ -0,0 +1,163 @@
+# The below code implements the covariance step across a pool of processes
+# Rows are sharded over workers, partial statistics live in shared memory and are tree-reduced in place
+
+import os
+import sys
+import time
+from multiprocessing import get_context, resource_tracker, shared_memory
+
+import numpy as np
+
+from streaming_covariance import StreamingCovariance
+from thread_limits import pin_threads
+
+def _slot_size(d):
+    # one slot holds n, the mean and the scatter matrix of a shard
+    return 1 + d + d * d
+
+def _attach_slot(name, index, d):
+    block = shared_memory.SharedMemory(name=name)
+    slots = np.ndarray((block.size // 8,), dtype=np.float64, buffer=block.buf)
+    slot = slots[index * _slot_size(d):(index + 1) * _slot_size(d)]
+    return block, slot
+
+def _slot_accumulator(slot, d):
+    return StreamingCovariance.from_arrays(slot[0], slot[1:1 + d], slot[1 + d:].reshape(d, d))
+
+def _init_worker(threads):
+    # one BLAS thread per process, the pool provides the parallelism
+    global _limiter
+    _limiter = pin_threads(threads)
+    if sys.version_info < (3, 13):
+        # attaching to a block registers it with the resource tracker as if the worker had
+        # created it; the parent owns and unlinks every block, workers must not track them
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None if rtype == 'shared_memory' else register(name, rtype)
+
+def make_pool(n_workers=None):
+    """
+    Starts a process pool suited to sharded_covariance: single-threaded BLAS in every worker
+    and no resource tracking of the shared-memory blocks the workers attach to.
+    """
+    return get_context().Pool(n_workers or os.cpu_count() or 1, initializer=_init_worker, initargs=(1,))
+
+def _open_input(source):
+    kind, location, shape, dtype = source
+    if kind == 'npy':
+        return None, np.load(location, mmap_mode='r')
+    block = shared_memory.SharedMemory(name=location)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def _accumulate_shard(source, slots_name, index, start, stop, chunk_rows):
+    input_block, X = _open_input(source)
+    d = X.shape[1]
+    block, slot = _attach_slot(slots_name, index, d)
+    accumulator = StreamingCovariance(d).consume(X[start:stop], chunk_rows)
+    # an empty shard leaves n = 0 and zero statistics, which the merges skip
+    slot[0] = accumulator.n
+    slot[1:1 + d] = accumulator.mean
+    slot[1 + d:] = accumulator.scatter.ravel()
+    del X, slot
+    block.close()
+    if input_block is not None:
+        input_block.close()
+
+def _merge_slots(slots_name, target, other, d):
+    block, target_slot = _attach_slot(slots_name, target, d)
+    _, other_slot = _attach_slot(slots_name, other, d)
+    accumulator = _slot_accumulator(target_slot, d)
+    accumulator.merge(_slot_accumulator(other_slot, d))
+    target_slot[0] = accumulator.n
+    del target_slot, other_slot, accumulator
+    block.close()
+
+def sharded_covariance(X, n_workers=None, chunk_rows=65536, pool=None):
+    """
+    Computes mean and covariance statistics of X with a process pool.
+
+    The rows are split into one contiguous shard per worker. Workers read their shard from
+    shared memory (or memory-map the .npy file), accumulate it with StreamingCovariance and
+    write n, mean and scatter into their slot of a shared-memory buffer. The slots are then
+    merged pairwise in log2(n_workers) rounds, every merge running in a worker and writing
+    into the lower slot, so no large array is ever pickled.
+
+    Parameters:
+        X: Data, shape (n, d): an array (copied once into shared memory) or the path of a .npy file.
+        n_workers (int, optional): Number of shards and processes, at most n. Defaults to os.cpu_count().
+        chunk_rows (int, optional): Rows per chunk inside a worker. Defaults to 65536.
+        pool (multiprocessing.pool.Pool, optional): Pool to reuse, created by make_pool.
+
+    Returns:
+        StreamingCovariance: Statistics of all rows; covariance() gives the covariance matrix.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    blocks = []
+    if isinstance(X, (str, os.PathLike)):
+        shape = np.load(X, mmap_mode='r').shape
+        source = ('npy', os.fspath(X), shape, None)
+    else:
+        X = np.asarray(X)
+        input_block = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+        blocks.append(input_block)
+        np.ndarray(X.shape, dtype=X.dtype, buffer=input_block.buf)[...] = X
+        shape = X.shape
+        source = ('shm', input_block.name, X.shape, X.dtype.str)
+    n, d = shape
+    # more shards than rows would only add empty ones
+    n_workers = max(min(n_workers, n), 1)
+
+    slots_block = shared_memory.SharedMemory(create=True, size=n_workers * _slot_size(d) * 8)
+    blocks.append(slots_block)
+    own_pool = pool is None
+    if own_pool:
+        pool = make_pool(n_workers)
+    try:
+        bounds = np.linspace(0, n, n_workers + 1).astype(int)
+        pool.starmap(_accumulate_shard, [(source, slots_block.name, w, bounds[w], bounds[w + 1], chunk_rows)
+                                         for w in range(n_workers)])
+        stride = 1
+        while stride < n_workers:
+            pool.starmap(_merge_slots, [(slots_block.name, target, target + stride, d)
+                                        for target in range(0, n_workers - stride, 2 * stride)])
+            stride *= 2
+        slots = np.ndarray((n_workers * _slot_size(d),), dtype=np.float64, buffer=slots_block.buf)
+        result = _slot_accumulator(slots[:_slot_size(d)].copy(), d)
+        del slots
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return result
+
+#__main__#
+
+if __name__ == "__main__":
+    # Tall-skinny covariance: many rows, a few hundred features
+    n, d = 1_000_000, 128
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((n, d)).astype(np.float32) + 5.0
+    print(f"{n}x{d} float32 on {os.cpu_count()} CPU(s)")
+
+    start = time.perf_counter()
+    reference = StreamingCovariance().consume(X).covariance()
+    single = time.perf_counter() - start
+    print(f"{'single process':>16}: {single:.3f} s, {n / single / 1e6:.2f} M rows/s")
+
+    # Fewer rows than workers: the shard count is capped at the row count
+    small = rng.standard_normal((3, 4))
+    assert np.allclose(sharded_covariance(small, n_workers=4).covariance(), np.cov(small, rowvar=False))
+    with make_pool(4) as pool:
+        assert np.allclose(sharded_covariance(small[:1], n_workers=4, pool=pool).mean, small[0])
+
+    for n_workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        # the pool is started outside the timing, as a long-running job keeps it alive
+        with make_pool(n_workers) as pool:
+            start = time.perf_counter()
+            covariance = sharded_covariance(X, n_workers, pool=pool).covariance()
+            elapsed = time.perf_counter() - start
+        error = np.abs(covariance - reference).max()
+        print(f"{n_workers:>6} worker(s): {elapsed:.3f} s, {n / elapsed / 1e6:.2f} M rows/s, "
+              f"speedup {single / elapsed:.2f}x, max abs difference {error:.1e}")
@@ -0,0 +1,210 @@
+# The below code implements out-of-core covariance accumulation for data matrices larger than memory
+# Row chunks are folded into a running mean and scatter matrix, as BRAM_CovarianceMatrix.sv accumulates block by block
+
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import dataset_reader
+import tracing
+
+def chunk_rows_for_budget(n_features, memory_budget, itemsize=8):
+    """
+    Number of rows per chunk such that a chunk and its centred float64 copy fit in memory_budget bytes.
+
+    The d x d matrices of the accumulator are not part of the budget.
+    """
+    return max(1, int(memory_budget // (n_features * (itemsize + 8))))
+
+def iter_row_chunks(source, chunk_rows=65536):
+    """
+    Yields row chunks of a data source.
+
+    Parameters:
+        source: A 2D array or np.memmap, the path of a .npy, Arrow or Parquet file (memory-mapped
+                or decoded block by block, never loaded whole, see dataset_reader.open_dataset),
+                or any iterable of 2D row chunks such as a generator or a dataset_reader.DatasetReader.
+        chunk_rows (int, optional): Rows per chunk for arrays and files; chunks coming from an
+                                    iterable larger than this are split. Defaults to 65536.
+
+    Yields:
+        np.ndarray: Row chunks, views on the source where possible.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = dataset_reader.open_dataset(source)
+    if isinstance(source, np.ndarray):
+        if source.ndim != 2:
+            raise ValueError(f"Expected a 2D data matrix, got shape {source.shape}")
+        for start in range(0, source.shape[0], chunk_rows):
+            yield source[start:start + chunk_rows]
+        return
+    for chunk in source:
+        chunk = np.atleast_2d(chunk)
+        for start in range(0, chunk.shape[0], chunk_rows):
+            yield chunk[start:start + chunk_rows]
+
+class StreamingCovariance:
+    """
+    Running mean and scatter matrix of a stream of row chunks.
+
+    Every chunk is centred on its own mean into a reusable buffer, its scatter matrix is
+    computed with one GEMM and folded into the running totals with Chan's pairwise update,
+    so the result stays accurate when the mean is large compared to the spread. Accumulators
+    fed by different workers combine the same way through merge.
+
+    Attributes:
+        n (int): Number of rows seen.
+        mean (np.ndarray): Running mean, shape (d,).
+        scatter (np.ndarray): Sum of outer products of the centred rows, shape (d, d).
+
+    Methods:
+        update(chunk): Folds a chunk of rows into the statistics.
+        consume(source, chunk_rows): Updates with every chunk of a source, see iter_row_chunks.
+        merge(other): Folds the statistics of another accumulator into this one.
+        covariance(ddof=1): Returns the covariance matrix.
+        from_arrays(n, mean, scatter): Wraps existing statistics without copying them.
+    """
+    def __init__(self, n_features=None):
+        self.n = 0
+        self.mean = None
+        self.scatter = None
+        self._buffer = None
+        self._gram = None
+        self._product = None
+        if n_features is not None:
+            self._allocate(n_features)
+
+    @classmethod
+    def from_arrays(cls, n, mean, scatter):
+        """
+        Wraps existing statistics without copying them, e.g. views on a shared-memory buffer;
+        later updates and merges write into those arrays.
+        """
+        accumulator = cls()
+        accumulator.n = int(n)
+        accumulator.mean = mean
+        accumulator.scatter = scatter
+        accumulator._gram = np.empty_like(scatter)
+        accumulator._product = np.empty_like(scatter)
+        return accumulator
+
+    def _allocate(self, d):
+        self.mean = np.zeros(d)
+        self.scatter = np.zeros((d, d))
+        self._gram = np.empty((d, d))
+        self._product = np.empty((d, d))
+
+    def _fold(self, n_b, mean_b, scatter_b):
+        # Chan et al.: M = M_a + M_b + delta delta^T * n_a n_b / n
+        n_a = self.n
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        self.scatter += scatter_b
+        np.multiply.outer(delta, delta * (n_a * n_b / n), out=self._product)
+        self.scatter += self._product
+        self.mean += delta * (n_b / n)
+        self.n = n
+
+    def update(self, chunk):
+        """
+        Folds a chunk of rows into the statistics.
+
+        Parameters:
+            chunk (np.ndarray): Rows, shape (m, d).
+
+        Returns:
+            StreamingCovariance: self.
+        """
+        chunk = np.atleast_2d(chunk)
+        m, d = chunk.shape
+        if m == 0:
+            return self
+        if self.mean is None:
+            self._allocate(d)
+        elif d != self.mean.shape[0]:
+            raise ValueError(f"Chunk has {d} features, expected {self.mean.shape[0]}")
+        if self._buffer is None or self._buffer.shape[0] < m:
+            self._buffer = np.empty((m, d))
+
+        with tracing.span('covariance.center', rows=m):
+            chunk_mean = chunk.mean(axis=0, dtype=np.float64)
+            centered = self._buffer[:m]
+            np.subtract(chunk, chunk_mean, out=centered)
+        with tracing.span('covariance.gemm', rows=m):
+            np.matmul(centered.T, centered, out=self._gram)
+            self._fold(m, chunk_mean, self._gram)
+        tracing.count('covariance.rows', m)
+        return self
+
+    def consume(self, source, chunk_rows=65536):
+        for chunk in iter_row_chunks(source, chunk_rows):
+            self.update(chunk)
+        return self
+
+    def merge(self, other):
+        """
+        Folds the statistics of another accumulator into this one.
+
+        Parameters:
+            other (StreamingCovariance): Statistics of other rows of the same features.
+
+        Returns:
+            StreamingCovariance: self.
+        """
+        if other.n == 0:
+            return self
+        if self.mean is None:
+            self._allocate(other.mean.shape[0])
+        self._fold(other.n, other.mean, other.scatter)
+        return self
+
+    def covariance(self, ddof=1):
+        if self.n <= ddof:
+            raise ValueError(f"Need more than {ddof} rows, got {self.n}")
+        return self.scatter / (self.n - ddof)
+
+    def __getstate__(self):
+        # the chunk buffer is scratch, workers do not send it along with their statistics
+        state = self.__dict__.copy()
+        state['_buffer'] = None
+        return state
+
+#__main__#
+
+if __name__ == "__main__":
+    # A tall feature table on disk, reduced under a fixed memory budget
+    n, d = 2_000_000, 64
+    budget = 16 * 2**20
+    rng = np.random.default_rng(0)
+    path = os.path.join(tempfile.mkdtemp(), 'features.npy')
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n, d))
+    for start in range(0, n, 250_000):
+        table[start:start + 250_000] = rng.standard_normal((250_000, d)) * 0.1 + 1000.0
+    table.flush()
+    del table
+
+    chunk_rows = chunk_rows_for_budget(d, budget, itemsize=4)
+    tracemalloc.start()
+    start = time.perf_counter()
+    streaming = StreamingCovariance().consume(path, chunk_rows)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{n}x{d} float32 ({n * d * 4 / 2**20:.0f} MiB) streamed in {chunk_rows}-row chunks: "
+          f"{elapsed:.2f} s, {n * d * 4 / 2**20 / elapsed:.0f} MiB/s, peak traced memory {peak / 2**20:.1f} MiB")
+
+    # Four workers on disjoint row ranges, merged afterwards
+    X = np.load(path, mmap_mode='r')
+    workers = [StreamingCovariance().consume(X[w * n // 4:(w + 1) * n // 4], chunk_rows) for w in range(4)]
+    merged = StreamingCovariance()
+    for worker in workers:
+        merged.merge(worker)
+
+    reference = np.cov(np.asarray(X[:200_000], dtype=np.float64).T)
+    partial = StreamingCovariance().consume(X[:200_000], chunk_rows).covariance()
+    print(f"Streaming vs np.cov on 200000 rows: max abs error {np.abs(partial - reference).max():.2e}")
+    print(f"Merged vs single stream: max abs difference {np.abs(merged.covariance() - streaming.covariance()).max():.2e}")
+    os.remove(path)
@@ -0,0 +1,236 @@
+# The below code implements a cycle-approximate performance model of the two covariance arrays in rtl/
+# rtl/covariance_unit is an output-stationary MAC array, rtl/covariance_MEISSA a grid of multipliers feeding adder trees;
+# tiles of C = X^T X are streamed through either one, counting fill/drain bubbles, BRAM traffic and adder-tree stages
+
+import math
+import time
+
+import numpy as np
+
+STYLES = ('output_stationary', 'meissa')
+# covariance_unit/processing_element.v registers the product, then the partial sum
+PE_STAGES = 2
+
+def _tree_depth(S):
+    return np.ceil(np.log2(np.maximum(S, 1))).astype(np.int64)
+
+def _pass_cycles(style, S, k):
+    # cycles to stream a chunk of k samples through the array at one sample (row of X) per cycle;
+    # MEISSA consumes the reduction in blocks of S, a ragged block still takes S cycles
+    if style == 'meissa':
+        return S * -(-k // S)
+    return k
+
+def _fill_cycles(style, S):
+    # output-stationary: A is skewed across S rows, B across S columns, plus the PE pipeline;
+    # MEISSA: one skew, the multiplier register, the adder tree and the accumulator
+    if style == 'meissa':
+        return (S - 1) + 1 + _tree_depth(S) + 1
+    return 2 * (S - 1) + PE_STAGES - 1
+
+def estimate(style, samples, features, array_size, tile_k=None, bram_words_per_cycle=None, double_buffered=True,
+             symmetric=True, clock_hz=100e6):
+    """
+    Predicts the cycles of the covariance step C = X^T X on a systolic array, in closed form.
+
+    Every argument except style broadcasts, so whole grids of configurations are evaluated at once.
+    The d x d output is cut into S x S tiles (the upper triangle only when symmetric); every tile
+    streams the samples in chunks of tile_k, which is what the input buffers hold. A chunk costs
+    max(pass cycles, BRAM words / bandwidth); without double buffering every chunk also drains and
+    refills the pipeline and every tile writes its S rows back before the next one starts, with it
+    only the last tile's write-back and one fill per tile remain.
+
+    Parameters:
+        style (str): 'output_stationary' (rtl/covariance_unit) or 'meissa' (rtl/covariance_MEISSA).
+        samples (array-like): Rows of X, the reduction length.
+        features (array-like): Columns of X, C is features x features.
+        array_size (array-like): S, the array has S x S processing elements.
+        tile_k (array-like, optional): Samples per chunk; defaults to all samples in one chunk.
+        bram_words_per_cycle (array-like, optional): Read bandwidth into the array; defaults to the
+                                                     2S words per cycle that never stall it.
+        double_buffered (bool, optional): Overlap chunk loads and write-backs with compute. Defaults to True.
+        symmetric (bool, optional): Compute only the upper-triangle tiles of C. Defaults to True.
+        clock_hz (float, optional): Clock frequency. Defaults to 100 MHz.
+
+    Returns:
+        dict: Arrays of 'cycles', 'seconds', 'stream_cycles', 'fill_cycles' (bubbles), 'stall_cycles'
+              (waiting on BRAM), 'writeback_cycles', 'bram_reads' and 'bram_writes' (words),
+              'adder_tree_depth', 'additions', 'utilization' (useful MACs over S^2 * cycles) and 'gflops'.
+    """
+    if style not in STYLES:
+        raise ValueError(f"Unknown style {style}, expected one of {STYLES}")
+    m = np.asarray(samples, dtype=np.int64)
+    d = np.asarray(features, dtype=np.int64)
+    S = np.asarray(array_size, dtype=np.int64)
+    k = m if tile_k is None else np.minimum(np.asarray(tile_k, dtype=np.int64), m)
+    bandwidth = 2 * S if bram_words_per_cycle is None else np.asarray(bram_words_per_cycle, dtype=np.int64)
+
+    T = -(-d // S)
+    tiles = T * (T + 1) // 2 if symmetric else T * T
+    full, rest = m // k, m % k
+    chunks = full + (rest > 0)
+
+    passes = full * _pass_cycles(style, S, k) + _pass_cycles(style, S, rest)
+    reads = 2 * S * passes
+    stream = full * np.maximum(_pass_cycles(style, S, k), -(-2 * S * _pass_cycles(style, S, k) // bandwidth)) \
+        + np.maximum(_pass_cycles(style, S, rest), -(-2 * S * _pass_cycles(style, S, rest) // bandwidth))
+    fill = _fill_cycles(style, S) * (1 if double_buffered else chunks)
+    writeback = S
+
+    cycles = tiles * (stream + fill) + (writeback if double_buffered else tiles * writeback)
+    useful = m * d * (d + 1) // 2 if symmetric else m * d * d
+    seconds = cycles / clock_hz
+    return {
+        'cycles': cycles,
+        'seconds': seconds,
+        'stream_cycles': tiles * passes,
+        'fill_cycles': tiles * fill,
+        'stall_cycles': tiles * (stream - passes),
+        'writeback_cycles': writeback if double_buffered else tiles * writeback,
+        'bram_reads': tiles * reads,
+        'bram_writes': tiles * S * S,
+        'adder_tree_depth': _tree_depth(S) if style == 'meissa' else np.zeros_like(S),
+        # every PE adds once per cycle: into its partial sum, or as one of the S - 1 tree adders and
+        # the accumulator of a MEISSA column
+        'additions': tiles * S * S * passes,
+        'utilization': useful / (S * S * cycles),
+        'gflops': 2 * useful / seconds / 1e9,
+    }
+
+class SystolicArrayModel:
+    """
+    Event-level simulator of one covariance array, walking the tile schedule chunk by chunk.
+
+    It follows the controller: for every output tile (row-major, upper triangle when symmetric)
+    the chunks of samples are streamed, each one waiting for the pipeline to fill when it
+    cannot overlap with the previous one and for BRAM when the read bandwidth is short, then
+    the tile's S rows are written back. The counters match estimate(), which is the same model
+    in closed form for sweeps; this class keeps a per-tile log for inspection.
+
+    Attributes:
+        style (str): One of STYLES.
+        array_size (int): S.
+        tile_k (int or None): Samples per chunk.
+        bram_words_per_cycle (int): Read bandwidth into the array.
+        double_buffered (bool): Overlap chunk loads and write-backs with compute.
+        symmetric (bool): Compute only the upper-triangle tiles.
+        clock_hz (float): Clock frequency.
+        log (list of tuple): (row tile, column tile, start cycle, end cycle) of the last run.
+
+    Methods:
+        run(samples, features): Simulates one covariance and returns the counters.
+    """
+    def __init__(self, style='output_stationary', array_size=4, tile_k=None, bram_words_per_cycle=None,
+                 double_buffered=True, symmetric=True, clock_hz=100e6):
+        if style not in STYLES:
+            raise ValueError(f"Unknown style {style}, expected one of {STYLES}")
+        self.style = style
+        self.array_size = array_size
+        self.tile_k = tile_k
+        self.bram_words_per_cycle = bram_words_per_cycle or 2 * array_size
+        self.double_buffered = double_buffered
+        self.symmetric = symmetric
+        self.clock_hz = clock_hz
+        self.log = []
+
+    def run(self, samples, features):
+        S = self.array_size
+        k = samples if self.tile_k is None else min(self.tile_k, samples)
+        T = math.ceil(features / S)
+        fill = int(_fill_cycles(self.style, S))
+        counters = dict.fromkeys(('stream_cycles', 'fill_cycles', 'stall_cycles', 'writeback_cycles',
+                                  'bram_reads', 'bram_writes', 'additions'), 0)
+        self.log = []
+        cycle = 0
+        for i in range(T):
+            for j in range(i if self.symmetric else 0, T):
+                start = cycle
+                for first in range(0, samples, k):
+                    if first == 0 or not self.double_buffered:
+                        cycle += fill
+                        counters['fill_cycles'] += fill
+                    passes = int(_pass_cycles(self.style, S, min(k, samples - first)))
+                    words = 2 * S * passes
+                    stream = max(passes, math.ceil(words / self.bram_words_per_cycle))
+                    cycle += stream
+                    counters['stream_cycles'] += passes
+                    counters['stall_cycles'] += stream - passes
+                    counters['bram_reads'] += words
+                    counters['additions'] += S * S * passes
+                if not self.double_buffered:
+                    cycle += S
+                    counters['writeback_cycles'] += S
+                counters['bram_writes'] += S * S
+                self.log.append((i, j, start, cycle))
+        if self.double_buffered:
+            # the write-backs hide behind the next tile, only the last one is exposed
+            cycle += S
+            counters['writeback_cycles'] += S
+
+        useful = samples * features * (features + 1) // 2 if self.symmetric else samples * features * features
+        counters['cycles'] = cycle
+        counters['seconds'] = cycle / self.clock_hz
+        counters['utilization'] = useful / (S * S * cycle)
+        counters['gflops'] = 2 * useful / counters['seconds'] / 1e9
+        return counters
+
+#__main__#
+
+if __name__ == "__main__":
+    # The event-level simulator and the closed form agree on random configurations
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        style = STYLES[rng.integers(2)]
+        S = int(rng.integers(1, 17))
+        config = dict(tile_k=int(rng.integers(1, 300)) if rng.random() < 0.7 else None,
+                      bram_words_per_cycle=int(rng.integers(1, 4 * S + 1)),
+                      double_buffered=bool(rng.integers(2)), symmetric=bool(rng.integers(2)))
+        samples, features = int(rng.integers(1, 600)), int(rng.integers(1, 70))
+        simulated = SystolicArrayModel(style, S, **config).run(samples, features)
+        predicted = estimate(style, samples, features, S, **config)
+        for key, value in simulated.items():
+            assert np.isclose(predicted[key], value), f"{style} S={S} {config} m={samples} d={features}: {key}"
+    print("Event-level simulation and closed form agree on 300 random configurations")
+
+    # The 2x2 arrays in rtl/ on a 4x4 covariance of 4 samples
+    for style in STYLES:
+        counters = SystolicArrayModel(style, array_size=2, double_buffered=False, symmetric=False).run(4, 4)
+        print(f"{style:>17} 2x2 array, 4 samples x 4 features: {counters['cycles']} cycles, "
+              f"{counters['fill_cycles']} fill, {counters['writeback_cycles']} write-back, "
+              f"utilization {counters['utilization']:.0%}")
+
+    # Sweep: array size x tile size x BRAM bandwidth x buffering x feature count, both styles
+    sizes = np.array([2, 4, 6, 8, 9, 12, 16, 24, 32, 48, 64])
+    tile_ks = np.array([16, 64, 256, 1024, 4096, 16384])
+    bandwidth_factor = np.array([0.5, 1, 2])
+    features = np.array([16, 64, 128, 256, 512, 1024, 2048, 4096])
+    grid = np.meshgrid(sizes, tile_ks, bandwidth_factor, features, indexing='ij')
+    S, K, B, D = (g.ravel() for g in grid)
+    bandwidth = np.maximum((B * 2 * S).astype(np.int64), 1)
+    samples = 16384
+
+    start = time.perf_counter()
+    results = {(style, buffered): estimate(style, samples, D, S, tile_k=K, bram_words_per_cycle=bandwidth,
+                                           double_buffered=buffered)
+               for style in STYLES for buffered in (False, True)}
+    elapsed = time.perf_counter() - start
+    total = sum(len(result['cycles']) for result in results.values())
+    print(f"\nSwept {total} configurations in {elapsed * 1e3:.1f} ms ({total / elapsed / 1e6:.1f} M configurations/s)")
+
+    # Per array size on a 512-feature covariance: utilization at the best chunk size without and with
+    # double buffering, and with it at half the BRAM bandwidth; Artix-7 35T has 90 DSP slices
+    print(f"\n{'style':>17} {'S':>3} {'PEs':>5} {'best tile_k':>12} {'unbuffered':>11} {'buffered':>9} "
+          f"{'half bw':>8} {'GFLOP/s':>8}")
+    for style in STYLES:
+        for size in (4, 8, 9, 16, 32):
+            mask = (S == size) & (D == 512)
+            unbuffered, buffered = results[style, False], results[style, True]
+            full_bw = np.flatnonzero(mask & (B == 1))
+            best = full_bw[np.argmax(unbuffered['utilization'][full_bw])]
+            overlapped = full_bw[np.argmax(buffered['utilization'][full_bw])]
+            half_bw = np.flatnonzero(mask & (B == 0.5))
+            half = half_bw[np.argmax(buffered['utilization'][half_bw])]
+            fits = "" if size * size <= 90 else "  (exceeds 90 DSP)"
+            print(f"{style:>17} {size:>3} {size * size:>5} {K[best]:>12} {unbuffered['utilization'][best]:>11.1%} "
+                  f"{buffered['utilization'][overlapped]:>9.1%} {buffered['utilization'][half]:>8.1%} "
+                  f"{buffered['gflops'][overlapped]:>8.2f}{fits}")
@@ -0,0 +1,25 @@
+# The below code implements the thread pinning shared by the benchmark harness and the worker pools
+# BLAS and OpenMP pools are limited through threadpoolctl when it is installed, and through the environment otherwise
+
+import os
+
+def pin_threads(n):
+    """
+    Pins the BLAS/OpenMP thread pools to n threads.
+
+    Uses threadpoolctl when it is installed; otherwise only the environment variables are set,
+    which affect libraries loaded afterwards but not an already initialised NumPy BLAS.
+
+    Parameters:
+        n (int): Number of threads.
+
+    Returns:
+        object: The threadpoolctl limiter, or None; its restore_original_limits() undoes the pin.
+    """
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS'):
+        os.environ[variable] = str(n)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return None
+    return threadpool_limits(limits=n)
@@ -0,0 +1,363 @@
+# The below code implements the tracing hooks of the host pipeline, from centring and covariance to the serial link
+# Spans and counters are stamped with time.perf_counter_ns, kept in memory per process and written as Chrome trace
+# JSON (chrome://tracing, Perfetto) or summed up per span name; while tracing is off a span costs one attribute check
+
+import atexit
+import functools
+import inspect
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# PCA_TRACE=1 turns tracing on for the process; PCA_TRACE=trace.json also writes the trace and prints
+# the summary when the process exits
+ENV_VAR = 'PCA_TRACE'
+# the oldest events are kept, later ones are counted as dropped
+MAX_EVENTS = 2_000_000
+
+now = time.perf_counter_ns
+
+class _NullSpan:
+    # the one span handed out while tracing is off
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    """
+    A timed region, recorded when the with block exits (also on an exception).
+
+    Spans on one thread must nest; for regions that overlap on one thread, such as concurrent
+    requests in an event loop, use Tracer.async_span.
+
+    Methods:
+        set(**args): Attaches values known only inside the region, e.g. a sweep count.
+    """
+    __slots__ = ('tracer', 'name', 'args', 'start', 'id')
+
+    def __init__(self, tracer, name, args, id=None):
+        self.tracer = tracer
+        self.name = name
+        self.args = args or None
+        self.id = id
+
+    def __enter__(self):
+        self.start = now()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer._record('X' if self.id is None else 'A', self.name, self.start, now() - self.start, self.args, self.id)
+        return False
+
+    def set(self, **args):
+        self.args = {**self.args, **args} if self.args else args
+
+class Tracer:
+    """
+    Collects spans and counters of one process.
+
+    Events are appended to an in-memory list as tuples (phase, name, start ns, duration ns or
+    counter value, thread id, args, async id) and only formatted on export, so recording one
+    costs about a microsecond. All methods return at once while enabled is False.
+
+    Attributes:
+        enabled (bool): Whether spans and counters are recorded.
+        events (list): The recorded events.
+        counters (dict): Current value of every counter.
+        dropped (int): Events not recorded because max_events was reached.
+
+    Methods:
+        span(name, **args): Context manager timing a region.
+        async_span(name, **args): Like span, for regions that overlap on one thread.
+        traced(name=None): Decorator timing every call of a function or coroutine function.
+        complete(name, start, **args): Records a region from a start stamp of now() to now.
+        count(name, value=1): Adds to a counter.
+        summary(): Calls, total, self and percentile times per span name.
+        format_summary(): The summary and the counters as a text table.
+        chrome_trace(): The events in the Chrome trace event format.
+        write_chrome_trace(path): Writes chrome_trace() as JSON.
+    """
+    def __init__(self, enabled=False, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.events = []
+        self.counters = {}
+        self.threads = {}
+        self.dropped = 0
+        self.origin = now()
+
+    def _record(self, phase, name, start, value, args, id=None):
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        tid = threading.get_native_id()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        # list.append is atomic, threads need no lock here
+        self.events.append((phase, name, start, value, tid, args, id))
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def async_span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args, next(self.ids))
+
+    def complete(self, name, start, **args):
+        if self.enabled:
+            self._record('X', name, start, now() - start, args or None)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+        self._record('C', name, now(), total, None)
+
+    def traced(self, name=None):
+        """
+        Decorator timing every call of a function (or coroutine function) as a span.
+
+        Parameters:
+            name (str, optional): Span name. Defaults to the qualified name of the function.
+        """
+        def decorate(function):
+            label = name or function.__qualname__
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await function(*args, **kwargs)
+                    with Span(self, label, None, next(self.ids)):
+                        return await function(*args, **kwargs)
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return function(*args, **kwargs)
+                    with Span(self, label, None):
+                        return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def summary(self):
+        """
+        Sums up the spans per name.
+
+        Self time is the time of a span minus that of the spans directly nested in it on the same
+        thread; async spans count as their own self time.
+
+        Returns:
+            list of dict: One row per name, by total time: 'name', 'calls', 'total_s', 'self_s',
+                          'mean_s', 'p50_s', 'p95_s', 'max_s' and 'share' (total over the traced wall
+                          time, above 1 for spans that overlap, such as concurrent requests).
+        """
+        spans = [event for event in self.events if event[0] in 'XA']
+        if not spans:
+            return []
+        children = np.zeros(len(spans), dtype=np.int64)
+        by_thread = {}
+        for i, event in enumerate(spans):
+            if event[0] == 'X':
+                by_thread.setdefault(event[4], []).append(i)
+        for indices in by_thread.values():
+            stack = []
+            for i in sorted(indices, key=lambda i: (spans[i][2], -spans[i][3])):
+                start, duration = spans[i][2], spans[i][3]
+                while stack and spans[stack[-1]][2] + spans[stack[-1]][3] <= start:
+                    stack.pop()
+                if stack:
+                    children[stack[-1]] += duration
+                stack.append(i)
+
+        wall = max(event[2] + event[3] for event in spans) - min(event[2] for event in spans)
+        groups = {}
+        for i, event in enumerate(spans):
+            groups.setdefault(event[1], []).append(i)
+        rows = []
+        for name, indices in groups.items():
+            durations = np.array([spans[i][3] for i in indices], dtype=np.float64) * 1e-9
+            p50, p95 = np.percentile(durations, [50, 95])
+            total = durations.sum()
+            rows.append({'name': name, 'calls': len(indices), 'total_s': total,
+                         'self_s': total - children[indices].sum() * 1e-9, 'mean_s': total / len(indices),
+                         'p50_s': p50, 'p95_s': p95, 'max_s': durations.max(), 'share': total / max(wall * 1e-9, 1e-12)})
+        return sorted(rows, key=lambda row: -row['total_s'])
+
+    def format_summary(self):
+        rows = self.summary()
+        lines = [f"{'span':<28} {'calls':>8} {'total ms':>10} {'self ms':>10} {'mean us':>10} {'p50 us':>10} "
+                 f"{'p95 us':>10} {'max us':>10} {'share':>7}"]
+        for row in rows:
+            lines.append(f"{row['name']:<28} {row['calls']:>8} {row['total_s'] * 1e3:>10.2f} {row['self_s'] * 1e3:>10.2f} "
+                         f"{row['mean_s'] * 1e6:>10.1f} {row['p50_s'] * 1e6:>10.1f} {row['p95_s'] * 1e6:>10.1f} "
+                         f"{row['max_s'] * 1e6:>10.1f} {row['share']:>7.1%}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<28} {value:>8}")
+        if self.dropped:
+            lines.append(f"{self.dropped} events dropped after the first {self.max_events}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """
+        Returns the events in the Chrome trace event format, times in microseconds from reset().
+        The category of a span is its name up to the first dot, e.g. 'serial' for 'serial.encode'.
+        """
+        pid = os.getpid()
+        trace = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': os.path.basename(sys.argv[0]) or 'python'}}]
+        trace += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in self.threads.items()]
+        for phase, name, start, value, tid, args, id in self.events:
+            ts = (start - self.origin) / 1e3
+            if phase == 'C':
+                trace.append({'name': name, 'ph': 'C', 'ts': ts, 'pid': pid, 'tid': tid, 'args': {'value': value}})
+                continue
+            event = {'name': name, 'cat': name.split('.', 1)[0], 'pid': pid, 'tid': tid}
+            if args:
+                event['args'] = {key: arg if isinstance(arg, (int, float, str, bool)) else repr(arg) for key, arg in args.items()}
+            if phase == 'X':
+                trace.append({**event, 'ph': 'X', 'ts': ts, 'dur': value / 1e3})
+            else:
+                trace.append({**event, 'ph': 'b', 'ts': ts, 'id': id})
+                trace.append({'name': name, 'cat': event['cat'], 'pid': pid, 'tid': tid, 'ph': 'e',
+                              'ts': ts + value / 1e3, 'id': id})
+        return {'traceEvents': trace, 'displayTimeUnit': 'ns'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+# the tracer of the process and its methods as module functions
+TRACER = Tracer()
+span = TRACER.span
+async_span = TRACER.async_span
+traced = TRACER.traced
+complete = TRACER.complete
+count = TRACER.count
+enable = TRACER.enable
+disable = TRACER.disable
+reset = TRACER.reset
+summary = TRACER.summary
+format_summary = TRACER.format_summary
+chrome_trace = TRACER.chrome_trace
+write_chrome_trace = TRACER.write_chrome_trace
+
+def enabled():
+    return TRACER.enabled
+
+def _write_at_exit(path):
+    TRACER.write_chrome_trace(path)
+    print(f"Trace of {len(TRACER.events)} events written to {path}\n{TRACER.format_summary()}", file=sys.stderr)
+
+def _configure_from_environment():
+    value = os.environ.get(ENV_VAR, '')
+    if value.lower() in ('', '0', 'false', 'off', 'no'):
+        return
+    TRACER.enable()
+    if value.endswith('.json'):
+        atexit.register(_write_at_exit, value)
+
+_configure_from_environment()
+
+#__main__#
+
+if __name__ == "__main__":
+    import asyncio
+    import tempfile
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'serial'))
+    import AsyncTransport
+    import FPGAEmulator
+
+    import bram_image
+    import jacobi_engines
+    from pca_engine import PCA
+    # the pipeline records into the imported module, not into this script's copy of it
+    import tracing
+
+    rng = np.random.default_rng(0)
+
+    # What a span costs on top of an empty loop: disabled it is one attribute check and a shared null context
+    def cost(repeats=200_000):
+        start = now()
+        for _ in range(repeats):
+            pass
+        loop = now() - start
+        start = now()
+        for _ in range(repeats):
+            with tracing.span('overhead'):
+                pass
+        return (now() - start - loop) / repeats
+
+    disabled = cost()
+    tracing.enable()
+    enabled_cost = cost()
+    tracing.reset()
+    tracing.disable()
+    print(f"Span cost: {disabled:.0f} ns disabled, {enabled_cost:.0f} ns enabled")
+
+    X = rng.standard_normal((200_000, 64))
+    pca = PCA(backend='parallel_jacobi', chunk_size=16384)
+
+    # traced and untraced fits alternate, so drifting clocks and caches hit both alike
+    times = {False: [], True: []}
+    for i in range(14):
+        tracing.enable() if i % 2 else tracing.disable()
+        start = now()
+        pca.fit(X)
+        times[tracing.enabled()].append((now() - start) * 1e-6)
+    spans = sum(1 for event in tracing.TRACER.events if event[0] == 'X') // 7
+    tracing.reset()
+    print(f"PCA fit of 200000x64, parallel Jacobi, {spans} spans per fit: median {np.median(times[False]):.2f} ms "
+          f"untraced, {np.median(times[True]):.2f} ms traced")
+
+    # One traced pass through the host stack: PCA, quantization of a batch of covariance matrices,
+    # a classical Jacobi solve and jobs over the emulated board, whose thread shows up next to the event loop
+    pca.fit(X)
+    covariances = np.einsum('bki,bkj->bij', *(2 * [rng.standard_normal((2000, 32, 16))])) / 32
+    bram_image.bram_images(covariances, fmt=bram_image.QFormat(2, 5, signed=True), banks=2)
+    jacobi_engines.classical_jacobi(np.cov(X[:, :24], rowvar=False))
+
+    async def link(port, matrices):
+        async with AsyncTransport.AsyncFPGATransport(port, 921600) as transport:
+            await asyncio.gather(*(transport.request_matrix(matrix) for matrix in matrices))
+
+    with FPGAEmulator.FPGAEmulator(921600) as emulator:
+        asyncio.run(link(os.ttyname(emulator.slave_fd), [rng.random((32, 8)).astype(np.float32) for _ in range(16)]))
+
+    print(f"\n{tracing.format_summary()}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trace.json')
+        tracing.write_chrome_trace(path)
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        print(f"\nChrome trace: {len(events)} events, {os.path.getsize(path) / 2**10:.0f} KiB, "
+              f"threads {sorted(set(tracing.TRACER.threads.values()))}")
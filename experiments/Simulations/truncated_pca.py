@@ -0,0 +1,135 @@
+# The below code implements truncated PCA for the top-k components of wide data matrices
+# The covariance is never formed: randomized range finding and subspace iteration only multiply the data by thin blocks
+
+import time
+import tracemalloc
+
+import numpy as np
+
+def _centered_matmat(X, mean, W):
+    # (X - 1 mean^T) @ W without materialising the centred matrix
+    product = X @ W
+    product -= mean @ W
+    return product
+
+def _centered_rmatmat(X, mean, Y):
+    # (X - 1 mean^T)^T @ Y
+    product = X.T @ Y
+    product -= np.multiply.outer(mean, Y.sum(axis=0))
+    return product
+
+def randomized_svd(X, k, oversample=10, power_iter=2, mean=None, seed=0):
+    """
+    Computes the top-k right singular vectors of the centred data matrix by randomized range finding.
+
+    A Gaussian block of k + oversample columns is multiplied into the data, its range is refined by
+    power_iter power iterations (re-orthonormalised after every product) and the small projected
+    matrix Q^T (X - 1 mean^T) is decomposed exactly. Costs O(n d (k + oversample)) per data pass and
+    2 power_iter + 2 passes; memory is O((n + d)(k + oversample)) on top of X.
+
+    Parameters:
+        X (np.ndarray): Data, one sample per row, shape (n, d); an np.memmap works as well.
+        k (int): Number of components.
+        oversample (int, optional): Extra columns of the random block. Defaults to 10.
+        power_iter (int, optional): Power iterations; more sharpen a slowly decaying spectrum. Defaults to 2.
+        mean (np.ndarray, optional): Per-feature mean to centre on; computed from X when None.
+        seed (int, optional): Seed of the random block. Defaults to 0.
+
+    Returns:
+        np.ndarray: The k largest singular values of the centred data, descending.
+        np.ndarray: The matching right singular vectors as rows, shape (k, d).
+    """
+    n, d = X.shape
+    if mean is None:
+        mean = X.mean(axis=0, dtype=np.float64)
+    block = min(k + oversample, n, d)
+    omega = np.random.default_rng(seed).standard_normal((d, block))
+    Q, _ = np.linalg.qr(_centered_matmat(X, mean, omega))
+    for _ in range(power_iter):
+        Z, _ = np.linalg.qr(_centered_rmatmat(X, mean, Q))
+        Q, _ = np.linalg.qr(_centered_matmat(X, mean, Z))
+    B = _centered_rmatmat(X, mean, Q).T
+    _, singular_values, Vt = np.linalg.svd(B, full_matrices=False)
+    return singular_values[:k], Vt[:k]
+
+def subspace_svd(X, k, oversample=10, tol=1e-8, max_iter=100, mean=None, seed=0):
+    """
+    Computes the top-k right singular vectors of the centred data matrix by block subspace iteration.
+
+    The iteration V <- orth((X - 1 mean^T)^T (X - 1 mean^T) V) runs on the data directly until the
+    leading k Ritz values change by less than tol relative to the largest one, so accuracy rather
+    than a fixed number of passes decides the cost.
+
+    Parameters:
+        X (np.ndarray): Data, one sample per row, shape (n, d).
+        k (int): Number of components.
+        oversample (int, optional): Extra vectors in the block, speeding up convergence. Defaults to 10.
+        tol (float, optional): Relative change of the Ritz values at which to stop. Defaults to 1e-8.
+        max_iter (int, optional): The maximum number of iterations. Defaults to 100.
+        mean (np.ndarray, optional): Per-feature mean to centre on; computed from X when None.
+        seed (int, optional): Seed of the starting block. Defaults to 0.
+
+    Returns:
+        np.ndarray: The k largest singular values of the centred data, descending.
+        np.ndarray: The matching right singular vectors as rows, shape (k, d).
+        int: Iterations performed.
+    """
+    if max_iter < 1:
+        raise ValueError(f"max_iter must be at least 1, got {max_iter}")
+    n, d = X.shape
+    if mean is None:
+        mean = X.mean(axis=0, dtype=np.float64)
+    block = min(k + oversample, n, d)
+    V, _ = np.linalg.qr(np.random.default_rng(seed).standard_normal((d, block)))
+    previous = None
+    for iteration in range(1, max_iter + 1):
+        R = _centered_matmat(X, mean, V)
+        # Rayleigh-Ritz on the block: the Gram matrix of R is V^T Xc^T Xc V
+        ritz, W = np.linalg.eigh(R.T @ R)
+        ritz, W = ritz[::-1], W[:, ::-1]
+        if previous is not None and np.all(np.abs(ritz[:k] - previous) <= tol * ritz[0]):
+            break
+        previous = ritz[:k]
+        if iteration == max_iter:
+            # out of iterations: W belongs to this V, so V must not move on
+            break
+        V, _ = np.linalg.qr(_centered_rmatmat(X, mean, R))
+    components = (V @ W[:, :k]).T
+    return np.sqrt(np.maximum(ritz[:k], 0.0)), components, iteration
+
+#__main__#
+
+if __name__ == "__main__":
+    from pca_engine import PCA
+
+    # Low-rank signal with a decaying spectrum plus noise; the second shape is the profiling notebook's
+    rng = np.random.default_rng(0)
+    k = 10
+    for n, d, full in ((2000, 256, 'parallel_jacobi'), (2000, 500, 'eigh'), (5000, 4000, 'eigh')):
+        signal = rng.standard_normal((n, 30)) * 0.85 ** np.arange(30)
+        X = signal @ rng.standard_normal((30, d)) + 0.3 * rng.standard_normal((n, d)) + 1.0
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        reference = PCA(backend=full).fit(X)
+        t_full = time.perf_counter() - start
+        peak_full = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        top = reference.explained_variance_[:k]
+        print(f"{n}x{d} full {full}: {t_full * 1e3:.1f} ms, peak {peak_full / 2**20:.1f} MiB")
+
+        runs = [(f"randomized q={q}", lambda q=q: randomized_svd(X, k, power_iter=q)) for q in (0, 1, 2, 4)]
+        runs += [(f"subspace tol={tol:g}", lambda tol=tol: subspace_svd(X, k, tol=tol)) for tol in (1e-4, 1e-8)]
+        for name, solve in runs:
+            tracemalloc.start()
+            start = time.perf_counter()
+            singular_values, components = solve()[:2]
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            variance = singular_values ** 2 / (n - 1)
+            error = np.max(np.abs(variance - top) / top)
+            # largest principal angle between the subspaces
+            angle = np.arccos(np.clip(np.linalg.svd(components @ reference.components_[:k].T, compute_uv=False).min(), -1, 1))
+            print(f"{'':>11}{name:>22}: {elapsed * 1e3:8.1f} ms ({t_full / elapsed:6.1f}x), peak {peak / 2**20:6.1f} MiB, "
+                  f"rel. eigenvalue error {error:.1e}, subspace angle {angle:.1e}")
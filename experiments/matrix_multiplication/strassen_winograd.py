@@ -0,0 +1,178 @@
+# The below code implements the Strassen-Winograd matrix multiplication used to evaluate the 7-multiply scheme
+# Importable counterpart of the strassen function in "Strassen's Algorithm.ipynb"
+
+import time
+
+import numpy as np
+
+class StrassenWinograd:
+    """
+    Strassen-Winograd multiplication (7 multiplications, 15 additions per level) computing C = A @ B.
+
+    Every recursion level owns one preallocated workspace holding a block of A, a block of B
+    and one product block; the seven products are written straight into the quadrants of C
+    following the schedule of Douglas et al., so nothing is allocated while recursing.
+    Odd dimensions are handled by dynamic peeling: the even part is multiplied recursively
+    and the last row, column or rank-one term is fixed up with BLAS. Blocks whose smallest
+    dimension is at most the cutoff are multiplied by BLAS directly.
+
+    Attributes:
+        cutoff (int): Largest dimension handed straight to BLAS.
+        workspaces (dict): Workspace buffers keyed by (level, dimensions, dtype), reused across calls.
+
+    Methods:
+        multiply(A, B, out=None): Computes A @ B into out.
+        autotune(max_size=2048, dtype=np.float64, repeats=3): Picks the cutoff on this machine.
+    """
+    def __init__(self, cutoff=256):
+        self.cutoff = cutoff
+        self.workspaces = {}
+
+    def _workspace(self, level, hm, hk, hn, dtype):
+        key = (level, hm, hk, hn, dtype)
+        if key not in self.workspaces:
+            buffer = np.empty(hm * hk + hk * hn + hm * hn, dtype=dtype)
+            X = buffer[:hm * hk].reshape(hm, hk)
+            Y = buffer[hm * hk:hm * hk + hk * hn].reshape(hk, hn)
+            Z = buffer[hm * hk + hk * hn:].reshape(hm, hn)
+            self.workspaces[key] = (X, Y, Z)
+        return self.workspaces[key]
+
+    def _multiply(self, A, B, C, level):
+        m, k = A.shape
+        n = B.shape[1]
+        if min(m, k, n) <= self.cutoff:
+            np.matmul(A, B, out=C)
+            return
+
+        # peel the odd row/column/depth off, the remaining blocks halve evenly
+        em, ek, en = m & ~1, k & ~1, n & ~1
+        hm, hk, hn = em // 2, ek // 2, en // 2
+        X, Y, Z = self._workspace(level, hm, hk, hn, C.dtype)
+
+        A11, A12, A21, A22 = A[:hm, :hk], A[:hm, hk:ek], A[hm:em, :hk], A[hm:em, hk:ek]
+        B11, B12, B21, B22 = B[:hk, :hn], B[:hk, hn:en], B[hk:ek, :hn], B[hk:ek, hn:en]
+        C11, C12, C21, C22 = C[:hm, :hn], C[:hm, hn:en], C[hm:em, :hn], C[hm:em, hn:en]
+
+        np.subtract(A11, A21, out=X)                # S3
+        np.subtract(B22, B12, out=Y)                # T3
+        self._multiply(X, Y, C21, level + 1)        # P7
+        np.add(A21, A22, out=X)                     # S1
+        np.subtract(B12, B11, out=Y)                # T1
+        self._multiply(X, Y, C22, level + 1)        # P5
+        np.subtract(X, A11, out=X)                  # S2
+        np.subtract(B22, Y, out=Y)                  # T2
+        self._multiply(X, Y, C12, level + 1)        # P6
+        np.subtract(A12, X, out=X)                  # S4
+        self._multiply(X, B22, C11, level + 1)      # P3
+        self._multiply(A11, B11, Z, level + 1)      # P1
+        np.add(Z, C12, out=C12)                     # U2 = P1 + P6
+        np.add(C12, C21, out=C21)                   # U3 = U2 + P7
+        np.add(C12, C22, out=C12)                   # U4 = U2 + P5
+        np.add(C21, C22, out=C22)                   # U7 = U3 + P5
+        np.add(C12, C11, out=C12)                   # U5 = U4 + P3
+        np.subtract(Y, B21, out=Y)                  # T4
+        self._multiply(A22, Y, C11, level + 1)      # P4
+        np.subtract(C21, C11, out=C21)              # U6 = U3 - P4
+        self._multiply(A12, B21, C11, level + 1)    # P2
+        np.add(C11, Z, out=C11)                     # U1 = P1 + P2
+
+        if ek < k:
+            # rank-one term of the peeled depth, added quadrant by quadrant through Z
+            for C_q, rows, cols in ((C11, slice(0, hm), slice(0, hn)), (C12, slice(0, hm), slice(hn, en)),
+                                    (C21, slice(hm, em), slice(0, hn)), (C22, slice(hm, em), slice(hn, en))):
+                np.matmul(A[rows, ek:], B[ek:, cols], out=Z)
+                np.add(C_q, Z, out=C_q)
+        if en < n:
+            np.matmul(A[:em], B[:, en:], out=C[:em, en:])
+        if em < m:
+            np.matmul(A[em:], B, out=C[em:])
+
+    def multiply(self, A, B, out=None):
+        """
+        Computes A @ B with Strassen-Winograd recursion.
+
+        Parameters:
+            A (np.ndarray): Left operand, shape (M, K).
+            B (np.ndarray): Right operand, shape (K, N).
+            out (np.ndarray, optional): Preallocated (M, N) output. Allocated when omitted.
+
+        Returns:
+            np.ndarray: The product, written into out.
+        """
+        A = np.asarray(A)
+        B = np.asarray(B)
+        if A.ndim != 2 or B.ndim != 2 or A.shape[1] != B.shape[0]:
+            raise ValueError(f"Cannot multiply shapes {A.shape} and {B.shape}")
+        dtype = np.result_type(A, B)
+        if out is None:
+            out = np.empty((A.shape[0], B.shape[1]), dtype=dtype)
+        elif out.shape != (A.shape[0], B.shape[1]):
+            raise ValueError(f"Output shape {out.shape} does not match ({A.shape[0]}, {B.shape[1]})")
+        self._multiply(A.astype(dtype, copy=False), B.astype(dtype, copy=False), out, 0)
+        return out
+
+    def autotune(self, max_size=2048, dtype=np.float64, repeats=3):
+        """
+        Picks the cutoff at which a Strassen-Winograd level stops paying off against BLAS.
+
+        For sizes 128, 256, ... up to max_size, a single recursion level (halves done by BLAS)
+        is timed against one BLAS call. The cutoff becomes half of the first size where the
+        recursion level wins, or max_size when BLAS wins throughout.
+
+        Parameters:
+            max_size (int, optional): Largest size tried. Defaults to 2048.
+            dtype (np.dtype, optional): Element type of the timed matrices. Defaults to np.float64.
+            repeats (int, optional): Timings per measurement, the best one is kept. Defaults to 3.
+
+        Returns:
+            int: The selected cutoff, also stored in self.cutoff.
+        """
+        size = 128
+        cutoff = max_size
+        while size <= max_size:
+            A = np.random.rand(size, size).astype(dtype)
+            B = np.random.rand(size, size).astype(dtype)
+            out = np.empty((size, size), dtype=dtype)
+            t_blas = _best_time(lambda: np.matmul(A, B, out=out), repeats)
+            self.cutoff = size // 2
+            t_strassen = _best_time(lambda: self.multiply(A, B, out=out), repeats)
+            if t_strassen < t_blas:
+                cutoff = size // 2
+                break
+            size *= 2
+        self.cutoff = cutoff
+        self.workspaces.clear()
+        return cutoff
+
+def _best_time(function, repeats):
+    function()
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+#__main__#
+
+if __name__ == "__main__":
+    np.random.seed(0)
+    engine = StrassenWinograd()
+    print(f"Auto-tuned cutoff: {engine.autotune()}")
+
+    # Forced recursion on a small odd-sized case, checked against BLAS
+    A = np.random.rand(37, 29)
+    B = np.random.rand(29, 41)
+    assert np.allclose(StrassenWinograd(cutoff=2).multiply(A, B), A @ B), "Strassen-Winograd is incorrect!"
+
+    print(f"{'size':>6} {'np.dot (s)':>11} {'strassen (s)':>13} {'speedup':>8} {'rel. error':>11}")
+    for size in (256, 512, 1000, 1024, 1537, 2048, 4096):
+        A = np.random.rand(size, size)
+        B = np.random.rand(size, size)
+        out = np.empty((size, size))
+        t_dot = _best_time(lambda: np.dot(A, B), 2)
+        t_strassen = _best_time(lambda: engine.multiply(A, B, out=out), 2)
+        reference = np.dot(A, B)
+        error = np.linalg.norm(out - reference) / np.linalg.norm(reference)
+        print(f"{size:>6} {t_dot:>11.4f} {t_strassen:>13.4f} {t_dot / t_strassen:>8.2f} {error:>11.2e}")
@@ -0,0 +1,206 @@
+'''
+This file contains an asyncio transport for the PC to FPGA link
+A reader task and a writer task share one port in full duplex; every request is tagged with the frame sequence number,
+so the next covariance block can be streamed out while the result of the current one is still coming back
+
+'''
+
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import serial
+
+import FramedProtocol
+import SerialInterfaceHandlers
+
+# the tracing hooks live with the simulations
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'experiments', 'Simulations'))
+import tracing
+
+class AsyncFPGATransport:
+    def __init__(self, port, baudrate, timeout=0.05, queue_size=8, max_in_flight=16):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.queue_size = queue_size
+        # sequence numbers are 8 bits wide, at most 256 requests can be told apart
+        self.max_in_flight = min(max_in_flight, 256)
+
+        self.ser = None
+        self.outgoing = None
+        self.pending = {}
+        self.decoder = FramedProtocol.FrameDecoder()
+        self.seq = 0
+        self.tasks = []
+        # set by close() or when the reader or writer dies; no request is accepted after that
+        self.closed = False
+
+    async def start(self):
+        self.ser = serial.serial_for_url(self.port, baudrate=self.baudrate, timeout=self.timeout)
+        self.outgoing = asyncio.Queue(maxsize=self.queue_size)
+        self.window = asyncio.Semaphore(self.max_in_flight)
+        self.tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._reader())]
+        for task in self.tasks:
+            task.add_done_callback(self._task_done)
+        return self
+
+    async def close(self):
+        # a dead writer has already dropped the queue, there is nothing left to flush
+        if not self.closed:
+            await self.outgoing.join()
+        self.closed = True
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self._fail_pending(ConnectionError("Transport closed"))
+        self.ser.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def submit(self, payload, frame_type=FramedProtocol.FRAME_MATRIX):
+        '''
+        Queues a request and returns a future for its response (frame_type, payload)
+        Waits while the outgoing queue is full or all sequence numbers are in flight
+        Raises ConnectionError once the transport is closed or its reader or writer has died
+        '''
+        if self.closed:
+            raise ConnectionError("Transport closed")
+        await self.window.acquire()
+        if self.closed:
+            self.window.release()
+            raise ConnectionError("Transport closed")
+        seq = self.seq
+        self.seq = (self.seq + 1) & 0xFF
+        try:
+            frame = FramedProtocol.encode_frame(payload, frame_type, seq)
+        except BaseException:
+            self.window.release()
+            raise
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self.window.release())
+        self.pending[seq] = future
+        try:
+            await self.outgoing.put(frame)
+        except BaseException:
+            # cancelled while the queue was full: the frame was never sent, so give the slot back
+            self.pending.pop(seq, None)
+            future.cancel()
+            raise
+        return future
+
+    async def request(self, payload, frame_type=FramedProtocol.FRAME_MATRIX):
+        # requests overlap on the event loop thread, so each round trip is an async span
+        with tracing.async_span('serial.request'):
+            return await (await self.submit(payload, frame_type))
+
+    async def request_matrix(self, matrix):
+        frame_type, payload = await self.request(FramedProtocol.pack_matrix(matrix))
+        return FramedProtocol.unpack_matrix(payload)
+
+    def _write_parts(self, parts):
+        with tracing.span('serial.transmit') as span:
+            written = 0
+            for part in parts:
+                written += self.ser.write(part) or 0
+            span.set(bytes=written)
+        tracing.count('serial.bytes_sent', written)
+
+    def _read(self):
+        # blocks for at most self.timeout, so a cancelled reader does not linger; only reads that
+        # return bytes are traced, their span includes the wait for the board
+        start = tracing.now()
+        data = self.ser.read(max(1, self.ser.in_waiting))
+        if data:
+            tracing.complete('serial.receive', start, bytes=len(data))
+            tracing.count('serial.bytes_received', len(data))
+        return data
+
+    def _task_done(self, task):
+        # the reader or writer ended outside close(): no pending request will be answered
+        if self.closed:
+            return
+        self.closed = True
+        error = None if task.cancelled() else task.exception()
+        for other in self.tasks:
+            other.cancel()
+        # nothing will write the queued frames, empty the queue so close() and put() do not block on it
+        while not self.outgoing.empty():
+            self.outgoing.get_nowait()
+            self.outgoing.task_done()
+        self._fail_pending(ConnectionError(f"Transport {'stopped' if error is None else 'failed'}: {error!r}"))
+
+    def _fail_pending(self, error):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+    async def _writer(self):
+        while True:
+            parts = await self.outgoing.get()
+            try:
+                await asyncio.to_thread(self._write_parts, parts)
+            finally:
+                self.outgoing.task_done()
+
+    async def _reader(self):
+        while True:
+            data = await asyncio.to_thread(self._read)
+            for frame_type, seq, payload in self.decoder.feed(data):
+                future = self.pending.pop(seq, None)
+                if future is None or future.done():
+                    continue
+                if frame_type == FramedProtocol.FRAME_ERROR:
+                    future.set_exception(FramedProtocol.FrameError(f"Device error: {bytes(payload).decode(errors='replace')}"))
+                else:
+                    future.set_result((frame_type, payload))
+
+
+def benchmark(n_jobs=32, matrix_size=16, baudrate=115200):
+    '''
+    Compares the synchronous send/sleep/read cycle, a synchronous framed cycle and the pipelined transport
+    against the software FPGA emulator, and returns the jobs per second of each
+    '''
+    import FPGAEmulator
+
+    emulator = FPGAEmulator.FPGAEmulator(baudrate)
+    port = emulator.open_pty()
+    matrices = [np.random.randint(0, 256, (matrix_size, matrix_size)).astype(np.uint8) for _ in range(n_jobs)]
+    results = {}
+
+    # the current cycle: transmit_to_FPGA sleeps 3 s after every write, measured on a single job
+    Ser = SerialInterfaceHandlers.SerialInterface(port, baudrate, 5)
+    start = time.perf_counter()
+    Ser.transmit_frame(FramedProtocol.pack_matrix(matrices[0]))
+    time.sleep(3)
+    Ser.receive_frame()
+    results['send/sleep/read'] = 1 / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for matrix in matrices:
+        Ser.transmit_matrix(matrix)
+        Ser.receive_frame()
+    results['synchronous framed'] = n_jobs / (time.perf_counter() - start)
+    Ser.close()
+
+    async def pipelined():
+        async with AsyncFPGATransport(port, baudrate) as transport:
+            start = time.perf_counter()
+            await asyncio.gather(*(transport.request_matrix(matrix) for matrix in matrices))
+            return n_jobs / (time.perf_counter() - start)
+
+    results['pipelined'] = asyncio.run(pipelined())
+    emulator.close()
+    return results
+
+if __name__ == "__main__":
+    results = benchmark()
+    for name, jobs_per_second in results.items():
+        print(f"{name:>20}: {jobs_per_second:8.2f} jobs/s")
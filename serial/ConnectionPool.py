@@ -0,0 +1,251 @@
+'''
+This file contains a pool of long-lived connections to several FPGA boards
+Every board keeps one open asyncio transport; idle boards are health-checked with a ping frame, boards that fail are
+reconnected with exponential backoff, and requests go to the least-loaded healthy board
+'''
+
+import asyncio
+import time
+
+import serial
+
+import AsyncTransport
+import FramedProtocol
+
+class DeviceConnection:
+    '''
+    State of one board in the pool
+    load counts the requests in flight, latency is a moving average of the ping round trip and
+    retry_at is when a board that is down gets its next reconnect attempt
+    '''
+    def __init__(self, port):
+        self.port = port
+        self.transport = None
+        self.healthy = False
+        self.load = 0
+        self.requests = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_seen = 0.0
+        self.latency = None
+        self.error = None
+
+    def status(self):
+        return {'port': self.port, 'healthy': self.healthy, 'load': self.load, 'requests': self.requests,
+                'failures': self.failures, 'latency': self.latency,
+                'retry_in': max(self.retry_at - time.perf_counter(), 0.0) if not self.healthy else 0.0,
+                'error': self.error}
+
+class ConnectionPool:
+    '''
+    Long-lived connections to several boards behind one request() call
+
+    Ports are opened once, in start(), and kept open; any pyserial URL works, so loop:// and the
+    pty of an FPGAEmulator stand in for boards. A board is healthy once it has answered a ping.
+    Every ping_interval the boards that carried no traffic in that time and have no request in flight
+    are pinged (a busy board is watched by request_timeout instead); a board that misses a ping or a
+    request is closed and reopened after backoff * backoff_factor^(failures - 1)
+    seconds, capped at max_backoff, and only taken back into service after it answers a ping again.
+
+    request() sends to the healthy board with the fewest requests in flight (ties go to the lower
+    ping latency) and retries a failed request on up to `retries` other boards. It raises
+    ConnectionError when no board is healthy, so the pool can be the transport of a JobScheduler,
+    which then falls back to the CPU.
+    '''
+    def __init__(self, ports, baudrate=115200, ping_interval=1.0, ping_timeout=0.5, request_timeout=10.0,
+                 backoff=0.1, backoff_factor=2.0, max_backoff=10.0, retries=1):
+        self.devices = [DeviceConnection(port) for port in ports]
+        self.baudrate = baudrate
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.request_timeout = request_timeout
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retries = retries
+        self.monitor = None
+        self.nonce = 0
+
+    async def start(self):
+        await asyncio.gather(*(self._connect(device) for device in self.devices))
+        self.monitor = asyncio.create_task(self._health_loop())
+        return self
+
+    async def close(self):
+        if self.monitor is not None:
+            self.monitor.cancel()
+            await asyncio.gather(self.monitor, return_exceptions=True)
+        for device in self.devices:
+            transport, device.transport, device.healthy = device.transport, None, False
+            if transport is not None:
+                await self._drop(transport)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def healthy(self):
+        return [device for device in self.devices if device.healthy]
+
+    def status(self):
+        return [device.status() for device in self.devices]
+
+    async def _drop(self, transport):
+        # a dead port can leave the writer stuck, so close gets a deadline before the tasks are cancelled
+        try:
+            await asyncio.wait_for(transport.close(), 1.0)
+        except Exception:
+            for task in transport.tasks:
+                task.cancel()
+            for future in transport.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Transport dropped"))
+            try:
+                transport.ser.close()
+            except Exception:
+                pass
+
+    async def _mark_down(self, device, transport, error):
+        # several requests can fail on the same transport, only the first one counts
+        if device.transport is not transport:
+            return
+        device.transport = None
+        device.healthy = False
+        device.failures += 1
+        device.error = repr(error)
+        delay = min(self.backoff * self.backoff_factor ** (device.failures - 1), self.max_backoff)
+        device.retry_at = time.perf_counter() + delay
+        if transport is not None:
+            await self._drop(transport)
+
+    async def _connect(self, device):
+        transport = AsyncTransport.AsyncFPGATransport(device.port, self.baudrate)
+        try:
+            await transport.start()
+        except (serial.SerialException, OSError, ValueError) as e:
+            device.transport = None
+            await self._mark_down(device, None, e)
+            return
+        device.transport = transport
+        await self._ping(device)
+
+    async def _ping(self, device):
+        transport = device.transport
+        self.nonce = (self.nonce + 1) & 0xFFFFFFFF
+        nonce = self.nonce.to_bytes(4, 'little')
+        start = time.perf_counter()
+        try:
+            frame_type, payload = await asyncio.wait_for(transport.request(nonce, FramedProtocol.FRAME_PING),
+                                                         self.ping_timeout)
+            if frame_type != FramedProtocol.FRAME_PING or payload != nonce:
+                raise FramedProtocol.FrameError("Bad ping response")
+        except asyncio.TimeoutError as e:
+            # a ping queued behind a long job is late, not lost; the job's own timeout covers the board
+            if device.load == 0:
+                await self._mark_down(device, transport, e)
+            return False
+        except (ConnectionError, OSError, serial.SerialException, FramedProtocol.FrameError) as e:
+            await self._mark_down(device, transport, e)
+            return False
+        now = time.perf_counter()
+        rtt = now - start
+        device.latency = rtt if device.latency is None else 0.8 * device.latency + 0.2 * rtt
+        device.last_seen = now
+        device.healthy = True
+        device.failures = 0
+        device.error = None
+        return True
+
+    async def _check(self, device):
+        now = time.perf_counter()
+        if device.transport is None:
+            if now >= device.retry_at:
+                await self._connect(device)
+        elif not device.healthy or (device.load == 0 and now - device.last_seen >= self.ping_interval):
+            await self._ping(device)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(min(self.ping_interval, self.backoff))
+            await asyncio.gather(*(self._check(device) for device in self.devices))
+
+    async def request(self, payload, frame_type=FramedProtocol.FRAME_MATRIX):
+        '''
+        Sends a request to the least-loaded healthy board and returns its response (frame_type, payload)
+        '''
+        tried = []
+        for _ in range(self.retries + 1):
+            candidates = [device for device in self.healthy if device not in tried]
+            if not candidates:
+                break
+            device = min(candidates, key=lambda device: (device.load, device.latency or 0.0))
+            tried.append(device)
+            transport = device.transport
+            device.load += 1
+            try:
+                response = await asyncio.wait_for(transport.request(payload, frame_type), self.request_timeout)
+            except (asyncio.TimeoutError, ConnectionError, OSError, serial.SerialException) as e:
+                await self._mark_down(device, transport, e)
+                continue
+            finally:
+                device.load -= 1
+            device.requests += 1
+            device.last_seen = time.perf_counter()
+            return response
+        raise ConnectionError(f"No healthy device among {len(self.devices)} (tried {len(tried)})")
+
+    async def request_matrix(self, matrix):
+        frame_type, payload = await self.request(FramedProtocol.pack_matrix(matrix))
+        return FramedProtocol.unpack_matrix(payload)
+
+#__main__#
+
+if __name__ == "__main__":
+    import numpy as np
+
+    import FPGAEmulator
+
+    baudrate = 921600
+    rng = np.random.default_rng(0)
+    matrices = [rng.random((32, 6)).astype(np.float32) for _ in range(48)]
+
+    def show(pool, title):
+        print(title)
+        for status in pool.status():
+            latency = f"{status['latency'] * 1e3:.2f} ms" if status['latency'] is not None else '-'
+            print(f"    {status['port']:>22}: {'up' if status['healthy'] else 'down':>4}, {status['requests']:>3} requests, "
+                  f"ping {latency:>8}, failures {status['failures']}, retry in {status['retry_in']:.2f} s")
+
+    async def main():
+        # loop:// answers pings by echoing them, a missing port backs off further after every attempt
+        async with ConnectionPool(['loop://', '/dev/no-such-board'], baudrate, ping_interval=0.1) as pool:
+            start = time.perf_counter()
+            for _ in range(100):
+                await pool.request(b'ping', FramedProtocol.FRAME_PING)
+            print(f"Request over a pooled loop:// connection: {(time.perf_counter() - start) * 10:.2f} ms")
+            await asyncio.sleep(1.5)
+            show(pool, "After 1.5 s:")
+
+        boards = [FPGAEmulator.FPGAEmulator(baudrate) for _ in range(3)]
+        ports = [board.open_pty() for board in boards]
+        async with ConnectionPool(ports, baudrate, ping_interval=0.2, ping_timeout=0.2, request_timeout=1.0) as pool:
+            await asyncio.gather(*(pool.request_matrix(X) for X in matrices))
+            show(pool, f"\n{len(matrices)} matrix jobs on three emulated boards, least-loaded routing:")
+
+            # board 1 hangs: its requests fail over to the others, it is reconnected with backoff and
+            # comes back once it answers pings again
+            boards[1].responsive = False
+            await asyncio.gather(*(pool.request_matrix(X) for X in matrices))
+            await asyncio.sleep(1.0)
+            show(pool, "\nBoard 1 hung, same jobs again:")
+            boards[1].responsive = True
+            await asyncio.sleep(1.0)
+            show(pool, "\nBoard 1 answering again:")
+
+        for board in boards:
+            board.close()
+
+    asyncio.run(main())
@@ -0,0 +1,271 @@
+'''
+This file contains a software stand-in for the Basys3 board, so the host side can be exercised without hardware
+The emulator sits on the master side of a pseudo-terminal; the host opens the slave device like it opens COM11
+It decodes the framed byte stream that uart_rx.v delivers, runs the covariance + Jacobi pipeline and sends
+the result back through a uart_tx.v-like stage, delayed by the wire time and a cycle-count estimate of the compute
+
+Result frames carry a (n + 1) x n matrix: the eigenvalues in the first row, the eigenvectors (as columns) below
+Note that loop:// cannot host a device, PySerial's loopback returns the host's own bytes
+'''
+
+import math
+import os
+import select
+import sys
+import threading
+import time
+
+import numpy as np
+
+import FramedProtocol
+
+# the numerical engines live with the simulations
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'experiments', 'Simulations'))
+import fixed_point_model
+import jacobi_engines
+import systolic_perf_model
+import tracing
+
+class CycleModel:
+    '''
+    Cycle estimate of the datapath in src/top.sv, scaled to n x n matrices on an S x S array
+    Constants are taken from the RTL: matrix_multiply raises done after 16 cycles, the Xilinx
+    arctan and sin/cos IPs have 12 cycles of latency each and the BRAMs 2 cycles
+    '''
+    def __init__(self, clock_hz=100e6, array_size=4, tpu_cycles=16, cordic_cycles=12, bram_cycles=2):
+        self.clock_hz = clock_hz
+        self.array_size = array_size
+        self.tpu_cycles = tpu_cycles
+        self.cordic_cycles = cordic_cycles
+        self.bram_cycles = bram_cycles
+
+    def tiles(self, n):
+        return math.ceil(n / self.array_size)
+
+    def covariance_cycles(self, samples, features):
+        # every output tile streams all samples through the array, then fills and drains it,
+        # and controller_TPUtoCovBRAM writes one 32-bit row per cycle; the schedule of
+        # rtl/covariance_unit, without double buffering and over all tiles of C
+        cycles = systolic_perf_model.estimate('output_stationary', samples, features, self.array_size,
+                                              double_buffered=False, symmetric=False)['cycles']
+        return int(cycles)
+
+    def rotation_cycles(self, n):
+        # data query engine, arctan, shift, sin/cos, Givens controller and BRAM, then the
+        # three TPU products R^T C, (R^T C) R and V R with their template engines
+        S = self.array_size
+        dqe = self.tiles(n) ** 2
+        cordic = 2 * self.cordic_cycles + 1
+        givens = 2 + self.bram_cycles
+        products = 3 * (self.tiles(n) ** 3 * self.tpu_cycles + S)
+        return dqe + cordic + givens + products
+
+    def seconds(self, cycles):
+        return cycles / self.clock_hz
+
+def float_pipeline(X, tol=1e-9):
+    '''
+    The covariance + Jacobi pipeline in floating point, as the emulator runs it
+    Returns the result matrix (eigenvalues on the first row, eigenvectors below) and the rotations spent
+    '''
+    if X.dtype == np.uint8:
+        X = fixed_point_model.to_float(X, fixed_point_model.Q3_5)
+    X = np.asarray(X, dtype=np.float64)
+    centered = X - X.mean(axis=0)
+    covariance = centered.T @ centered / max(X.shape[0] - 1, 1)
+    eigenvalues, V, info = jacobi_engines.parallel_jacobi(covariance, tol=tol)
+    n = covariance.shape[0]
+    rotations = info['sweeps'] * n * (n - 1) // 2
+    return np.vstack((eigenvalues, V)).astype(np.float32), rotations
+
+class FPGAEmulator:
+    def __init__(self, baudrate=115200, arithmetic='float', cycle_model=None, time_scale=1.0, tol=1e-9):
+        self.baudrate = baudrate
+        # cleared to emulate a hung board: frames are still read, but never answered
+        self.responsive = True
+        self.arithmetic = arithmetic
+        self.cycle_model = cycle_model or CycleModel()
+        # values below 1 make the emulated board faster than real time
+        self.time_scale = time_scale
+        self.tol = tol
+
+        self.master_fd = None
+        self.slave_fd = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.decoder = FramedProtocol.FrameDecoder()
+        self.jobs = []
+        # requests answered with an error frame instead of a result
+        self.errors = []
+
+    def open_pty(self):
+        self.master_fd, self.slave_fd = os.openpty()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._serve, name='FPGAEmulator', daemon=True)
+        self.thread.start()
+        return os.ttyname(self.slave_fd)
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.slave_fd = None
+
+    def __enter__(self):
+        self.open_pty()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def process(self, payload):
+        '''
+        Runs the covariance + Jacobi pipeline on a matrix payload
+        Returns the result payload and the number of device cycles it takes
+        '''
+        X = FramedProtocol.unpack_matrix(payload)
+        self._check_result_size([X])
+        result, cycles = self._run(X)
+        return FramedProtocol.pack_matrix(result), cycles
+
+    def process_batch(self, payload):
+        '''
+        Runs the pipeline on every matrix of a batch payload, back to back
+        Returns the batch payload of the results and the total number of device cycles
+        '''
+        matrices = FramedProtocol.unpack_batch(payload)
+        self._check_result_size(matrices, FramedProtocol.BATCH_HEADER.size)
+        results, total = [], 0
+        for X in matrices:
+            result, cycles = self._run(X)
+            results.append(result)
+            total += cycles
+        return FramedProtocol.pack_batch(results), total
+
+    def _check_result_size(self, matrices, header=0):
+        # the result goes back in one frame, a job whose result does not fit is refused before it runs
+        itemsize = 1 if self.arithmetic == 'fixed' else 4
+        size = header + sum(FramedProtocol.result_payload_size(X.shape[1], itemsize) for X in matrices)
+        if size > FramedProtocol.MAX_PAYLOAD:
+            raise FramedProtocol.FrameError(f"Result of {size} bytes exceeds {FramedProtocol.MAX_PAYLOAD} bytes")
+
+    def _run(self, X):
+        samples, features = X.shape
+        with tracing.span('board.compute', samples=samples, features=features):
+            if self.arithmetic == 'fixed':
+                result, rotations = self._process_fixed(X)
+            else:
+                result, rotations = self._process_float(X)
+        model = self.cycle_model
+        cycles = model.covariance_cycles(samples, features) + rotations * model.rotation_cycles(features)
+        # the modelled device time, next to the host time the emulation took
+        tracing.count('board.cycles', cycles)
+        return result, cycles
+
+    def _process_float(self, X):
+        return float_pipeline(X, self.tol)
+
+    def _process_fixed(self, X):
+        # the Q(3,5) datapath as wired: covariance TPU on X^T X, then one rotation per
+        # off-diagonal pair and sweep, two sweeps in total
+        fmt = fixed_point_model.Q3_5
+        if X.dtype != np.uint8:
+            X = fixed_point_model.to_bits(fixed_point_model.to_fixed(X, fmt), fmt)
+        C = fixed_point_model.fixed_matmul(X.T, X)
+        n = C.shape[0]
+        V = fixed_point_model.to_bits(np.eye(n, dtype=np.int64) << fmt.frac_bits, fmt)
+        rotations = n * (n - 1)
+        for _ in range(rotations):
+            C, V = fixed_point_model.jacobi_step(C, V)
+        return np.vstack((np.diagonal(C), V)).astype(np.uint8), rotations
+
+    def _serve(self):
+        os.set_blocking(self.master_fd, False)
+        # uart_rx, the compute pipeline and uart_tx each work on one frame at a time
+        rx_free = compute_free = tx_free = 0.0
+        outbox = []
+        # bytes of outbox[0] already written; the pty takes about 12 KB at a time, so a large frame goes out in parts
+        sent = 0
+        blocked = False
+        while not self.stop_event.is_set():
+            try:
+                data = os.read(self.master_fd, 65536)
+            except (BlockingIOError, OSError):
+                data = b''
+            now = time.perf_counter()
+            for frame_type, seq, payload in self.decoder.feed(data):
+                if not self.responsive:
+                    continue
+                # a request that cannot be processed is answered with an error frame, the board keeps serving
+                try:
+                    if frame_type == FramedProtocol.FRAME_PING:
+                        result, cycles = payload, 0
+                        result_type = FramedProtocol.FRAME_PING
+                    elif frame_type == FramedProtocol.FRAME_MATRIX:
+                        result, cycles = self.process(payload)
+                        result_type = FramedProtocol.FRAME_RESULT
+                    elif frame_type == FramedProtocol.FRAME_BATCH:
+                        result, cycles = self.process_batch(payload)
+                        result_type = FramedProtocol.FRAME_BATCH_RESULT
+                    else:
+                        raise FramedProtocol.FrameError(f"Unknown frame type {frame_type:#04x}")
+                    frame = b''.join(bytes(part) for part in FramedProtocol.encode_frame(result, result_type, seq))
+                except Exception as e:
+                    self.errors.append({'seq': seq, 'frame_type': frame_type, 'error': repr(e)})
+                    result, cycles = repr(e).encode()[:FramedProtocol.MAX_PAYLOAD], 0
+                    result_type = FramedProtocol.FRAME_ERROR
+                    frame = b''.join(bytes(part) for part in FramedProtocol.encode_frame(result, result_type, seq))
+                rx_time = FramedProtocol.wire_time(FramedProtocol.frame_size(len(payload)), self.baudrate)
+                tx_time = FramedProtocol.wire_time(len(frame), self.baudrate)
+                compute_time = self.cycle_model.seconds(cycles)
+
+                rx_free = max(now, rx_free) + rx_time * self.time_scale
+                compute_free = max(rx_free, compute_free) + compute_time * self.time_scale
+                tx_free = max(compute_free, tx_free) + tx_time * self.time_scale
+                outbox.append((tx_free, frame))
+                if result_type not in (FramedProtocol.FRAME_PING, FramedProtocol.FRAME_ERROR):
+                    self.jobs.append({'seq': seq, 'cycles': cycles, 'compute_time': compute_time,
+                                      'rx_time': rx_time, 'tx_time': tx_time})
+            blocked = False
+            while outbox and outbox[0][0] <= now:
+                try:
+                    sent += os.write(self.master_fd, memoryview(outbox[0][1])[sent:])
+                except BlockingIOError:
+                    blocked = True
+                    break
+                if sent < len(outbox[0][1]):
+                    blocked = True
+                    break
+                outbox.pop(0)
+                sent = 0
+            if not data:
+                # wait for the host to send, or for room in the pty while a frame is part-way out
+                select.select([self.master_fd], [self.master_fd] if blocked else [], [], 0.0005)
+
+#__main__#
+
+if __name__ == "__main__":
+    import SerialInterfaceHandlers
+
+    n_jobs = 16
+    samples, features = 64, 8
+    with FPGAEmulator() as emulator:
+        Ser = SerialInterfaceHandlers.SerialInterface(os.ttyname(emulator.slave_fd), emulator.baudrate, 5)
+
+        start = time.perf_counter()
+        for _ in range(n_jobs):
+            X = np.random.rand(samples, features).astype(np.float32)
+            Ser.transmit_matrix(X)
+            seq, result = Ser.receive_matrix()
+        wall_time = time.perf_counter() - start
+        Ser.close()
+
+        device_time = sum(job['rx_time'] + job['compute_time'] + job['tx_time'] for job in emulator.jobs)
+        compute_time = sum(job['compute_time'] for job in emulator.jobs)
+        print(f"{n_jobs} jobs of {samples}x{features}: wall {wall_time:.3f} s, device {device_time:.3f} s "
+              f"(compute {compute_time * 1e3:.3f} ms), host overhead {wall_time - device_time:.3f} s")
+        print("Eigenvalues of the last job:", result[0])
@@ -0,0 +1,224 @@
+'''
+This file contains the binary framing used between the PC and the FPGA
+Matrices are sent as packed fixed-point codes instead of text, and every frame is checked with a CRC
+
+Frame layout (all fields little-endian):
+    SYNC (2 bytes, A5 5A) | type (1 byte) | seq (1 byte) | length (2 bytes) | payload (length bytes) | CRC-16 (2 bytes)
+
+The CRC is CRC-16/CCITT (initial value FFFF) over type, seq, length and payload
+'''
+
+import binascii
+import os
+import struct
+import sys
+
+import numpy as np
+
+# the tracing hooks live with the simulations
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'experiments', 'Simulations'))
+import tracing
+
+SYNC = b'\xA5\x5A'
+HEADER = struct.Struct('<2sBBH')
+TRAILER = struct.Struct('<H')
+MAX_PAYLOAD = 0xFFFF
+
+# frame types
+FRAME_MATRIX = 0x01
+FRAME_RESULT = 0x02
+FRAME_BATCH = 0x03
+FRAME_BATCH_RESULT = 0x04
+# health check: the device echoes the frame, type, seq and payload unchanged
+FRAME_PING = 0x05
+# the device could not process a request; the payload is a UTF-8 message, the seq that of the request
+FRAME_ERROR = 0x06
+
+# matrix payloads start with rows, cols and an element type code
+MATRIX_HEADER = struct.Struct('<HHB')
+ELEMENT_TYPES = {
+    0: np.dtype('u1'),
+    1: np.dtype('i1'),
+    2: np.dtype('<u2'),
+    3: np.dtype('<i2'),
+    4: np.dtype('<u4'),
+    5: np.dtype('<i4'),
+    6: np.dtype('<f4'),
+}
+ELEMENT_CODES = {dtype: code for code, dtype in ELEMENT_TYPES.items()}
+
+# batch payloads start with the number of matrices, followed by one matrix payload after the other
+BATCH_HEADER = struct.Struct('<H')
+
+class FrameError(Exception):
+    pass
+
+def _payload_parts(payload):
+    parts = payload if isinstance(payload, (tuple, list)) else (payload,)
+    return [memoryview(part).cast('B') for part in parts]
+
+def frame_crc(header, payload):
+    # the SYNC bytes are not covered by the CRC
+    crc = binascii.crc_hqx(header[2:], 0xFFFF)
+    for part in _payload_parts(payload):
+        crc = binascii.crc_hqx(part, crc)
+    return crc
+
+@tracing.traced('serial.encode')
+def encode_frame(payload, frame_type=FRAME_MATRIX, seq=0):
+    '''
+    Returns the list of buffers making up a frame: header, payload part(s) and trailer
+    The payload may be one buffer or a tuple of buffers; none of them are copied,
+    so the parts can be written to the port one after the other
+    '''
+    parts = _payload_parts(payload)
+    length = sum(len(part) for part in parts)
+    if length > MAX_PAYLOAD:
+        raise FrameError(f"Payload of {length} bytes exceeds {MAX_PAYLOAD} bytes")
+    header = HEADER.pack(SYNC, frame_type, seq & 0xFF, length)
+    return [header] + parts + [TRAILER.pack(frame_crc(header, parts))]
+
+def decode_header(header):
+    sync, frame_type, seq, length = HEADER.unpack(header)
+    if sync != SYNC:
+        raise FrameError(f"Bad SYNC bytes {bytes(sync).hex()}")
+    return frame_type, seq, length
+
+def check_frame(header, payload, trailer):
+    (crc,) = TRAILER.unpack(trailer)
+    if crc != frame_crc(header, payload):
+        raise FrameError("CRC mismatch")
+
+class FrameDecoder:
+    '''
+    Incremental decoder for a byte stream that arrives in arbitrary pieces
+    Stray bytes and frames failing the CRC are dropped; every drop is counted in self.errors
+    '''
+    def __init__(self):
+        self.buffer = bytearray()
+        self.errors = 0
+
+    def feed(self, data):
+        # every complete frame was taken out by an earlier call, no new bytes mean no new frames
+        if not data:
+            return []
+        with tracing.span('serial.decode', bytes=len(data)):
+            frames = self._feed(data)
+        if frames:
+            tracing.count('serial.frames_received', len(frames))
+        return frames
+
+    def _feed(self, data):
+        self.buffer += data
+        frames = []
+        while True:
+            start = self.buffer.find(SYNC)
+            if start < 0:
+                # keep a trailing A5 that may be the first half of the next SYNC
+                if len(self.buffer) > 1:
+                    self.errors += 1
+                    del self.buffer[:-1]
+                return frames
+            if start:
+                self.errors += 1
+                del self.buffer[:start]
+            if len(self.buffer) < HEADER.size:
+                return frames
+            frame_type, seq, length = decode_header(bytes(self.buffer[:HEADER.size]))
+            end = HEADER.size + length + TRAILER.size
+            if len(self.buffer) < end:
+                return frames
+            header = bytes(self.buffer[:HEADER.size])
+            payload = bytes(self.buffer[HEADER.size:end - TRAILER.size])
+            try:
+                check_frame(header, payload, self.buffer[end - TRAILER.size:end])
+            except FrameError:
+                # skip this SYNC only, a real frame may start inside the corrupted one
+                self.errors += 1
+                tracing.count('serial.crc_errors')
+                del self.buffer[:2]
+                continue
+            del self.buffer[:end]
+            frames.append((frame_type, seq, payload))
+
+def pack_matrix(matrix):
+    '''
+    Packs a matrix of fixed-point codes (or float32 values) into a matrix payload
+    Returns (matrix header, element data); the data is the matrix itself when it is
+    already C-contiguous with a little-endian element type
+    '''
+    matrix = np.asarray(matrix)
+    if matrix.ndim != 2:
+        raise FrameError(f"Expected a 2D matrix, got shape {matrix.shape}")
+    dtype = matrix.dtype.newbyteorder('<') if matrix.dtype.itemsize > 1 else matrix.dtype
+    if dtype not in ELEMENT_CODES:
+        raise FrameError(f"Unsupported element type {matrix.dtype}")
+    rows, cols = matrix.shape
+    data = np.ascontiguousarray(matrix, dtype=dtype)
+    return MATRIX_HEADER.pack(rows, cols, ELEMENT_CODES[dtype]), data
+
+def unpack_matrix(payload):
+    '''
+    Unpacks a matrix payload; the returned array is a read-only view on the payload
+    '''
+    if len(payload) < MATRIX_HEADER.size:
+        raise FrameError(f"Matrix payload of {len(payload)} bytes is shorter than its header")
+    rows, cols, code = MATRIX_HEADER.unpack_from(payload)
+    if code not in ELEMENT_TYPES:
+        raise FrameError(f"Unknown element type code {code}")
+    dtype = ELEMENT_TYPES[code]
+    if len(payload) != MATRIX_HEADER.size + rows * cols * dtype.itemsize:
+        raise FrameError("Matrix payload length does not match its shape")
+    return np.frombuffer(payload, dtype=dtype, count=rows * cols, offset=MATRIX_HEADER.size).reshape(rows, cols)
+
+def matrix_payload_size(matrix):
+    return MATRIX_HEADER.size + np.asarray(matrix).nbytes
+
+def result_payload_size(features, itemsize=4):
+    # a result is (n + 1) x n: the eigenvalues on the first row, the eigenvectors below
+    return MATRIX_HEADER.size + (features + 1) * features * itemsize
+
+def pack_batch(matrices):
+    '''
+    Packs several matrices into one batch payload
+    Returns the list of buffers (count, then header and data of every matrix) for encode_frame;
+    as in pack_matrix, contiguous little-endian matrices are not copied
+    '''
+    if len(matrices) > 0xFFFF:
+        raise FrameError(f"A batch holds at most {0xFFFF} matrices, got {len(matrices)}")
+    parts = [BATCH_HEADER.pack(len(matrices))]
+    for matrix in matrices:
+        parts.extend(pack_matrix(matrix))
+    return parts
+
+def unpack_batch(payload):
+    '''
+    Unpacks a batch payload into a list of read-only matrix views on the payload
+    '''
+    if len(payload) < BATCH_HEADER.size:
+        raise FrameError(f"Batch payload of {len(payload)} bytes is shorter than its header")
+    (count,) = BATCH_HEADER.unpack_from(payload)
+    offset = BATCH_HEADER.size
+    matrices = []
+    for _ in range(count):
+        if len(payload) < offset + MATRIX_HEADER.size:
+            raise FrameError("Batch payload ends inside a matrix header")
+        rows, cols, code = MATRIX_HEADER.unpack_from(payload, offset)
+        if code not in ELEMENT_TYPES:
+            raise FrameError(f"Unknown element type code {code}")
+        dtype = ELEMENT_TYPES[code]
+        offset += MATRIX_HEADER.size
+        if len(payload) < offset + rows * cols * dtype.itemsize:
+            raise FrameError("Batch payload ends inside a matrix")
+        matrices.append(np.frombuffer(payload, dtype=dtype, count=rows * cols, offset=offset).reshape(rows, cols))
+        offset += rows * cols * dtype.itemsize
+    if offset != len(payload):
+        raise FrameError("Batch payload length does not match its matrices")
+    return matrices
+
+def frame_size(payload_length):
+    return HEADER.size + payload_length + TRAILER.size
+
+def wire_time(n_bytes, baudrate, bits_per_byte=10):
+    # 8N1 puts a start and a stop bit around every byte, as in uart_tx.v
+    return n_bytes * bits_per_byte / float(baudrate)
@@ -0,0 +1,329 @@
+'''
+This file contains a host-side job scheduler for the PC to FPGA link
+Callers submit PCA jobs (one data matrix each); small matrices are coalesced into batch frames of up to one BRAM,
+sent back to back over the asyncio transport, and jobs overflow to the CPU Jacobi backend when the device is saturated or absent
+'''
+
+import asyncio
+import collections
+import os
+import time
+
+import numpy as np
+
+import AsyncTransport
+import FPGAEmulator
+import FramedProtocol
+
+# one RAMB36 without its parity bits holds 32 Kbit
+BRAM_BYTES = 4096
+
+class Job:
+    def __init__(self, X, future, key=None):
+        self.X = X
+        self.future = future
+        self.key = key
+        self.size = FramedProtocol.matrix_payload_size(X)
+        # the device answers in float32, (n + 1) x n
+        self.result_size = FramedProtocol.result_payload_size(X.shape[1])
+        self.submitted = time.perf_counter()
+
+class JobScheduler:
+    '''
+    Coalesces PCA jobs into BRAM-sized batches for the device, with a CPU fallback
+
+    A batch is sent as soon as it is full, when the device has nothing in flight (so the first job
+    of a burst is not held back), or when its oldest job has waited max_wait seconds; while batches
+    are in flight the queue keeps filling the next one, so the device gets them back to back.
+    At most max_in_flight batches are outstanding and at most max_queue batches worth of jobs wait
+    for them; beyond that the device counts as saturated and new jobs run on the CPU instead, which
+    bounds the queueing delay of the device jobs. Without a transport every job runs on the CPU; after
+    max_errors failed batches in a row so do they, until retry_after seconds have passed and one batch
+    probes the device again. Each failed probe doubles that wait, up to max_retry_after.
+
+    Every job resolves to (eigenvalues, eigenvectors as columns), from the device or from
+    FPGAEmulator.float_pipeline, which runs the same covariance + parallel Jacobi on the host.
+    With a cache (eigen_cache.EigenCache), a job whose matrix was seen before resolves at once
+    and never reaches the queue, and one whose matrix is still being worked on waits for that job,
+    each caller through a future of its own, so cancelling one does not cancel the others
+    '''
+    def __init__(self, transport=None, batch_bytes=BRAM_BYTES, max_batch_jobs=None, max_wait=0.002, max_in_flight=2,
+                 max_queue=4, timeout=5.0, max_errors=3, retry_after=1.0, max_retry_after=60.0, cpu_workers=None,
+                 tol=1e-9, cache=None, history=10000):
+        self.transport = transport
+        self.cache = cache
+        # futures of the cacheable jobs still running, by key, so duplicates wait on the same job
+        self.running = {}
+        # the batch count header takes the first bytes of the payload
+        self.batch_bytes = batch_bytes - FramedProtocol.BATCH_HEADER.size
+        self.max_batch_jobs = max_batch_jobs or 0xFFFF
+        self.max_wait = max_wait
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_errors = max_errors
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self.tol = tol
+
+        self.pending = collections.deque()
+        self.pending_bytes = 0
+        self.in_flight = 0
+        self.errors = 0
+        # once the device is given up on, the next probe waits until retry_at, backoff seconds after the last one
+        self.backoff = retry_after
+        self.retry_at = 0.0
+        self.cpu_slots = asyncio.Semaphore(cpu_workers or os.cpu_count() or 1)
+        self.wakeup = asyncio.Event()
+        self.batcher = None
+        self.tasks = set()
+
+        self.latencies = collections.deque(maxlen=history)
+        self.fills = collections.deque(maxlen=history)
+        self.counts = collections.Counter()
+
+    async def start(self):
+        self.batcher = asyncio.create_task(self._batch_loop())
+        return self
+
+    async def close(self):
+        # drain what is queued, then stop the batcher
+        while self.pending or self.tasks:
+            self.wakeup.set()
+            await asyncio.sleep(self.max_wait)
+        self.batcher.cancel()
+        await asyncio.gather(self.batcher, return_exceptions=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def device_available(self):
+        if self.transport is None:
+            return False
+        return self.errors < self.max_errors or time.perf_counter() >= self.retry_at
+
+    def submit(self, X):
+        '''
+        Queues a PCA job on the data matrix X (samples x features) and returns a future for
+        (eigenvalues, eigenvectors)
+        '''
+        X = np.asarray(X)
+        job = Job(X, asyncio.get_running_loop().create_future())
+        if self.cache is not None:
+            job.key = self.cache.key(X, 'pca', self.tol)
+            if job.key in self.running:
+                self.counts['cache'] += 1
+                return self._follow(self.running[job.key])
+            cached = self.cache.get(job.key)
+            if cached is not None:
+                self.counts['cache'] += 1
+                job.key = None
+                self._finish(job, cached[0])
+                return job.future
+            self.running[job.key] = job.future
+        if not self.device_available:
+            self._spawn(self._run_on_cpu([job], 'absent'))
+        elif max(job.size, job.result_size) > FramedProtocol.MAX_PAYLOAD - FramedProtocol.BATCH_HEADER.size:
+            self._spawn(self._run_on_cpu([job], 'oversize'))
+        elif self.pending and self.pending_bytes + job.size > self.max_queue * self.batch_bytes:
+            self._spawn(self._run_on_cpu([job], 'saturated'))
+        else:
+            self.pending.append(job)
+            self.pending_bytes += job.size
+            self.wakeup.set()
+        return job.future if job.key is None else self._follow(job.future)
+
+    async def run(self, X):
+        return await self.submit(X)
+
+    def _follow(self, shared):
+        # a future of its own for every caller of a shared job, resolved along with it
+        future = asyncio.get_running_loop().create_future()
+
+        def resolve(shared):
+            if future.done():
+                return
+            if shared.cancelled():
+                future.cancel()
+            elif shared.exception() is not None:
+                future.set_exception(shared.exception())
+            else:
+                future.set_result(shared.result())
+
+        shared.add_done_callback(resolve)
+        return future
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _take_batch(self):
+        # a job larger than the batch size still goes, alone
+        batch = [self.pending.popleft()]
+        size, result_size = batch[0].size, batch[0].result_size
+        # the results come back in one frame as well
+        result_bytes = FramedProtocol.MAX_PAYLOAD - FramedProtocol.BATCH_HEADER.size
+        while (self.pending and len(batch) < self.max_batch_jobs and size + self.pending[0].size <= self.batch_bytes
+               and result_size + self.pending[0].result_size <= result_bytes):
+            job = self.pending.popleft()
+            batch.append(job)
+            size += job.size
+            result_size += job.result_size
+        self.pending_bytes -= size
+        self.fills.append(size / self.batch_bytes)
+        return batch
+
+    async def _batch_loop(self):
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            if not self.device_available:
+                # the device dropped out, hand the queue to the CPU
+                batch = list(self.pending)
+                self.pending.clear()
+                self.pending_bytes = 0
+                self._spawn(self._run_on_cpu(batch, 'absent'))
+                continue
+            waited = time.perf_counter() - self.pending[0].submitted
+            full = self.pending_bytes >= self.batch_bytes or len(self.pending) >= self.max_batch_jobs
+            if self.in_flight < self.max_in_flight and (full or self.in_flight == 0 or waited >= self.max_wait):
+                if self.errors >= self.max_errors:
+                    # this batch probes the device, the queue goes to the CPU until it answers
+                    self.retry_at = time.perf_counter() + self.backoff
+                self.in_flight += 1
+                self._spawn(self._run_on_device(self._take_batch()))
+                continue
+            # wait for more jobs, a finished batch or the deadline of the oldest job
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(self.max_wait - waited, 0.0) or None)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_on_device(self, batch):
+        try:
+            frame_type, payload = await asyncio.wait_for(
+                self.transport.request(FramedProtocol.pack_batch([job.X for job in batch]), FramedProtocol.FRAME_BATCH),
+                self.timeout)
+            if frame_type != FramedProtocol.FRAME_BATCH_RESULT:
+                raise FramedProtocol.FrameError(f"Unexpected frame type {frame_type:#04x}")
+            results = FramedProtocol.unpack_batch(payload)
+            if len(results) != len(batch):
+                raise FramedProtocol.FrameError(f"{len(results)} results for a batch of {len(batch)} jobs")
+        except Exception as e:
+            self.errors += 1
+            if self.errors >= self.max_errors:
+                self.retry_at = time.perf_counter() + self.backoff
+                self.backoff = min(2 * self.backoff, self.max_retry_after)
+            print(f"Batch of {len(batch)} jobs failed on the device, running it on the CPU: {e!r}")
+            await self._run_on_cpu(batch, 'error')
+            return
+        finally:
+            self.in_flight -= 1
+            self.wakeup.set()
+        self.errors = 0
+        self.backoff = self.retry_after
+        self.counts['device'] += len(batch)
+        self.counts['batches'] += 1
+        for job, result in zip(batch, results):
+            self._finish(job, result)
+
+    async def _run_on_cpu(self, batch, reason):
+        self.counts['cpu'] += len(batch)
+        self.counts[f'cpu_{reason}'] += len(batch)
+        async with self.cpu_slots:
+            for job in batch:
+                try:
+                    result, _ = await asyncio.to_thread(FPGAEmulator.float_pipeline, job.X, self.tol)
+                except Exception as e:
+                    self.running.pop(job.key, None)
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    continue
+                self._finish(job, result)
+
+    def _finish(self, job, result):
+        if self.cache is not None and job.key is not None:
+            (result,) = self.cache.put(job.key, (result,))
+            self.running.pop(job.key, None)
+            job.key = None
+        self.latencies.append(time.perf_counter() - job.submitted)
+        if not job.future.done():
+            job.future.set_result((result[0], result[1:]))
+
+    def metrics(self):
+        '''
+        Returns the queue depth, batches in flight, the mean fill ratio of the batches sent, the
+        job counts per route (device, CPU, cache) and per CPU fallback reason, and the 50th/95th/99th percentile of the job latency in seconds
+        '''
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            'queue_depth': len(self.pending),
+            'in_flight': self.in_flight,
+            'batch_fill': float(np.mean(self.fills)) if self.fills else 0.0,
+            'jobs_per_batch': self.counts['device'] / max(self.counts['batches'], 1),
+            'batches': self.counts['batches'],
+            'device_jobs': self.counts['device'],
+            'cache_hits': self.counts['cache'],
+            # CPU jobs in total and by reason: no device, saturated, too large for a frame, failed batch
+            'cpu_jobs': self.counts['cpu'],
+            **{reason: self.counts[f'cpu_{reason}'] for reason in ('absent', 'saturated', 'oversize', 'error')},
+            'latency_p50': p50,
+            'latency_p95': p95,
+            'latency_p99': p99,
+        }
+
+#__main__#
+
+if __name__ == "__main__":
+    import eigen_cache
+
+    # Bursts of small jobs against the emulated board at 921600 baud: one job per frame, BRAM-sized
+    # batches, batches with CPU overflow, no device at all, and a replay of 64 distinct matrices
+    # through the result cache
+    n_jobs, samples, features = 256, 24, 6
+    baudrate = 921600
+    rng = np.random.default_rng(0)
+    distinct = [rng.random((samples, features)).astype(np.float32) for _ in range(n_jobs)]
+
+    async def scenario(port, jobs, **options):
+        transport = AsyncTransport.AsyncFPGATransport(port, baudrate) if port else None
+        if transport:
+            await transport.start()
+        async with JobScheduler(transport, **options) as scheduler:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(scheduler.run(X) for X in jobs))
+            elapsed = time.perf_counter() - start
+            metrics = scheduler.metrics()
+        if transport:
+            await transport.close()
+        reference = np.linalg.eigvalsh(np.cov(jobs[-1], rowvar=False))
+        assert np.allclose(np.sort(results[-1][0]), reference, atol=1e-4)
+        return elapsed, metrics
+
+    scenarios = (
+        ('one job per frame', dict(max_batch_jobs=1, max_queue=n_jobs)),
+        ('BRAM batches', dict(max_queue=n_jobs)),
+        ('BRAM batches + CPU overflow', dict(max_queue=8)),
+        ('no device (CPU only)', None),
+        ('replay of 64 + cache', dict(max_queue=n_jobs, cache=eigen_cache.EigenCache())),
+    )
+    print(f"{n_jobs} jobs of {samples}x{features} float32, {baudrate} baud")
+    print(f"{'':>30} {'jobs/s':>8} {'fill':>6} {'jobs/batch':>11} {'device':>7} {'cpu':>5} {'cache':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, options in scenarios:
+        with FPGAEmulator.FPGAEmulator(baudrate) as emulator:
+            port = os.ttyname(emulator.slave_fd) if options is not None else None
+            jobs = [distinct[i] for i in rng.integers(0, 64, n_jobs)] if 'cache' in (options or {}) else distinct
+            elapsed, metrics = asyncio.run(scenario(port, jobs, **(options or {})))
+        print(f"{name:>30} {n_jobs / elapsed:>8.1f} {metrics['batch_fill']:>6.0%} {metrics['jobs_per_batch']:>11.1f} "
+              f"{metrics['device_jobs']:>7} {metrics['cpu_jobs']:>5} {metrics['cache_hits']:>6} {metrics['latency_p50'] * 1e3:>8.1f} "
+              f"{metrics['latency_p95'] * 1e3:>8.1f} {metrics['latency_p99'] * 1e3:>8.1f}")
@@ -1,6 +1,14 @@
+import os
 import serial
+import sys
 import time
 
+import FramedProtocol
+
+# the tracing hooks live with the simulations
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'experiments', 'Simulations'))
+import tracing
+
 class SerialInterface:
     def __init__(self, port, baudrate, timeout, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE):
         self.port = port
@@ -9,10 +17,12 @@ class SerialInterface:
         self.bytesize = bytesize
         self.parity = parity
         self.stopbits = stopbits
+        self.seq = 0
 
         try:
-            self.ser = serial.Serial(
-                port=self.port,
+            # serial_for_url also accepts URLs such as loop:// for testing without a board
+            self.ser = serial.serial_for_url(
+                self.port,
                 baudrate=self.baudrate,
                 timeout=self.timeout,
                 bytesize=self.bytesize,
@@ -25,10 +35,16 @@ class SerialInterface:
             self.ser = None
 
     def transmit_to_FPGA(self, data):
+        # text is encoded, buffers such as packed BRAM images are written as they are, without a copy
         if self.ser and self.ser.is_open:
             try:
-                self.ser.write(data.encode())
-                print(f"Sent: {data}")
+                if isinstance(data, str):
+                    self.ser.write(data.encode())
+                    print(f"Sent: {data}")
+                else:
+                    payload = memoryview(data).cast('B')
+                    self.ser.write(payload)
+                    print(f"Sent: {len(payload)} bytes")
                 time.sleep(3)
             except Exception as e:
                 print(f"Error sending data: {e}")
@@ -48,6 +64,66 @@ class SerialInterface:
             print("Serial port is not open or unavailable.")
         return None
 
+    # Binary framed mode: whole frames are written in bulk and read back with blocking exact-length reads
+
+    def _read_exact(self, n_bytes):
+        data = self.ser.read(n_bytes)
+        if len(data) != n_bytes:
+            raise FramedProtocol.FrameError(f"Timed out after {len(data)} of {n_bytes} bytes")
+        return data
+
+    def _read_header(self):
+        # scan for SYNC one byte at a time only when the stream is out of step
+        header = bytearray(self._read_exact(FramedProtocol.HEADER.size))
+        while header[:2] != FramedProtocol.SYNC:
+            del header[0]
+            header += self._read_exact(1)
+        return bytes(header)
+
+    def transmit_frame(self, payload, frame_type=FramedProtocol.FRAME_MATRIX, seq=None):
+        if self.ser and self.ser.is_open:
+            try:
+                if seq is None:
+                    seq = self.seq
+                    self.seq = (self.seq + 1) & 0xFF
+                parts = FramedProtocol.encode_frame(payload, frame_type, seq)
+                with tracing.span('serial.transmit', seq=seq):
+                    for part in parts:
+                        self.ser.write(part)
+                return seq
+            except Exception as e:
+                print(f"Error sending frame: {e}")
+        else:
+            print("Serial port is not open or unavailable.")
+        return None
+
+    def receive_frame(self):
+        if self.ser and self.ser.is_open:
+            try:
+                with tracing.span('serial.receive'):
+                    header = self._read_header()
+                    frame_type, seq, length = FramedProtocol.decode_header(header)
+                    payload = self._read_exact(length)
+                    trailer = self._read_exact(FramedProtocol.TRAILER.size)
+                with tracing.span('serial.decode', bytes=length):
+                    FramedProtocol.check_frame(header, payload, trailer)
+                return frame_type, seq, payload
+            except Exception as e:
+                print(f"Error receiving frame: {e}")
+        else:
+            print("Serial port is not open or unavailable.")
+        return None
+
+    def transmit_matrix(self, matrix, seq=None):
+        return self.transmit_frame(FramedProtocol.pack_matrix(matrix), FramedProtocol.FRAME_MATRIX, seq)
+
+    def receive_matrix(self):
+        frame = self.receive_frame()
+        if frame is None:
+            return None
+        frame_type, seq, payload = frame
+        return seq, FramedProtocol.unpack_matrix(payload)
+
     def close(self):
         if self.ser and self.ser.is_open:
             self.ser.close()
@@ -1,4 +1,8 @@
 import SerialInterfaceHandlers
+import FramedProtocol
+import numpy as np
+import threading
+import time
 
 # Self-test script with loopback
 if __name__ == "__main__":
@@ -21,5 +25,25 @@ if __name__ == "__main__":
     else:
         print("Loopback test failed.")
 
+    # Binary framed mode: send a 64x64 matrix of Q(3,5) codes and read it back
+    # The loopback buffer holds 4 KiB, so the frame is read back concurrently as on a full-duplex link
+    matrix = np.random.randint(0, 256, (64, 64)).astype(np.uint8)
+    result = {}
+    reader = threading.Thread(target=lambda: result.update(received=Ser.receive_matrix()))
+    start = time.perf_counter()
+    reader.start()
+    seq = Ser.transmit_matrix(matrix)
+    reader.join()
+    elapsed = time.perf_counter() - start
+    received = result['received']
+
+    if received is not None and received[0] == seq and np.array_equal(received[1], matrix):
+        header, data = FramedProtocol.pack_matrix(matrix)
+        frame_bytes = FramedProtocol.frame_size(len(header) + data.nbytes)
+        print(f"Framed loopback test successful! {frame_bytes} bytes in {elapsed * 1e3:.2f} ms "
+              f"(wire time at {baudrate} baud: {FramedProtocol.wire_time(frame_bytes, baudrate):.3f} s)")
+    else:
+        print("Framed loopback test failed.")
+
     # Close the port
     Ser.close()